@@ -17,6 +17,7 @@ logging.getLogger('amqpstorm').addHandler(NullHandler())
 from amqpstorm.channel import Channel  # noqa
 from amqpstorm.connection import Connection  # noqa
 from amqpstorm.uri_connection import UriConnection  # noqa
+from amqpstorm.recovery import RecoveringConnection  # noqa
 from amqpstorm.message import Message  # noqa
 from amqpstorm.exception import AMQPError  # noqa
 from amqpstorm.exception import AMQPChannelError  # noqa
@@ -0,0 +1,898 @@
+"""AMQP-Storm asyncio Connection and Channel.
+
+    Requires Python 3.5+. Import it using amqpstorm.aio.
+"""
+__author__ = 'eandersson'
+
+import time
+import asyncio
+import logging
+import threading
+
+from pamqp.header import ContentHeader
+from pamqp import specification as pamqp_spec
+
+from amqpstorm import compatibility
+from amqpstorm.io import EMPTY_BUFFER
+from amqpstorm.hosts import HOST_LATENCY
+from amqpstorm.hosts import parse_hosts
+from amqpstorm.tls import CONTEXT_CACHE
+from amqpstorm.base import Rpc
+from amqpstorm.base import Stateful
+from amqpstorm.basic import Basic
+from amqpstorm.channel import Channel
+from amqpstorm.message import Message
+from amqpstorm.connection import Connection
+from amqpstorm.exception import AMQPChannelError
+from amqpstorm.exception import AMQPConnectionError
+from amqpstorm.exception import AMQPInvalidArgument
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+
+LOGGER = logging.getLogger(__name__)
+CONFIRM_FRAMES = ['Basic.Ack', 'Basic.Nack']
+
+
+def running_loop():
+    """The event loop running the current coroutine.
+
+    :rtype: asyncio.AbstractEventLoop
+    """
+    if hasattr(asyncio, 'get_running_loop'):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
+
+
+class AsyncIO(asyncio.Protocol, Stateful):
+    """Asyncio based Socket Transport.
+
+        Drop-in replacement for IO, that lets the event loop deliver
+        incoming data instead of a dedicated inbound thread.
+    """
+
+    def __init__(self, parameters, on_read=None, on_error=None, loop=None):
+        Stateful.__init__(self)
+        self.lock = threading.Lock()
+        self.buffer = EMPTY_BUFFER
+        self.transport = None
+        self.parameters = parameters
+        self.on_read = on_read
+        self.on_error = on_error
+        self._loop = loop
+        self._write_paused = False
+        self._drain_waiters = []
+
+    @property
+    def socket(self):
+        """Returns the underlying socket, or None if not connected.
+
+        :return:
+        """
+        if not self.transport:
+            return None
+        return self.transport.get_extra_info('socket')
+
+    async def open(self, hostname, port):
+        """Open Socket and establish a connection.
+
+            Hosts are tried one at a time, starting with the host that
+            has the lowest measured connect latency.
+
+        :param str|list hostname: One or more hosts.
+        :param int port: Default port.
+        :return:
+        """
+        self.buffer = EMPTY_BUFFER
+        self.set_state(self.OPENING)
+        ssl_context = None
+        if self.parameters['ssl']:
+            if not ssl:
+                raise AMQPConnectionError('Python not compiled '
+                                          'with SSL support')
+            ssl_context = self._ssl_context()
+        if self._loop is None:
+            self._loop = running_loop()
+        loop = self._loop
+        errors = []
+        for host, host_port in HOST_LATENCY.sort(parse_hosts(hostname,
+                                                             port)):
+            start_time = loop.time()
+            connect = loop.create_connection(lambda: self, host, host_port,
+                                             ssl=ssl_context)
+            try:
+                await asyncio.wait_for(connect,
+                                       self.parameters['timeout'] or None)
+            except (OSError, asyncio.TimeoutError) as why:
+                HOST_LATENCY.record_failure(host, host_port)
+                errors.append('{0!s}:{1!s}: {2!s}'.format(host, host_port,
+                                                          why))
+                continue
+            HOST_LATENCY.record(host, host_port, loop.time() - start_time)
+            break
+        else:
+            raise AMQPConnectionError('could not connect to any host: ' +
+                                      '; '.join(errors))
+        self.set_state(self.OPEN)
+
+    def close(self):
+        """Close Socket.
+
+        :return:
+        """
+        self.set_state(self.CLOSING)
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        self.set_state(self.CLOSED)
+
+    def write_to_socket(self, frame_data, blocking=True):
+        """Write data to the socket.
+
+            Writes are buffered by the transport, use drain to wait for
+            the buffer to be flushed.
+
+        :param bytes|list frame_data:
+        :param bool blocking: Unused, as writes are buffered by the
+                              transport.
+        :return:
+        """
+        if not self.transport:
+            self.on_error('connection/socket error')
+            return 0
+        if isinstance(frame_data, list):
+            self.transport.writelines(frame_data)
+            return sum(len(buf) for buf in frame_data)
+        self.transport.write(frame_data)
+        return len(frame_data)
+
+    async def drain(self):
+        """Wait until the transport write buffer is below its high-water
+        mark.
+
+        :return:
+        """
+        if not self._write_paused or not self.transport:
+            return
+        waiter = (self._loop or running_loop()).create_future()
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        self._wake_drain_waiters()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._write_paused = False
+
+    def data_received(self, data):
+        self.buffer += data
+        self.buffer = self.on_read(self.buffer)
+
+    def connection_lost(self, exc):
+        self._write_paused = False
+        self._wake_drain_waiters()
+        if self.is_closing or self.is_closed:
+            return
+        self.transport = None
+        self.on_error(exc or 'connection/socket closed')
+
+    def _ssl_context(self):
+        """Get the shared SSLContext for the SSL Kwargs.
+
+            PROTOCOL_TLS_CLIENT was added in Python 3.6, PROTOCOL_SSLv23
+            negotiates the same versions on Python 3.5.
+
+        :rtype: ssl.SSLContext
+        """
+        return CONTEXT_CACHE.get(self.parameters['ssl_options'],
+                                 getattr(ssl, 'PROTOCOL_TLS_CLIENT',
+                                         ssl.PROTOCOL_SSLv23))
+
+    def _wake_drain_waiters(self):
+        """Wake up everything waiting in drain.
+
+        :return:
+        """
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class AsyncRpc(Rpc):
+    """Rpc Class that resolves futures instead of polling."""
+
+    def __init__(self, adapter, timeout=360):
+        super(AsyncRpc, self).__init__(adapter, timeout=timeout)
+        self._futures = {}
+
+    def on_frame(self, frame_in):
+        """On RPC Frame.
+
+        :param pamqp_spec.Frame frame_in: Amqp frame.
+        :return:
+        """
+        if not super(AsyncRpc, self).on_frame(frame_in):
+            return False
+        future = self._futures.get(self.request[frame_in.name])
+        if future and not future.done():
+            future.set_result(frame_in)
+        return True
+
+    def register_request(self, valid_responses, histogram=None):
+        """Register a RPC request.
+
+        :param list valid_responses: List of possible Responses that
+                                     we should be waiting for.
+        :param str histogram: Record the time until the response arrives
+                              in this latency histogram of the adapter.
+        :return:
+        """
+        uuid = super(AsyncRpc, self).register_request(valid_responses,
+                                                      histogram)
+        self._futures[uuid] = self._adapter.loop.create_future()
+        return uuid
+
+    def remove(self, uuid):
+        """Remove any data related to a specific RPC request.
+
+        :param str uuid: Rpc Identifier.
+        :return:
+        """
+        super(AsyncRpc, self).remove(uuid)
+        self._futures.pop(uuid, None)
+
+    def abort(self, why):
+        """Fail all pending RPC requests.
+
+        :param Exception why:
+        :return:
+        """
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(why)
+
+    async def get_request(self, uuid, raw=False, auto_remove=True):
+        """Get a RPC request.
+
+        :param str uuid: Rpc Identifier
+        :param bool raw: If enabled return the frame as is, else return
+                         result as a dictionary.
+        :param bool auto_remove: Automatically remove Rpc response.
+        :return:
+        """
+        if uuid not in self._futures:
+            return
+        hooks = self._hooks
+        traces = None
+        if hooks is not None and hooks.active:
+            traces = hooks.before_rpc(self._adapter, uuid)
+        frame = None
+        error = None
+        try:
+            try:
+                frame = await asyncio.wait_for(
+                    asyncio.shield(self._futures[uuid]), self.timeout or None)
+            except asyncio.TimeoutError:
+                self._raise_rpc_timeout_error(uuid)
+            self.record_latency(uuid)
+        except BaseException as why:
+            error = why
+            raise
+        finally:
+            if auto_remove:
+                self.remove(uuid)
+            if traces:
+                hooks.after_rpc(traces, self._adapter, frame, error)
+        if raw:
+            return frame
+        return dict(frame)
+
+
+class AsyncBasic(Basic):
+    """Channel.Basic for asyncio.
+
+        Methods that wait for a reply from the server are coroutines.
+    """
+
+    async def get(self, queue='', no_ack=False, to_dict=True):
+        """Fetch a single message.
+
+        :param str queue:
+        :param bool no_ack: No acknowledgement needed
+        :param bool to_dict: Should incoming messages be converted to a
+                    dictionary before delivery.
+        :rtype: dict|Message|None
+        """
+        if not compatibility.is_string(queue):
+            raise AMQPInvalidArgument('queue should be a string')
+        elif not isinstance(no_ack, bool):
+            raise AMQPInvalidArgument('no_ack should be a boolean')
+        elif self._channel.consumer_tags:
+            raise AMQPChannelError('Cannot call \'get\' when set to consume.')
+        get_frame = pamqp_spec.Basic.Get(queue=queue, no_ack=no_ack)
+        message = await self._channel.get_message(get_frame)
+        if message and to_dict:
+            return message.to_dict()
+        return message
+
+    async def consume(self, callback=None, queue='', consumer_tag='',
+                      exclusive=False, no_ack=False, no_local=False,
+                      arguments=None):
+        """Start a queue consumer.
+
+            Messages are delivered to channel.consume iterators, the
+            callback is kept for compatibility and is not called.
+
+        :param function callback:
+        :param str queue:
+        :param str consumer_tag:
+        :param bool no_local: Do not deliver own messages
+        :param bool no_ack: No acknowledgement needed
+        :param bool exclusive: Request exclusive access
+        :param dict arguments: Arguments for declaration
+        :rtype: str
+        """
+        if not compatibility.is_string(queue):
+            raise AMQPInvalidArgument('queue should be a string')
+        elif not compatibility.is_string(consumer_tag):
+            raise AMQPInvalidArgument('consumer_tag should be a string')
+        elif not isinstance(exclusive, bool):
+            raise AMQPInvalidArgument('exclusive should be a boolean')
+        elif not isinstance(no_ack, bool):
+            raise AMQPInvalidArgument('no_ack should be a boolean')
+        elif not isinstance(no_local, bool):
+            raise AMQPInvalidArgument('no_local should be a boolean')
+        elif arguments is not None and not isinstance(arguments, dict):
+            raise AMQPInvalidArgument('arguments should be a dict or None')
+        self._channel.consumer_callback = callback
+        consume_frame = pamqp_spec.Basic.Consume(queue=queue,
+                                                 consumer_tag=consumer_tag,
+                                                 exclusive=exclusive,
+                                                 no_local=no_local,
+                                                 no_ack=no_ack,
+                                                 arguments=arguments)
+        result = await self._channel.rpc_request(consume_frame)
+        consumer_tag = result['consumer_tag']
+        self._channel.add_consumer_tag(consumer_tag)
+        return consumer_tag
+
+    async def cancel(self, consumer_tag=''):
+        """Cancel a queue consumer.
+
+        :param str consumer_tag: Consumer tag
+        :rtype: dict
+        """
+        if not compatibility.is_string(consumer_tag):
+            raise AMQPInvalidArgument('consumer_tag should be a string')
+        cancel_frame = pamqp_spec.Basic.Cancel(consumer_tag=consumer_tag)
+        result = await self._channel.rpc_request(cancel_frame)
+        self._channel.remove_consumer_tag(consumer_tag)
+        return result
+
+    def _publish_confirm(self, send_buffer):
+        """Publish a message and return a future for the confirmation.
+
+            The future resolves to True on Basic.Ack and False on
+            Basic.Nack.
+
+        :param list send_buffer:
+        :rtype: asyncio.Future
+        """
+        future = self._channel.register_confirm()
+        self._channel.write_frames(send_buffer)
+        return future
+
+
+class AsyncConsumer(object):
+    """Asynchronous iterator over messages delivered to a consumer."""
+
+    def __init__(self, channel, **consume_arguments):
+        self._channel = channel
+        self._arguments = consume_arguments
+        self._queue = None
+        self.consumer_tag = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumer_tag is None:
+            await self.start()
+        message = await self._queue.get()
+        if message is None:
+            raise StopAsyncIteration
+        elif isinstance(message, Exception):
+            raise message
+        return message
+
+    async def start(self):
+        """Register the consumer with the remote server.
+
+        :rtype: str
+        """
+        self.consumer_tag = await self._channel.basic.consume(
+            **self._arguments)
+        self._queue = self._channel.consumer_queue(self.consumer_tag)
+        return self.consumer_tag
+
+    async def cancel(self):
+        """Cancel the consumer and stop the iteration.
+
+        :return:
+        """
+        if self.consumer_tag is None:
+            return
+        await self._channel.basic.cancel(self.consumer_tag)
+        self._channel.unregister_consumer(self.consumer_tag)
+
+
+class AsyncChannel(Channel):
+    """RabbitMQ Channel Class for asyncio."""
+
+    def __init__(self, channel_id, connection, rpc_timeout, validate=True):
+        super(AsyncChannel, self).__init__(channel_id, connection,
+                                           rpc_timeout, validate=validate)
+        self.rpc = AsyncRpc(self, timeout=rpc_timeout)
+        self.basic = AsyncBasic(self, validate=validate)
+        self._rpc_lock = asyncio.Lock()
+        self._consumers = {}
+        self._confirms = {}
+        self._confirm_times = {}
+        self._delivery_tag = 0
+        self._get_waiter = None
+        self._loop = getattr(connection, 'loop', None)
+
+    @property
+    def loop(self):
+        """Event loop of the connection, or else the loop that first used
+        this channel.
+
+        :rtype: asyncio.AbstractEventLoop
+        """
+        if self._loop is None:
+            self._loop = running_loop()
+        return self._loop
+
+    async def open(self):
+        """Open Channel.
+
+        :return:
+        """
+        self._inbound = []
+        self._received = {}
+        self._exceptions = []
+        self.set_state(self.OPENING)
+        await self.rpc_request(pamqp_spec.Channel.Open())
+        self.set_state(self.OPEN)
+
+    async def close(self, reply_code=0, reply_text=''):
+        """Close Channel.
+
+        :param int reply_code:
+        :param str reply_text:
+        :return:
+        """
+        LOGGER.debug('Channel #%d Closing.', self.channel_id)
+        if not compatibility.is_integer(reply_code):
+            raise AMQPInvalidArgument('reply_code should be an integer')
+        elif not compatibility.is_string(reply_text):
+            raise AMQPInvalidArgument('reply_text should be a string')
+
+        if not self._connection.is_open or not self.is_open:
+            self.remove_consumer_tag()
+            self.set_state(self.CLOSED)
+            self.abort(AMQPChannelError('channel was closed'))
+            return
+        self.set_state(self.CLOSING)
+        await self.stop_consuming()
+        await self.rpc_request(pamqp_spec.Channel.Close(
+            reply_code=reply_code,
+            reply_text=reply_text))
+        del self._inbound[:]
+        self.set_state(self.CLOSED)
+        self.abort(AMQPChannelError('channel was closed'))
+        LOGGER.debug('Channel #%d Closed.', self.channel_id)
+
+    async def confirm_deliveries(self):
+        """Set the channel to confirm that each message has been
+        successfully delivered.
+
+            basic.publish will return a future for each message.
+
+        :return:
+        """
+        self.confirming_deliveries = True
+        self._delivery_tag = 0
+        return await self.rpc_request(pamqp_spec.Confirm.Select())
+
+    def consume(self, queue='', consumer_tag='', exclusive=False,
+                no_ack=False, no_local=False, arguments=None):
+        """Consume messages using an asynchronous iterator.
+
+            e.g.
+                async for message in channel.consume('my_queue'):
+                    message.ack()
+
+        :param str queue:
+        :param str consumer_tag:
+        :param bool no_local: Do not deliver own messages
+        :param bool no_ack: No acknowledgement needed
+        :param bool exclusive: Request exclusive access
+        :param dict arguments: Arguments for declaration
+        :rtype: AsyncConsumer
+        """
+        return AsyncConsumer(self, queue=queue, consumer_tag=consumer_tag,
+                             exclusive=exclusive, no_ack=no_ack,
+                             no_local=no_local, arguments=arguments)
+
+    async def stop_consuming(self):
+        """Stop consuming events.
+
+        :return:
+        """
+        for tag in list(self.consumer_tags):
+            await self.basic.cancel(tag)
+            self.unregister_consumer(tag)
+        self.remove_consumer_tag()
+
+    def on_frame(self, frame_in):
+        """Handle frame sent to this specific channel.
+
+        :param pamqp.Frame frame_in: Amqp frame.
+        :return:
+        """
+        if frame_in.name in CONFIRM_FRAMES and \
+                frame_in.name not in self.rpc.request:
+            self._on_confirm(frame_in)
+            return
+        elif frame_in.name == 'Basic.GetOk':
+            self._inbound.append(frame_in)
+        elif frame_in.name == 'Basic.GetEmpty':
+            self._resolve_get(None)
+            return
+        else:
+            super(AsyncChannel, self).on_frame(frame_in)
+
+        if frame_in.name == 'Channel.Close':
+            why = self.exceptions[0] if self.exceptions else \
+                AMQPChannelError('channel was closed')
+            self.abort(why)
+        elif frame_in.name == 'Basic.Cancel':
+            self.unregister_consumer(frame_in.consumer_tag)
+        elif frame_in.name in ('Basic.GetOk', 'ContentHeader', 'ContentBody'):
+            self._dispatch_inbound()
+
+    def consumer_queue(self, consumer_tag):
+        """Get the queue that messages for a consumer tag are delivered to.
+
+            Messages may arrive before the consumer has been registered,
+            so the queue is created on first use.
+
+        :param str consumer_tag:
+        :rtype: asyncio.Queue
+        """
+        if consumer_tag not in self._consumers:
+            self._consumers[consumer_tag] = asyncio.Queue()
+        return self._consumers[consumer_tag]
+
+    def unregister_consumer(self, consumer_tag):
+        """Stop delivering messages for a consumer tag.
+
+        :param str consumer_tag:
+        :return:
+        """
+        queue = self._consumers.pop(consumer_tag, None)
+        if queue:
+            queue.put_nowait(None)
+
+    def register_confirm(self):
+        """Register a future for the next published message.
+
+        :rtype: asyncio.Future
+        """
+        self._delivery_tag += 1
+        future = self.loop.create_future()
+        self._confirms[self._delivery_tag] = future
+        self._confirm_times[self._delivery_tag] = time.time()
+        return future
+
+    async def drain(self):
+        """Wait until the connection has flushed enough buffered frames.
+
+            Basic.publish does not wait for the socket, so await this
+            after publishing a batch of messages.
+
+            e.g.
+                for body in bodies:
+                    channel.basic.publish(body, 'my_queue')
+                await channel.drain()
+
+        :return:
+        """
+        await self._connection.drain()
+
+    async def get_message(self, get_frame):
+        """Get and return a message using a Basic.Get frame.
+
+        :param Basic.Get get_frame:
+        :rtype: Message|None
+        """
+        async with self._rpc_lock:
+            self._get_waiter = self.loop.create_future()
+            self.write_frame(get_frame)
+            try:
+                return await asyncio.wait_for(self._get_waiter,
+                                              self.rpc.timeout or None)
+            except asyncio.TimeoutError:
+                raise AMQPChannelError('rpc requests Basic.Get took too long')
+            finally:
+                self._get_waiter = None
+
+    async def rpc_request(self, frame_out):
+        """Perform a RPC Request.
+
+        :param pamqp_spec.Frame frame_out: Amqp frame.
+        :rtype: dict
+        """
+        self.metrics.increment('rpc_requests')
+        async with self._rpc_lock:
+            uuid = self.rpc.register_request(frame_out.valid_responses,
+                                             histogram='rpc')
+            self.write_frame(frame_out)
+            return await self.rpc.get_request(uuid)
+
+    def abort(self, why):
+        """Fail everything that is waiting on this channel.
+
+        :param Exception why:
+        :return:
+        """
+        self.rpc.abort(why)
+        for future in self._confirms.values():
+            if not future.done():
+                future.set_exception(why)
+        self._confirms.clear()
+        self._confirm_times.clear()
+        if self._get_waiter and not self._get_waiter.done():
+            self._get_waiter.set_exception(why)
+        for queue in self._consumers.values():
+            queue.put_nowait(why)
+        self._consumers.clear()
+
+    def _on_confirm(self, frame_in):
+        """Resolve the futures covered by a Basic.Ack or Basic.Nack.
+
+        :param pamqp_spec.Frame frame_in: Amqp frame.
+        :return:
+        """
+        result = frame_in.name == 'Basic.Ack'
+        if frame_in.multiple:
+            delivery_tags = [tag for tag in self._confirms
+                             if tag <= frame_in.delivery_tag]
+        else:
+            delivery_tags = [frame_in.delivery_tag]
+        now = time.time()
+        for delivery_tag in delivery_tags:
+            future = self._confirms.pop(delivery_tag, None)
+            start_time = self._confirm_times.pop(delivery_tag, None)
+            if start_time is not None:
+                self.metrics.record_latency('confirm', now - start_time)
+            if future and not future.done():
+                future.set_result(result)
+
+    def _resolve_get(self, message):
+        """Hand the result of a Basic.Get to the waiting coroutine.
+
+        :param Message|None message:
+        :return:
+        """
+        if self._get_waiter and not self._get_waiter.done():
+            self._get_waiter.set_result(message)
+
+    def _dispatch_inbound(self):
+        """Deliver every complete message in the inbound queue.
+
+        :return:
+        """
+        while self._inbound_is_complete():
+            method = self._inbound[0]
+            message = self._pop_message()
+            if message is None:
+                continue
+            elif isinstance(method, pamqp_spec.Basic.GetOk):
+                self._resolve_get(message)
+                continue
+            self.consumer_queue(method.consumer_tag).put_nowait(message)
+
+    def _pop_message(self):
+        """Pop and build a complete Message from the inbound queue.
+
+        :rtype: Message|None
+        """
+        method = self._inbound.pop(0)
+        if not isinstance(method, (pamqp_spec.Basic.Deliver,
+                                   pamqp_spec.Basic.GetOk)):
+            LOGGER.warning('Received an out-of-order frame: %s was '
+                           'expecting a Basic.Deliver frame.', method)
+            return None
+        received = None
+        if isinstance(method, pamqp_spec.Basic.Deliver):
+            received = self._received.pop(method.delivery_tag, None)
+        content_header = self._inbound.pop(0)
+        if not isinstance(content_header, ContentHeader):
+            LOGGER.warning('Received an out-of-order frame: %s was '
+                           'expecting a ContentHeader frame.',
+                           content_header)
+            return None
+        body = bytes()
+        while len(body) < content_header.body_size:
+            body += self._inbound.pop(0).value
+        if received:
+            self.metrics.record_latency('delivery', time.time() - received)
+        message = Message(channel=self,
+                          body=body,
+                          method=dict(method),
+                          properties=dict(content_header.properties))
+        if self.hooks.active:
+            self.hooks.on_message(self, message)
+        return message
+
+
+class AsyncConnection(Connection):
+    """RabbitMQ Connection Class for asyncio.
+
+        e.g.
+            connection = AsyncConnection('localhost', 'guest', 'guest')
+            await connection.open()
+            channel = await connection.channel()
+            await channel.queue.declare('my_queue')
+    """
+
+    def __init__(self, hostname, username, password, port=5672, loop=None,
+                 **kwargs):
+        """Create a new instance of the AsyncConnection class.
+
+            The connection is not opened until open is awaited.
+
+        :param str hostname:
+        :param str username:
+        :param str password:
+        :param int port:
+        :param asyncio.AbstractEventLoop loop:
+        :param str virtual_host:
+        :param int heartbeat: RabbitMQ Heartbeat interval
+        :param int|float timeout: Socket timeout
+        :param bool ssl: Enable SSL
+        :param dict ssl_options: SSL Kwargs
+        :return:
+        """
+        self._loop = loop
+        self._opened = None
+        kwargs['lazy'] = True
+        super(AsyncConnection, self).__init__(hostname, username, password,
+                                              port, **kwargs)
+        self.io = AsyncIO(self.parameters,
+                          on_read=self._read_buffer,
+                          on_error=self._handle_socket_error,
+                          loop=loop)
+
+    async def __aenter__(self):
+        if not self.is_open:
+            await self.open()
+        return self
+
+    async def __aexit__(self, exception_type, exception_value, _):
+        if exception_value:
+            message = 'Closing connection due to an unhandled exception: {0!s}'
+            LOGGER.warning(message.format(exception_type))
+        await self.close()
+
+    async def open(self):
+        """Open Connection."""
+        LOGGER.debug('Connection Opening.')
+        self._exceptions = []
+        self.set_state(self.OPENING)
+        if self._loop is None:
+            self._loop = running_loop()
+        self.io._loop = self._loop
+        self._opened = self._loop.create_future()
+        await self.io.open(self.parameters['hostname'],
+                           self.parameters['port'])
+        self._send_handshake()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._opened),
+                                   self.parameters['timeout'] or None)
+        except asyncio.TimeoutError:
+            self._handle_socket_error('connection timed out')
+            self.check_for_errors()
+        LOGGER.debug('Connection Opened.')
+
+    def open_async(self):
+        """Open Connection in the background.
+
+            Use asyncio.gather to open many connections concurrently.
+
+        :rtype: asyncio.Task
+        """
+        return self.loop.create_task(self.open())
+
+    async def close(self):
+        """Close connection."""
+        LOGGER.debug('Connection Closing.')
+        if not self.is_closed and self.io.socket:
+            for channel in list(self._channels.values()):
+                if channel.is_open:
+                    await channel.close()
+            self.set_state(self.CLOSING)
+            self._channel0.send_close_connection_frame()
+        self.io.close()
+        self.set_state(self.CLOSED)
+        LOGGER.debug('Connection Closed.')
+
+    async def drain(self):
+        """Wait until enough buffered frames have been flushed to the socket.
+
+        :return:
+        """
+        await self.io.drain()
+
+    async def channel(self, rpc_timeout=360):
+        """Open Channel."""
+        LOGGER.debug('Opening new Channel.')
+        if not compatibility.is_integer(rpc_timeout):
+            raise AMQPInvalidArgument('rpc_timeout should be an integer')
+        channel = self._create_channel(AsyncChannel, rpc_timeout)
+        await channel.open()
+        LOGGER.debug('Channel #%d Opened.', channel.channel_id)
+        return channel
+
+    def set_state(self, state):
+        """Set State.
+
+            Wakes up anything waiting for the connection to open, or
+            to fail.
+
+        :param int state:
+        :return:
+        """
+        super(AsyncConnection, self).set_state(state)
+        if state == self.OPEN:
+            if self._opened and not self._opened.done():
+                self._opened.set_result(True)
+        elif state == self.CLOSED and self._loop:
+            # Exceptions are recorded right after the state changes, and
+            # this may be called from outside of the event loop.
+            self._loop.call_soon_threadsafe(self._abort_waiters)
+
+    def _abort_waiters(self):
+        """Fail the handshake and all channels with the reason the
+        connection was closed.
+
+        :return:
+        """
+        why = self.exceptions[0] if self.exceptions else \
+            AMQPConnectionError('connection was closed')
+        if self._opened and not self._opened.done():
+            self._opened.set_exception(why)
+        for channel in self._channels.values():
+            channel.abort(why)
+
+    @property
+    def loop(self):
+        """Event loop used by this connection. Unless passed in, this is
+        the loop that opened the connection.
+
+        :rtype: asyncio.AbstractEventLoop
+        """
+        if self._loop is None:
+            self._loop = running_loop()
+        return self._loop
@@ -0,0 +1,20 @@
+"""AMQP-Storm asyncio Connection and Channel.
+
+    Requires Python 3.5+, as the implementation uses async/await.
+
+    e.g.
+        from amqpstorm.aio import AsyncConnection
+"""
+__author__ = 'eandersson'
+
+import sys
+
+if sys.version_info < (3, 5):
+    raise ImportError('amqpstorm.aio requires Python 3.5 or later')
+
+from amqpstorm._aio import AsyncIO  # noqa
+from amqpstorm._aio import AsyncRpc  # noqa
+from amqpstorm._aio import AsyncBasic  # noqa
+from amqpstorm._aio import AsyncConsumer  # noqa
+from amqpstorm._aio import AsyncChannel  # noqa
+from amqpstorm._aio import AsyncConnection  # noqa
@@ -2,14 +2,21 @@
 __author__ = 'eandersson'
 
 import time
+import struct
 import threading
 from uuid import uuid4
+from collections import deque
+
+from pamqp import specification as pamqp_spec
 
 from amqpstorm.exception import AMQPChannelError
 
 
 IDLE_WAIT = 0.01
 FRAME_MAX = 131072
+BODY_FRAME_HEADER = struct.Struct('>BHI')
+FRAME_END = struct.pack('>B', pamqp_spec.FRAME_END)
+MARSHALLED_TYPES = (bytes, memoryview)
 
 
 class Stateful(object):
@@ -95,7 +102,10 @@ class Rpc(object):
         self.timeout = timeout
         self.response = {}
         self.request = {}
+        self._content = {}
+        self._timers = {}
         self._adapter = adapter
+        self._hooks = getattr(adapter, 'hooks', None)
 
     def on_frame(self, frame_in):
         """On RPC Frame.
@@ -108,20 +118,28 @@ class Rpc(object):
 
         uuid = self.request[frame_in.name]
         self.response[uuid] = frame_in
+        if frame_in.name == 'ContentBody':
+            # A large body is split over many frames, and these can arrive
+            # faster than they are read.
+            self._content.setdefault(uuid, deque()).append(frame_in)
 
         return True
 
-    def register_request(self, valid_responses):
+    def register_request(self, valid_responses, histogram=None):
         """Register a RPC request.
 
         :param list valid_responses: List of possible Responses that
                                      we should be waiting for.
+        :param str histogram: Record the time until the response arrives
+                              in this latency histogram of the adapter.
         :return:
         """
         uuid = str(uuid4())
         self.response[uuid] = None
         for action in valid_responses:
             self.request[action] = uuid
+        if histogram:
+            self._timers[uuid] = (histogram, time.time())
 
         return uuid
 
@@ -158,6 +176,8 @@ class Rpc(object):
 
         if uuid in self.response:
             del self.response[uuid]
+        self._content.pop(uuid, None)
+        self._timers.pop(uuid, None)
 
     def get_request(self, uuid, raw=False, auto_remove=True):
         """Get a RPC request.
@@ -171,8 +191,22 @@ class Rpc(object):
         if uuid not in self.response:
             return
 
-        self._wait_for_request(uuid)
-        frame = self.response.get(uuid, None)
+        hooks = self._hooks
+        traces = None
+        if hooks is not None and hooks.active:
+            traces = hooks.before_rpc(self._adapter, uuid)
+        frame = None
+        error = None
+        try:
+            self._wait_for_request(uuid)
+            self.record_latency(uuid)
+            frame = self.response.get(uuid, None)
+        except BaseException as why:
+            error = why
+            raise
+        finally:
+            if traces:
+                hooks.after_rpc(traces, self._adapter, frame, error)
 
         self.response[uuid] = None
         if auto_remove:
@@ -185,6 +219,43 @@ class Rpc(object):
             result = dict(frame)
         return result
 
+    def record_latency(self, uuid):
+        """Record the time from the request until the response arrived.
+
+        :param str uuid: Rpc Identifier.
+        :return:
+        """
+        timer = self._timers.pop(uuid, None)
+        if timer is None:
+            return
+        histogram, start_time = timer
+        self._adapter.metrics.record_latency(histogram,
+                                             time.time() - start_time)
+
+    def get_content_body(self, uuid, body_size):
+        """Get a message body, that may be split over many body frames.
+
+        :param str uuid: Rpc Identifier.
+        :param int body_size: Content Size.
+        :rtype: bytes
+        """
+        frames = self._content.setdefault(uuid, deque())
+        pieces = []
+        received = 0
+        start_time = time.time()
+        while received < body_size:
+            if frames:
+                piece = frames.popleft().value
+                pieces.append(piece)
+                received += len(piece)
+                continue
+            self._adapter.check_for_errors()
+            if time.time() - start_time > self.timeout:
+                self._raise_rpc_timeout_error(uuid)
+            time.sleep(IDLE_WAIT)
+        self.remove(uuid)
+        return bytes().join(pieces)
+
     def _wait_for_request(self, uuid):
         """Wait for RPC request to arrive.
 
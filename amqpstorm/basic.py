@@ -5,12 +5,16 @@ import math
 import logging
 
 from pamqp import body as pamqp_body
-from pamqp import header as pamqp_header
 from pamqp import specification as pamqp_spec
 
 from amqpstorm import compatibility
 from amqpstorm.base import FRAME_MAX
+from amqpstorm.cache import EMPTY_PROPERTIES
+from amqpstorm.cache import PROPERTIES_CACHE
+from amqpstorm.cache import CachedContentHeader
+from amqpstorm.cache import encode_properties
 from amqpstorm.message import Message
+from amqpstorm.publisher import Publisher
 from amqpstorm.exception import AMQPMessageError
 from amqpstorm.exception import AMQPChannelError
 from amqpstorm.exception import AMQPInvalidArgument
@@ -22,8 +26,15 @@ LOGGER = logging.getLogger(__name__)
 class Basic(object):
     """Channel.Basic."""
 
-    def __init__(self, channel):
+    def __init__(self, channel, validate=True):
+        """
+        :param Channel channel: amqp-storm Channel
+        :param bool validate: Validate the arguments passed to publish,
+                              ack, nack and reject. Disable this only
+                              for trusted callers.
+        """
         self._channel = channel
+        self._validate = validate
 
     def qos(self, prefetch_count=0, prefetch_size=0, global_=False):
         """Specify quality of service.
@@ -141,26 +152,73 @@ class Basic(object):
         :rtype: bool|None
         :raises AMQPInvalidArgument: Invalid Parameters
         """
-        self._validate_publish_parameters(body, exchange, immediate, mandatory,
-                                          properties, routing_key)
+        if self._validate:
+            self._validate_publish_parameters(body, exchange, immediate,
+                                              mandatory, properties,
+                                              routing_key)
         properties = properties or {}
         body = self._handle_utf8_payload(body, properties)
-        properties = pamqp_spec.Basic.Properties(**properties)
+        hooks = self._channel.hooks
+        traces = None
+        if hooks.active:
+            properties = dict(properties)
+            properties['headers'] = dict(properties.get('headers') or {})
+            traces = hooks.before_publish(self._channel, body, routing_key,
+                                          exchange, properties)
+            # Traced headers are unique to each message, and would only
+            # evict the entries that untraced publishes rely on.
+            properties, encoded_properties = encode_properties(properties)
+        elif properties:
+            properties, encoded_properties = PROPERTIES_CACHE.get(properties)
+        else:
+            properties, encoded_properties = EMPTY_PROPERTIES
         method_frame = pamqp_spec.Basic.Publish(exchange=exchange,
                                                 routing_key=routing_key,
                                                 mandatory=mandatory,
                                                 immediate=immediate)
-        header_frame = pamqp_header.ContentHeader(body_size=len(body),
-                                                  properties=properties)
+        header_frame = CachedContentHeader(len(body), properties,
+                                           encoded_properties)
 
         send_buffer = [method_frame, header_frame]
         for body_frame in self._create_content_body(body):
             send_buffer.append(body_frame)
 
-        if self._channel.confirming_deliveries:
-            with self._channel.rpc.lock:
-                return self._publish_confirm(send_buffer)
-        self._channel.write_frames(send_buffer)
+        result = None
+        error = None
+        try:
+            if self._channel.confirming_deliveries:
+                with self._channel.rpc.lock:
+                    result = self._publish_confirm(send_buffer)
+            else:
+                self._channel.write_frames(send_buffer)
+        except BaseException as why:
+            error = why
+            raise
+        finally:
+            if traces:
+                hooks.after_publish(traces, self._channel, result, error)
+        return result
+
+    def publisher(self, exchange, routing_key, properties=None,
+                  mandatory=False, immediate=False):
+        """Create a pre-compiled Publisher.
+
+            Use this when publishing many messages with the same exchange,
+            routing key and properties.
+
+        :param str exchange:
+        :param str routing_key:
+        :param dict properties:
+        :param bool mandatory:
+        :param bool immediate:
+        :rtype: Publisher
+        :raises AMQPInvalidArgument: Invalid Parameters
+        """
+        self._validate_publish_parameters(b'', exchange, immediate, mandatory,
+                                          properties, routing_key)
+        return Publisher(self._channel, exchange, routing_key,
+                         properties=properties, mandatory=mandatory,
+                         immediate=immediate)
 
     def ack(self, delivery_tag=None, multiple=False):
         """Acknowledge Message.
@@ -169,12 +227,10 @@ class Basic(object):
         :param bool multiple: Acknowledge multiple messages
         :return:
         """
-        if delivery_tag is not None \
-                and not compatibility.is_integer(delivery_tag):
-            raise AMQPInvalidArgument('delivery_tag should be an integer '
-                                      'or None')
-        elif not isinstance(multiple, bool):
-            raise AMQPInvalidArgument('multiple should be a boolean')
+        if self._validate:
+            self._validate_delivery_tag(delivery_tag)
+            if not isinstance(multiple, bool):
+                raise AMQPInvalidArgument('multiple should be a boolean')
         ack_frame = pamqp_spec.Basic.Ack(delivery_tag=delivery_tag,
                                          multiple=multiple)
         self._channel.write_frame(ack_frame)
@@ -186,12 +242,10 @@ class Basic(object):
         :param bool requeue: Requeue the message
         :return:
         """
-        if delivery_tag is not None \
-                and not compatibility.is_integer(delivery_tag):
-            raise AMQPInvalidArgument('delivery_tag should be an integer '
-                                      'or None')
-        elif not isinstance(requeue, bool):
-            raise AMQPInvalidArgument('requeue should be a boolean')
+        if self._validate:
+            self._validate_delivery_tag(delivery_tag)
+            if not isinstance(requeue, bool):
+                raise AMQPInvalidArgument('requeue should be a boolean')
         reject_frame = pamqp_spec.Basic.Reject(delivery_tag=delivery_tag,
                                                requeue=requeue)
         self._channel.write_frame(reject_frame)
@@ -204,19 +258,30 @@ class Basic(object):
         :param bool requeue:
         :return:
         """
-        if delivery_tag is not None \
-                and not compatibility.is_integer(delivery_tag):
-            raise AMQPInvalidArgument('delivery_tag should be an integer '
-                                      'or None')
-        elif not isinstance(multiple, bool):
-            raise AMQPInvalidArgument('multiple should be a boolean')
-        elif not isinstance(requeue, bool):
-            raise AMQPInvalidArgument('requeue should be a boolean')
+        if self._validate:
+            self._validate_delivery_tag(delivery_tag)
+            if not isinstance(multiple, bool):
+                raise AMQPInvalidArgument('multiple should be a boolean')
+            elif not isinstance(requeue, bool):
+                raise AMQPInvalidArgument('requeue should be a boolean')
         nack_frame = pamqp_spec.Basic.Nack(delivery_tag=delivery_tag,
                                            multiple=multiple,
                                            requeue=requeue)
         self._channel.write_frame(nack_frame)
 
+    @staticmethod
+    def _validate_delivery_tag(delivery_tag):
+        """Validate Delivery Tag.
+
+        :param int/long delivery_tag: Server-assigned delivery tag
+        :raises AMQPInvalidArgument: Invalid Parameters
+        :return:
+        """
+        if delivery_tag is not None \
+                and not compatibility.is_integer(delivery_tag):
+            raise AMQPInvalidArgument('delivery_tag should be an integer '
+                                      'or None')
+
     @staticmethod
     def _validate_publish_parameters(body, exchange, immediate, mandatory,
                                      properties, routing_key):
@@ -267,8 +332,8 @@ class Basic(object):
         :param Basic.Get get_frame:
         :rtype: Message
         """
-        uuid_get = \
-            self._channel.rpc.register_request(get_frame.valid_responses)
+        uuid_get = self._channel.rpc.register_request(
+            get_frame.valid_responses, histogram='rpc')
         uuid_header = self._channel.rpc.register_request(['ContentHeader'])
         uuid_body = self._channel.rpc.register_request(['ContentBody'])
         self._channel.write_frame(get_frame)
@@ -293,8 +358,8 @@ class Basic(object):
         :param list send_buffer:
         :rtype: bool
         """
-        confirm_uuid = self._channel.rpc.register_request(['Basic.Ack',
-                                                           'Basic.Nack'])
+        confirm_uuid = self._channel.rpc.register_request(
+            ['Basic.Ack', 'Basic.Nack'], histogram='confirm')
         self._channel.write_frames(send_buffer)
         result = self._channel.rpc.get_request(confirm_uuid, True)
         self._channel.check_for_errors()
@@ -331,12 +396,4 @@ class Basic(object):
         :param int body_size: Content Size.
         :rtype: str
         """
-        body = bytes()
-        while len(body) < body_size:
-            body_piece = self._channel.rpc.get_request(uuid_body, True,
-                                                       auto_remove=False)
-            if not body_piece:
-                break
-            body += body_piece.value
-        self._channel.rpc.remove(uuid_body)
-        return body
+        return self._channel.rpc.get_content_body(uuid_body, body_size)
@@ -0,0 +1,164 @@
+"""AMQP-Storm Properties Cache."""
+__author__ = 'eandersson'
+
+import struct
+import logging
+import threading
+from decimal import Decimal
+from datetime import datetime
+from collections import OrderedDict
+
+from pamqp import header as pamqp_header
+from pamqp import specification as pamqp_spec
+
+from amqpstorm import compatibility
+
+
+LOGGER = logging.getLogger(__name__)
+CONTENT_HEADER = struct.Struct('>HxxQ')
+SCALAR_TYPES = frozenset(compatibility.STRING_TYPES +
+                         compatibility.INTEGER_TYPES +
+                         (bool, float, type(None)))
+
+
+class CachedContentHeader(pamqp_header.ContentHeader):
+    """Content Header that uses pre-marshalled properties."""
+
+    def __init__(self, body_size, properties, encoded_properties):
+        """
+        :param int body_size: The size of the message body
+        :param pamqp_spec.Basic.Properties properties: Message properties
+        :param bytes encoded_properties: The marshalled properties
+        """
+        super(CachedContentHeader, self).__init__(body_size=body_size,
+                                                  properties=properties)
+        self._encoded_properties = encoded_properties
+
+    def marshal(self):
+        """Return the AMQP binary encoded value of the frame.
+
+        :rtype: bytes
+        """
+        return CONTENT_HEADER.pack(pamqp_spec.Basic.frame_id,
+                                   self.body_size) + self._encoded_properties
+
+
+class PropertiesCache(object):
+    """Least recently used cache of marshalled Basic.Properties.
+
+        Keyed on a canonical form of the properties dictionary, see
+        _canonical_key, so that identical properties are only encoded
+        once, regardless of the order the keys were inserted in.
+        Properties holding values that cannot be keyed reliably are
+        encoded without being cached.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        :param int max_size: Maximum number of cached property sets.
+        """
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def hit_rate(self):
+        """Fraction of lookups that were served from the cache.
+
+        :rtype: float
+        """
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / float(total)
+
+    def get(self, properties):
+        """Get the Basic.Properties, and their marshalled value, for a
+        properties dictionary.
+
+        :param dict properties:
+        :rtype: tuple
+        """
+        try:
+            key = _canonical_key(properties)
+        except TypeError:
+            with self.lock:
+                self.misses += 1
+            return encode_properties(properties)
+        with self.lock:
+            result = self._cache.pop(key, None)
+            if result is not None:
+                self.hits += 1
+                self._cache[key] = result
+                return result
+            self.misses += 1
+        result = encode_properties(properties)
+        with self.lock:
+            self._cache[key] = result
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear(self):
+        """Remove all cached properties, and reset the statistics.
+
+        :return:
+        """
+        with self.lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def encode_properties(properties):
+    """Create and marshal Basic.Properties, without using the cache.
+
+    :param dict properties:
+    :rtype: tuple
+    """
+    properties = pamqp_spec.Basic.Properties(**properties)
+    return properties, properties.marshal()
+
+
+def _canonical_key(value):
+    """Hashable key for a properties value, that only matches values
+    that encode the same.
+
+        Each value is paired with its type, to tell e.g. True and 1
+        apart, and dictionary items are sorted, so that the insertion
+        order does not matter.
+
+    :param value:
+    :raises TypeError: The value cannot be keyed reliably.
+    :rtype: tuple
+    """
+    value_type = type(value)
+    if value_type is dict:
+        items = []
+        for key, item in value.items():
+            item_type = type(item)
+            if item_type in SCALAR_TYPES:
+                items.append((key, item_type, item))
+            else:
+                items.append((key, item_type, _canonical_key(item)))
+        items.sort()
+        return tuple(items)
+    elif value_type in SCALAR_TYPES:
+        return value
+    elif value_type is list or value_type is tuple:
+        return value_type, tuple([(type(item), _canonical_key(item))
+                                  for item in value])
+    elif value_type is Decimal:
+        return value.as_tuple()
+    elif value_type is datetime:
+        return value.isoformat()
+    raise TypeError('%s cannot be cached' % value_type.__name__)
+
+
+PROPERTIES_CACHE = PropertiesCache()
+EMPTY_PROPERTIES = encode_properties({})
@@ -0,0 +1,132 @@
+"""AMQP-Storm Frame Capture.
+
+    Records the raw frames sent and received by a connection, with a
+    timestamp, so that the exact traffic can be replayed offline later,
+    see amqpstorm.replay.
+
+    e.g.
+        connection.start_capture('/tmp/consumer.capture')
+        ...
+        connection.stop_capture()
+
+    The file starts with MAGIC, followed by one record per frame
+    received, or per write. Each record is a RECORD header (timestamp,
+    direction and length) followed by the raw data.
+"""
+__author__ = 'eandersson'
+
+import struct
+import logging
+import threading
+from time import time
+
+from amqpstorm import compatibility
+from amqpstorm.exception import AMQPInvalidArgument
+
+LOGGER = logging.getLogger(__name__)
+MAGIC = b'AMQPSTORM-CAPTURE\x01'
+RECORD = struct.Struct('>dBI')
+INBOUND = 0
+OUTBOUND = 1
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+
+
+class Capture(object):
+    """Writes frames to a capture file, until it reaches max_bytes.
+
+        Records that do not fit are dropped, rather than the oldest ones,
+        as a replay needs the connection and channel handshakes at the
+        start of the capture.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param str path: Capture file, overwritten if it exists.
+        :param int max_bytes: Maximum size of the capture file.
+        :raises AMQPInvalidArgument: Invalid Parameters
+        """
+        if not compatibility.is_string(path):
+            raise AMQPInvalidArgument('path should be a string')
+        elif not compatibility.is_integer(max_bytes):
+            raise AMQPInvalidArgument('max_bytes should be an integer')
+        self.lock = threading.Lock()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records = 0
+        self.dropped = 0
+        self.size = len(MAGIC)
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    @property
+    def is_closed(self):
+        """
+        :rtype: bool
+        """
+        return self._file is None
+
+    def record(self, direction, data):
+        """Record a frame, or a list of buffers written together.
+
+        :param int direction: INBOUND or OUTBOUND
+        :param bytes|list data:
+        :return:
+        """
+        if not isinstance(data, list):
+            data = [data]
+        length = 0
+        for buffer in data:
+            length += len(buffer)
+        with self.lock:
+            if self._file is None:
+                return
+            elif self.size + RECORD.size + length > self.max_bytes:
+                if not self.dropped:
+                    LOGGER.warning('Capture %s reached %d bytes, frames are '
+                                   'no longer recorded', self.path,
+                                   self.max_bytes)
+                self.dropped += 1
+                return
+            self._file.write(RECORD.pack(time(), direction, length))
+            for buffer in data:
+                self._file.write(buffer)
+            self.size += RECORD.size + length
+            self.records += 1
+
+    def close(self):
+        """Flush and close the capture file.
+
+        :return:
+        """
+        with self.lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        LOGGER.debug('Captured %d records (%d bytes) to %s, dropped %d',
+                     self.records, self.size, self.path, self.dropped)
+
+
+def read_capture(path):
+    """Read the records of a capture file.
+
+        A record that was cut short, e.g. by the process being killed,
+        ends the capture.
+
+    :param str path:
+    :raises AMQPInvalidArgument: Not a capture file.
+    :return: Timestamp, direction and data of each record.
+    :rtype: generator
+    """
+    with open(path, 'rb') as capture:
+        if capture.read(len(MAGIC)) != MAGIC:
+            raise AMQPInvalidArgument('%s is not a capture file' % path)
+        while True:
+            header = capture.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            timestamp, direction, length = RECORD.unpack(header)
+            data = capture.read(length)
+            if len(data) < length:
+                break
+            yield timestamp, direction, data
@@ -2,19 +2,27 @@
 __author__ = 'eandersson'
 
 import logging
+from time import time
 from time import sleep
 
+from pamqp.body import ContentBody
 from pamqp.header import ContentHeader
 from pamqp import specification as pamqp_spec
 
 from amqpstorm.base import Rpc
 from amqpstorm.base import IDLE_WAIT
 from amqpstorm.base import BaseChannel
+from amqpstorm.base import MARSHALLED_TYPES
 from amqpstorm.queue import Queue
 from amqpstorm.basic import Basic
 from amqpstorm import compatibility
 from amqpstorm.message import Message
+from amqpstorm.metrics import Metrics
+from amqpstorm.metrics import FRAMES_OUT
+from amqpstorm.metrics import DEFAULT_CONSUMER
+from amqpstorm.metrics import add_derived_counters
 from amqpstorm.exchange import Exchange
+from amqpstorm.tracing import Hooks
 from amqpstorm.exception import AMQPChannelError
 from amqpstorm.exception import AMQPMessageError
 from amqpstorm.exception import AMQPConnectionError
@@ -28,14 +36,19 @@ CONTENT_FRAME = ['Basic.Deliver', 'ContentHeader', 'ContentBody']
 class Channel(BaseChannel):
     """RabbitMQ Channel Class."""
 
-    def __init__(self, channel_id, connection, rpc_timeout):
+    def __init__(self, channel_id, connection, rpc_timeout, validate=True):
         super(Channel, self).__init__(channel_id)
+        self.hooks = getattr(connection, 'hooks', None)
+        if self.hooks is None:
+            self.hooks = Hooks()
         self.rpc = Rpc(self, timeout=rpc_timeout)
+        self.metrics = Metrics()
         self._inbound = []
+        self._received = {}
         self._connection = connection
         self.confirming_deliveries = False
         self.consumer_callback = None
-        self.basic = Basic(self)
+        self.basic = Basic(self, validate=validate)
         self.queue = Queue(self)
         self.exchange = Exchange(self)
 
@@ -59,6 +72,7 @@ class Channel(BaseChannel):
         :return:
         """
         self._inbound = []
+        self._received = {}
         self._exceptions = []
         self.set_state(self.OPENING)
         self.rpc_request(pamqp_spec.Channel.Open())
@@ -110,6 +124,8 @@ class Channel(BaseChannel):
             return
 
         if frame_in.name in CONTENT_FRAME:
+            if frame_in.name == 'Basic.Deliver':
+                self._received[frame_in.delivery_tag] = time()
             self._inbound.append(frame_in)
         elif frame_in.name == 'Basic.ConsumeOk':
             self.add_consumer_tag(frame_in['consumer_tag'])
@@ -160,13 +176,26 @@ class Channel(BaseChannel):
         """
         if not self.consumer_callback:
             raise AMQPChannelError('no consumer_callback defined')
+        hooks = self.hooks
         for message in self.build_inbound_messages(break_on_empty=True):
-            if not to_tuple:
-                # noinspection PyCallingNonCallable
-                self.consumer_callback(message)
-                continue
-            # noinspection PyCallingNonCallable
-            self.consumer_callback(*message.to_tuple())
+            start_time = time()
+            traces = None
+            if hooks.active:
+                traces = hooks.before_callback(self, message)
+            try:
+                if not to_tuple:
+                    # noinspection PyCallingNonCallable
+                    self.consumer_callback(message)
+                else:
+                    # noinspection PyCallingNonCallable
+                    self.consumer_callback(*message.to_tuple())
+            except Exception as why:
+                if traces:
+                    hooks.after_callback(traces, self, message, why)
+                raise
+            if traces:
+                hooks.after_callback(traces, self, message)
+            self.metrics.record_latency('callback', time() - start_time)
         sleep(IDLE_WAIT)
 
     def build_inbound_messages(self, break_on_empty=False, to_tuple=False):
@@ -192,6 +221,42 @@ class Channel(BaseChannel):
                 continue
             yield message
 
+    def stats(self):
+        """Snapshot of the channel metrics.
+
+            Frames are counted by name, and the message level counters,
+            e.g. publishes and deliveries, are derived from them.
+
+        :rtype: dict
+        """
+        stats = self.metrics.snapshot()
+        stats.setdefault('rpc_requests', 0)
+        add_derived_counters(stats)
+        stats['inbound_frames'] = len(self._inbound)
+        stats['consumers'] = len(self.consumer_tags)
+        stats['latency'] = dict((name, histogram.summary())
+                                for name, histogram
+                                in self.latency().items())
+        return stats
+
+    def latency(self, reset=False, consumer=DEFAULT_CONSUMER):
+        """Latency histograms of the channel.
+
+            rpc: From a request until the response arrived.
+            confirm: From a publish until the Basic.Ack or Basic.Nack.
+            delivery: From a message arriving until it is handed to the
+                      consumer callback.
+            callback: Time spent in the consumer callback.
+
+        :param bool reset: Start over, e.g. at the end of a scrape
+                           interval.
+        :param str|None consumer: Name of the consumer, as each consumer
+                                  resets its own view, or None for the
+                                  cumulative values.
+        :rtype: dict
+        """
+        return self.metrics.histograms(reset=reset, consumer=consumer)
+
     def write_frame(self, frame_out):
         """Write a pamqp frame from the current channel.
 
@@ -199,15 +264,22 @@ class Channel(BaseChannel):
         :return:
         """
         self.check_for_errors()
+        self.metrics.increment((FRAMES_OUT, frame_out.name))
         self._connection.write_frame(self.channel_id, frame_out)
 
     def write_frames(self, multiple_frames):
         """Write multiple pamqp frames from the current channel.
 
+            Frames that have already been marshalled are counted by
+            whoever marshalled them, e.g. the Publisher.
+
         :param list multiple_frames: A list of pamqp frames.
         :return:
         """
         self.check_for_errors()
+        for frame_out in multiple_frames:
+            if not isinstance(frame_out, MARSHALLED_TYPES):
+                self.metrics.increment((FRAMES_OUT, frame_out.name))
         self._connection.write_frames(self.channel_id,
                                       multiple_frames)
 
@@ -233,8 +305,10 @@ class Channel(BaseChannel):
         :param pamqp_spec.Frame frame_out: Amqp frame.
         :rtype: dict
         """
+        self.metrics.increment('rpc_requests')
         with self.rpc.lock:
-            uuid = self.rpc.register_request(frame_out.valid_responses)
+            uuid = self.rpc.register_request(frame_out.valid_responses,
+                                             histogram='rpc')
             self.write_frame(frame_out)
             return self.rpc.get_request(uuid)
 
@@ -280,6 +354,7 @@ class Channel(BaseChannel):
                                'expecting a Basic.Deliver frame.',
                                basic_deliver)
                 return None
+            received = self._received.pop(basic_deliver.delivery_tag, None)
             content_header = self._inbound.pop(0)
             if not isinstance(content_header, ContentHeader):
                 LOGGER.warning('Received an out-of-order frame: %s was '
@@ -291,8 +366,31 @@ class Channel(BaseChannel):
                           body=body,
                           method=dict(basic_deliver),
                           properties=dict(content_header.properties))
+        if received:
+            self.metrics.record_latency('delivery', time() - received)
+        if self.hooks.active:
+            self.hooks.on_message(self, message)
         return message
 
+    def _inbound_is_complete(self):
+        """Is there a complete message at the front of the inbound queue.
+
+        :rtype: bool
+        """
+        if len(self._inbound) < 2:
+            return False
+        content_header = self._inbound[1]
+        if not isinstance(content_header, ContentHeader):
+            return True
+        received = 0
+        for body_piece in self._inbound[2:]:
+            if received >= content_header.body_size:
+                break
+            elif not isinstance(body_piece, ContentBody):
+                return True
+            received += len(body_piece)
+        return received >= content_header.body_size
+
     def _build_message_body(self, body_size):
         """Build the Message body from the inbound queue.
 
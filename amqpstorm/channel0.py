@@ -42,6 +42,7 @@ class Channel0(object):
             self.server_properties = frame_in.server_properties
             self._send_start_ok_frame()
         elif frame_in.name == 'Connection.Tune':
+            self._heartbeat = self._negotiate_heartbeat(frame_in.heartbeat)
             self._send_tune_ok_frame()
             self._send_open_connection()
         elif frame_in.name == 'Connection.OpenOk':
@@ -59,6 +60,14 @@ class Channel0(object):
             LOGGER.error('Unhandled Frame: %s -- %s',
                          frame_in.name, dict(frame_in))
 
+    @property
+    def heartbeat_interval(self):
+        """Negotiated Heartbeat interval in seconds.
+
+        :rtype: int
+        """
+        return self._heartbeat
+
     def send_close_connection_frame(self):
         """Send Connection Close frame.
 
@@ -79,6 +88,20 @@ class Channel0(object):
             why = AMQPConnectionError(message)
             self._connection.exceptions.append(why)
 
+    def _negotiate_heartbeat(self, server_heartbeat):
+        """Negotiate the Heartbeat interval.
+
+            Use the lowest value requested, unless the client has
+            disabled heartbeats.
+
+        :param int server_heartbeat:
+        :rtype: int
+        """
+        client_heartbeat = self.parameters['heartbeat']
+        if not client_heartbeat or not server_heartbeat:
+            return client_heartbeat
+        return min(client_heartbeat, server_heartbeat)
+
     def _set_connection_state(self, state):
         """Set Connection state.
 
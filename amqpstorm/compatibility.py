@@ -2,6 +2,7 @@
 __author__ = 'eandersson'
 
 import sys
+import threading
 
 
 PYTHON3 = sys.version_info >= (3, 0, 0)
@@ -12,10 +13,19 @@ try:
 except ImportError:
     PYPY = False
 
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
 if PYTHON3:
     RANGE = range
+    STRING_TYPES = (bytes, str)
+    INTEGER_TYPES = (int,)
 else:
     RANGE = xrange
+    STRING_TYPES = (bytes, str, unicode)
+    INTEGER_TYPES = (int, long)
 
 
 def is_string(obj):
@@ -24,11 +34,7 @@ def is_string(obj):
     :param object obj:
     :rtype: bool
     """
-    if PYTHON3:
-        str_type = (bytes, str)
-    else:
-        str_type = (bytes, str, unicode)
-    return isinstance(obj, str_type)
+    return isinstance(obj, STRING_TYPES)
 
 
 def is_integer(obj):
@@ -37,9 +43,7 @@ def is_integer(obj):
     :param object obj:
     :return:
     """
-    if PYTHON3:
-        return isinstance(obj, int)
-    return isinstance(obj, (int, long))
+    return isinstance(obj, INTEGER_TYPES)
 
 
 def is_unicode(obj):
@@ -74,3 +78,81 @@ def try_utf8_decode(value):
         pass
 
     return value
+
+
+class FutureTimeoutError(Exception):
+    """Raised by ThreadFuture.result when the result is not ready in time.
+    """
+
+
+class ThreadFuture(object):
+    """Minimal concurrent.futures.Future, for Python 2 without the
+    futures backport.
+
+        Supports setting a result or exception from another thread, and
+        waiting for it.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_running_or_notify_cancel(self):
+        """Futures created by open_async can not be cancelled.
+
+        :rtype: bool
+        """
+        return True
+
+    def set_result(self, result):
+        """Set the result, and wake up any waiting threads.
+
+        :param object result:
+        :return:
+        """
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exception):
+        """Set the exception, and wake up any waiting threads.
+
+        :param Exception exception:
+        :return:
+        """
+        self._exception = exception
+        self._event.set()
+
+    def done(self):
+        """Has a result or exception been set.
+
+        :rtype: bool
+        """
+        return self._event.is_set()
+
+    def exception(self, timeout=None):
+        """Wait for, and return, the exception, or None on success.
+
+        :param int|float timeout:
+        :raises FutureTimeoutError: Not done in time.
+        :rtype: Exception|None
+        """
+        if not self._event.wait(timeout):
+            raise FutureTimeoutError()
+        return self._exception
+
+    def result(self, timeout=None):
+        """Wait for, and return, the result.
+
+        :param int|float timeout:
+        :raises FutureTimeoutError: Not done in time.
+        :return: The result, or raises the exception that was set.
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+
+if Future is None:
+    Future = ThreadFuture
@@ -2,25 +2,47 @@
 __author__ = 'eandersson'
 
 import logging
+import threading
+from time import time
 from time import sleep
 
+from pamqp import body as pamqp_body
 from pamqp import frame as pamqp_frame
 from pamqp import header as pamqp_header
+from pamqp import heartbeat as pamqp_heartbeat
 from pamqp import specification as pamqp_spec
 from pamqp import exceptions as pamqp_exception
 
 from amqpstorm.io import IO
-from amqpstorm.io import EMPTY_BUFFER
+from amqpstorm.io import Transport
 from amqpstorm import compatibility
 from amqpstorm.base import Stateful
 from amqpstorm.base import IDLE_WAIT
+from amqpstorm.base import FRAME_END
+from amqpstorm.base import BODY_FRAME_HEADER
+from amqpstorm.base import MARSHALLED_TYPES
 from amqpstorm.channel import Channel
 from amqpstorm.channel0 import Channel0
+from amqpstorm.capture import INBOUND
+from amqpstorm.capture import OUTBOUND
+from amqpstorm.capture import Capture
+from amqpstorm.capture import DEFAULT_MAX_BYTES
+from amqpstorm.metrics import Metrics
+from amqpstorm.metrics import Histogram
+from amqpstorm.metrics import FRAMES_IN
+from amqpstorm.metrics import FRAMES_OUT
+from amqpstorm.metrics import DEFAULT_CONSUMER
+from amqpstorm.metrics import merge
+from amqpstorm.metrics import add_derived_counters
+from amqpstorm.tracing import Hooks
+from amqpstorm.heartbeat import Heartbeat
 from amqpstorm.exception import AMQPConnectionError
 from amqpstorm.exception import AMQPInvalidArgument
 
 
 LOGGER = logging.getLogger(__name__)
+PROTOCOL_HEADER = b'AMQP'
+MAX_CHANNELS = 65535
 
 
 class Connection(Stateful):
@@ -29,7 +51,9 @@ class Connection(Stateful):
     def __init__(self, hostname, username, password, port=5672, **kwargs):
         """Create a new instance of the Connection class.
 
-        :param str hostname:
+        :param str|list hostname: Hostname, or a list of hostnames
+                                  ("host" or "host:port") to fail over
+                                  between
         :param str username:
         :param str password:
         :param int port:
@@ -38,6 +62,13 @@ class Connection(Stateful):
         :param int|float timeout: Socket timeout
         :param bool ssl: Enable SSL
         :param dict ssl_options: SSL Kwargs
+        :param bool validate: Validate the arguments passed to
+                              basic.publish, ack, nack and reject
+        :param bool lazy: Do not open the connection automatically
+        :param Reactor reactor: Share an inbound IO thread with other
+                                connections
+        :param Transport transport: Open the socket using a different
+                                    transport, e.g. UnixTransport
         :return:
         """
         super(Connection, self).__init__()
@@ -50,15 +81,28 @@ class Connection(Stateful):
             'heartbeat': kwargs.get('heartbeat', 60),
             'timeout': kwargs.get('timeout', 0),
             'ssl': kwargs.get('ssl', False),
-            'ssl_options': kwargs.get('ssl_options', {})
+            'ssl_options': kwargs.get('ssl_options', {}),
+            'validate': kwargs.get('validate', True),
+            'transport': kwargs.get('transport')
         }
+        self.metrics = Metrics()
+        self.hooks = Hooks()
         self.io = IO(self.parameters,
                      on_read=self._read_buffer,
-                     on_error=self._handle_socket_error)
+                     on_error=self._handle_socket_error,
+                     reactor=kwargs.get('reactor'),
+                     on_tick=self._on_tick,
+                     metrics=self.metrics)
+        self.heartbeat = Heartbeat(self.io,
+                                   send_heartbeat_impl=self._send_heartbeat,
+                                   on_timeout=self._handle_socket_error)
         self._channel0 = Channel0(self)
         self._channels = {}
+        self._closed_channel_metrics = {}
+        self._capture = None
         self._validate_parameters()
-        self.open()
+        if not kwargs.get('lazy', False):
+            self.open()
 
     def __enter__(self):
         return self
@@ -69,6 +113,15 @@ class Connection(Stateful):
             LOGGER.warning(message.format(exception_type))
         self.close()
 
+    @property
+    def channels(self):
+        """Returns a dictionary of the Channels opened on this connection,
+        by channel id.
+
+        :rtype: dict
+        """
+        return self._channels
+
     @property
     def is_blocked(self):
         """Is the connection currently being blocked from publishing by
@@ -113,11 +166,43 @@ class Connection(Stateful):
         while not self.is_open:
             self.check_for_errors()
             sleep(IDLE_WAIT)
+        self.heartbeat.start(self._channel0.heartbeat_interval)
         LOGGER.debug('Connection Opened.')
 
+    def open_async(self):
+        """Open Connection in the background.
+
+            e.g.
+                connection = Connection('localhost', 'guest', 'guest',
+                                        lazy=True)
+                future = connection.open_async()
+                ...
+                future.result(timeout=10)
+
+        :return: A Future that resolves to the Connection once it is
+                 open, or to the exception raised while opening it.
+        :rtype: concurrent.futures.Future|compatibility.ThreadFuture
+        """
+        future = compatibility.Future()
+        future.set_running_or_notify_cancel()
+
+        def _open():
+            try:
+                self.open()
+            except Exception as why:
+                future.set_exception(why)
+                return
+            future.set_result(self)
+
+        thread = threading.Thread(target=_open, name=__name__)
+        thread.daemon = True
+        thread.start()
+        return future
+
     def close(self):
         """Close connection."""
         LOGGER.debug('Connection Closing.')
+        self.heartbeat.stop()
         if not self.is_closed and self.io.socket:
             self._close_channels()
             self.set_state(self.CLOSING)
@@ -132,12 +217,66 @@ class Connection(Stateful):
         if not compatibility.is_integer(rpc_timeout):
             raise AMQPInvalidArgument('rpc_timeout should be an integer')
         with self.io.lock:
-            channel_id = len(self._channels) + 1
-            channel = Channel(channel_id, self, rpc_timeout)
-            self._channels[channel_id] = channel
+            channel = self._create_channel(Channel, rpc_timeout)
             channel.open()
-        LOGGER.debug('Channel #%d Opened.', channel_id)
-        return self._channels[channel_id]
+        LOGGER.debug('Channel #%d Opened.', channel.channel_id)
+        return channel
+
+    def stats(self):
+        """Snapshot of the connection metrics, including the metrics of
+        every channel.
+
+            e.g.
+                stats = connection.stats()
+                stats['publishes'], stats['frames_in']['Basic.Deliver']
+
+        :rtype: dict
+        """
+        stats = self.metrics.snapshot()
+        for name in ('rpc_requests', 'write_stalls', 'write_stall_time',
+                     'reconnects'):
+            stats.setdefault(name, 0)
+        inbound_frames = 0
+        open_channels = 0
+        for metrics in list(self._closed_channel_metrics.values()):
+            merge(stats, metrics.snapshot())
+        for channel in list(self._channels.values()):
+            merge(stats, channel.metrics.snapshot())
+            inbound_frames += len(channel._inbound)
+            if channel.is_open:
+                open_channels += 1
+        add_derived_counters(stats)
+        stats['bytes_in'] = getattr(self.io, 'receive_bytes', 0)
+        stats['bytes_out'] = getattr(self.io, 'write_bytes', 0)
+        stats['inbound_frames'] = inbound_frames
+        stats['channels'] = open_channels
+        stats['latency'] = dict((name, histogram.summary())
+                                for name, histogram
+                                in self.latency().items())
+        return stats
+
+    def latency(self, reset=False, consumer=DEFAULT_CONSUMER):
+        """Latency histograms of all channels combined.
+
+            e.g.
+                connection.latency(reset=True)['rpc'].percentile(99.9)
+
+        :param bool reset: Start over, e.g. at the end of a scrape
+                           interval.
+        :param str|None consumer: Name of the consumer, as each consumer
+                                  resets its own view, or None for the
+                                  cumulative values.
+        :rtype: dict
+        """
+        result = {}
+        metrics = list(self._closed_channel_metrics.values())
+        metrics += [channel.metrics for channel in
+                    list(self._channels.values())]
+        for channel_metrics in metrics:
+            for name, histogram in channel_metrics.histograms(
+                    reset=reset, consumer=consumer).items():
+                result.setdefault(name, Histogram()).add(histogram)
+        return result
 
     def check_for_errors(self):
         """Check connection for potential errors.
@@ -155,28 +294,77 @@ class Connection(Stateful):
         :param pamqp_spec.Frame frame_out: Amqp frame.
         :return:
         """
+        if not channel_id:
+            # Frames on other channels are counted by the channel.
+            self.metrics.increment((FRAMES_OUT, frame_out.name))
         frame_data = pamqp_frame.marshal(frame_out, channel_id)
+        capture = self._capture
+        if capture:
+            capture.record(OUTBOUND, frame_data)
         self.io.write_to_socket(frame_data)
 
     def write_frames(self, channel_id, multiple_frames):
         """Marshal and write multiple outgoing pamqp frames to the socket.
 
+            The frames are written as a list of buffers, and the content
+            body payloads are never copied. Frames that have already been
+            marshalled (bytes) are written as is.
+
         :param int channel_id:
         :param list multiple_frames: Amqp frames.
         :return:
         """
-        frame_data = EMPTY_BUFFER
+        frame_data = []
         for single_frame in multiple_frames:
-            frame_data += pamqp_frame.marshal(single_frame, channel_id)
+            if isinstance(single_frame, MARSHALLED_TYPES):
+                frame_data.append(single_frame)
+                continue
+            elif isinstance(single_frame, pamqp_body.ContentBody):
+                frame_data.append(BODY_FRAME_HEADER.pack(
+                    pamqp_spec.FRAME_BODY, channel_id,
+                    len(single_frame.value)))
+                frame_data.append(single_frame.value)
+                frame_data.append(FRAME_END)
+                continue
+            frame_data.append(pamqp_frame.marshal(single_frame, channel_id))
+        capture = self._capture
+        if capture:
+            capture.record(OUTBOUND, frame_data)
         self.io.write_to_socket(frame_data)
 
+    def start_capture(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        """Record the raw frames sent and received to a capture file,
+        e.g. to replay them offline using amqpstorm.replay.
+
+        :param str path: Capture file, overwritten if it exists.
+        :param int max_bytes: Frames are no longer recorded once the
+                              capture file reaches this size.
+        :raises AMQPInvalidArgument: Invalid Parameters
+        :rtype: Capture
+        """
+        capture = Capture(path, max_bytes)
+        self.stop_capture()
+        self._capture = capture
+        return capture
+
+    def stop_capture(self):
+        """Stop recording frames, and close the capture file.
+
+        :return:
+        """
+        capture = self._capture
+        self._capture = None
+        if capture:
+            capture.close()
+
     def _validate_parameters(self):
         """Validate Connection Parameters.
 
         :return:
         """
-        if not compatibility.is_string(self.parameters['hostname']):
-            raise AMQPInvalidArgument('hostname should be a string')
+        if not self._is_hostname(self.parameters['hostname']):
+            raise AMQPInvalidArgument('hostname should be a string or a '
+                                      'list of strings')
         elif not compatibility.is_integer(self.parameters['port']):
             raise AMQPInvalidArgument('port should be an integer')
         elif not compatibility.is_string(self.parameters['username']):
@@ -189,6 +377,29 @@ class Connection(Stateful):
             raise AMQPInvalidArgument('timeout should be an integer or float')
         elif not compatibility.is_integer(self.parameters['heartbeat']):
             raise AMQPInvalidArgument('heartbeat should be an integer')
+        elif not isinstance(self.parameters['validate'], bool):
+            raise AMQPInvalidArgument('validate should be a boolean')
+        elif self.parameters['transport'] is not None and \
+                not isinstance(self.parameters['transport'], Transport):
+            raise AMQPInvalidArgument('transport should be a Transport')
+
+    @staticmethod
+    def _is_hostname(hostname):
+        """Is this a hostname, or a non-empty list of hostnames.
+
+        :param str|list hostname:
+        :rtype: bool
+        """
+        if compatibility.is_string(hostname):
+            return True
+        elif not isinstance(hostname, (list, tuple)) or not hostname:
+            return False
+        for host in hostname:
+            if isinstance(host, tuple) and len(host) == 2:
+                host = host[0]
+            if not compatibility.is_string(host):
+                return False
+        return True
 
     def _send_handshake(self):
         """Send RabbitMQ Handshake.
@@ -197,25 +408,91 @@ class Connection(Stateful):
         """
         self.io.write_to_socket(pamqp_header.ProtocolHeader().marshal())
 
+    def _on_tick(self):
+        """Periodic callback from the inbound thread, or Reactor.
+
+        :return:
+        """
+        self.heartbeat.check()
+
+    def _send_heartbeat(self):
+        """Send a Heartbeat frame to the remote server.
+
+        :return:
+        """
+        if not self.is_open:
+            return
+        frame_out = pamqp_heartbeat.Heartbeat()
+        frame_data = pamqp_frame.marshal(frame_out, 0)
+        # Heartbeats are sent by whatever reads the socket, and must never
+        # wait for a stalled writer, or the dead connection check would
+        # stall too. A busy writer is outbound traffic in itself.
+        if self.io.write_to_socket(frame_data, blocking=False) is None:
+            LOGGER.debug('Heartbeat skipped, the socket is busy.')
+            return
+        self.metrics.increment((FRAMES_OUT, frame_out.name))
+        capture = self._capture
+        if capture:
+            capture.record(OUTBOUND, frame_data)
+
     def _read_buffer(self, buffer):
         """Process the socket buffer, and direct the data to the correct
         channel.
 
+            Each frame is sliced out of the buffer on its own, and the
+            rest of the buffer is only copied once at the end, so that a
+            buffer holding many frames is processed in linear time.
+
         :return:
         """
-        while buffer:
-            buffer, channel_id, frame_in = \
-                self._handle_amqp_frame(buffer)
+        capture = self._capture
+        offset = 0
+        length = len(buffer)
+        while offset < length:
+            frame_end = self._frame_end(buffer, offset)
+            if frame_end > length:
+                break
+            frame_data = buffer[offset:frame_end]
+            _, channel_id, frame_in = self._handle_amqp_frame(frame_data)
 
             if frame_in is None:
                 break
+            elif capture:
+                capture.record(INBOUND, frame_data)
+            offset = frame_end
 
             if channel_id == 0:
+                self.metrics.increment((FRAMES_IN, frame_in.name))
                 self._channel0.on_frame(frame_in)
             else:
-                self._channels[channel_id].on_frame(frame_in)
+                channel = self._channels.get(channel_id)
+                if channel is None:
+                    LOGGER.warning('Received %s for unknown channel #%d',
+                                   frame_in.name, channel_id)
+                    continue
+                channel.metrics.increment((FRAMES_IN, frame_in.name))
+                channel.on_frame(frame_in)
 
-        return buffer
+        return buffer[offset:]
+
+    @staticmethod
+    def _frame_end(buffer, offset):
+        """Offset just past the frame that starts at offset.
+
+            Returns an offset past the end of the buffer when not enough
+            of the frame has been received to know its size.
+
+        :param bytes buffer: socket data
+        :param int offset: Start of the frame.
+        :rtype: int
+        """
+        if buffer[offset:offset + 4] == PROTOCOL_HEADER:
+            return offset + 8
+        elif len(buffer) - offset < BODY_FRAME_HEADER.size:
+            return len(buffer) + 1
+        # Every frame type shares the same header as a body frame.
+        frame_size = BODY_FRAME_HEADER.unpack_from(buffer, offset)[2]
+        return offset + BODY_FRAME_HEADER.size + frame_size + 1
 
     @staticmethod
     def _handle_amqp_frame(data_in):
@@ -235,6 +512,36 @@ class Connection(Stateful):
             LOGGER.error('AMQPFrameError: %r', why, exc_info=True)
             return data_in, None, None
 
+    def _create_channel(self, channel_class, rpc_timeout):
+        """Create a Channel, using the lowest channel id that is free.
+
+            Closed channels are removed, so that their ids can be re-used.
+            A channel that re-uses an id carries on the metrics of the
+            closed channel, so that its counters never go backwards.
+
+        :param class channel_class:
+        :param int rpc_timeout:
+        :raises AMQPConnectionError: No channel id is free.
+        :rtype: Channel
+        """
+        for channel_id, channel in list(self._channels.items()):
+            if channel.is_closed:
+                del self._channels[channel_id]
+                self._closed_channel_metrics[channel_id] = channel.metrics
+        channel_id = 1
+        while channel_id in self._channels:
+            channel_id += 1
+        if channel_id > MAX_CHANNELS:
+            raise AMQPConnectionError('reached the maximum number of '
+                                      'channels')
+        channel = channel_class(channel_id, self, rpc_timeout,
+                                validate=self.parameters['validate'])
+        metrics = self._closed_channel_metrics.pop(channel_id, None)
+        if metrics is not None:
+            channel.metrics = metrics
+        self._channels[channel_id] = channel
+        return channel
+
     def _close_channels(self):
         """Close any open channels.
 
@@ -252,8 +559,42 @@ class Connection(Stateful):
         :return:
         """
         previous_state = self._state
+        self.heartbeat.stop()
         self.set_state(self.CLOSED)
         if previous_state != self.CLOSED:
             LOGGER.error(why, exc_info=False)
         self.io.close()
         self._exceptions.append(AMQPConnectionError(why))
+
+
+def open_connections(connections, timeout=None):
+    """Open many Connections concurrently, and wait for all handshakes.
+
+        e.g.
+            connections = [Connection(host, 'guest', 'guest', lazy=True)
+                           for host in hosts]
+            open_connections(connections, timeout=30)
+
+    :param list connections: Connections created using lazy=True.
+    :param int|float timeout: Maximum time to wait for all connections.
+    :raises AMQPConnectionError: A connection failed, or did not open
+                                 in time.
+    :rtype: list
+    """
+    futures = [connection.open_async() for connection in connections]
+    deadline = time() + timeout if timeout is not None else None
+    errors = []
+    for future in futures:
+        remaining = None
+        if deadline is not None:
+            remaining = max(deadline - time(), 0)
+        try:
+            future.result(timeout=remaining)
+        except Exception as why:
+            errors.append(why)
+    if errors:
+        raise AMQPConnectionError('{0!s} of {1!s} connections failed to '
+                                  'open: {2!r}'.format(len(errors),
+                                                       len(connections),
+                                                       errors[0]))
+    return connections
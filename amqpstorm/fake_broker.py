@@ -0,0 +1,956 @@
+"""AMQP-Storm In-process Fake Broker."""
+__author__ = 'eandersson'
+
+import os
+import socket
+import select
+import logging
+import itertools
+import threading
+from collections import deque
+from collections import OrderedDict
+
+from pamqp import body as pamqp_body
+from pamqp import frame as pamqp_frame
+from pamqp import header as pamqp_header
+from pamqp import heartbeat as pamqp_heartbeat
+from pamqp import specification as pamqp_spec
+
+from amqpstorm import compatibility
+from amqpstorm.base import FRAME_MAX
+from amqpstorm.base import BODY_FRAME_HEADER
+from amqpstorm.io import SocketPairTransport
+
+LOGGER = logging.getLogger(__name__)
+RECEIVE_SIZE = 65536
+NO_ROUTE = 312
+NOT_FOUND = 404
+PRECONDITION_FAILED = 406
+NOT_ALLOWED = 530
+EXCHANGE_TYPES = ('direct', 'fanout', 'topic', 'headers')
+DEFAULT_EXCHANGES = (('', 'direct'),
+                     ('amq.direct', 'direct'),
+                     ('amq.fanout', 'fanout'),
+                     ('amq.topic', 'topic'),
+                     ('amq.headers', 'headers'))
+
+
+class ChannelError(Exception):
+    """Closes the channel that caused it, with a reply code and text."""
+
+    def __init__(self, reply_code, reply_text):
+        super(ChannelError, self).__init__(reply_text)
+        self.reply_code = reply_code
+        self.reply_text = reply_text
+
+
+class FakeBroker(object):
+    """A small in-process stand-in for RabbitMQ.
+
+        Implements enough of AMQP 0-9-1 for amqp-storm to run against it
+        without an external server; the connection handshake, channels,
+        exchanges, queues and bindings, publishing, consuming with
+        prefetch, basic.get, acknowledgements and publisher confirms.
+
+        There are no virtual hosts, persistence, transactions or
+        authentication, and every connection shares the same state.
+
+        e.g.
+            broker = FakeBroker()
+            connection = Connection('localhost', 'guest', 'guest',
+                                    transport=broker.transport())
+
+            host, port = broker.listen()
+            connection = Connection(host, 'guest', 'guest', port=port)
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.exchanges = {}
+        self.queues = {}
+        self.published = 0
+        self.delivered = 0
+        self._connections = []
+        self._listeners = []
+        self._counter = itertools.count(1)
+        for name, exchange_type in DEFAULT_EXCHANGES:
+            self.exchanges[name] = Exchange(name, exchange_type)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, _):
+        self.stop()
+
+    @property
+    def connections(self):
+        """Number of open client connections.
+
+        :rtype: int
+        """
+        return len(self._connections)
+
+    def transport(self):
+        """Transport that connects a client directly to this broker,
+        using a socket pair.
+
+        :rtype: SocketPairTransport
+        """
+        return SocketPairTransport(on_connect=self.serve)
+
+    def serve(self, sock):
+        """Serve a connected client socket from a new thread.
+
+        :param socket.socket sock:
+        :rtype: BrokerConnection
+        """
+        connection = BrokerConnection(self, sock)
+        with self.lock:
+            self._connections.append(connection)
+        connection.start()
+        return connection
+
+    def listen(self, host='127.0.0.1', port=0):
+        """Accept TCP connections.
+
+        :param str host:
+        :param int port: Defaults to any free port.
+        :return: The host and port that the broker is listening on.
+        :rtype: tuple
+        """
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        self._accept(listener)
+        return listener.getsockname()[:2]
+
+    def listen_unix(self, path):
+        """Accept connections on a Unix domain socket.
+
+        :param str path:
+        :return:
+        """
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        self._accept(listener)
+
+    def stop(self):
+        """Stop listening, and close every client connection.
+
+        :return:
+        """
+        for listener in self._listeners:
+            if listener.family == getattr(socket, 'AF_UNIX', None):
+                try:
+                    os.unlink(listener.getsockname())
+                except OSError:
+                    pass
+            listener.close()
+        del self._listeners[:]
+        for connection in list(self._connections):
+            connection.close()
+
+    def message_count(self, queue):
+        """Number of messages ready for delivery on a queue.
+
+        :param str queue:
+        :rtype: int
+        """
+        with self.lock:
+            return len(self.queues[queue].messages)
+
+    def next_name(self, prefix):
+        """Generate a unique name, e.g. for a server named queue.
+
+        :param str prefix:
+        :rtype: str
+        """
+        return '%s-%d' % (prefix, next(self._counter))
+
+    def get_exchange(self, name):
+        """
+        :param str name:
+        :raises ChannelError: The exchange does not exist.
+        :rtype: Exchange
+        """
+        if name not in self.exchanges:
+            raise ChannelError(NOT_FOUND, "NOT_FOUND - no exchange '%s'" %
+                               name)
+        return self.exchanges[name]
+
+    def get_queue(self, name):
+        """
+        :param str name:
+        :raises ChannelError: The queue does not exist.
+        :rtype: Queue
+        """
+        if name not in self.queues:
+            raise ChannelError(NOT_FOUND, "NOT_FOUND - no queue '%s'" % name)
+        return self.queues[name]
+
+    def delete_queue(self, queue):
+        """Delete a queue, its bindings, and cancel its consumers.
+
+        :param Queue queue:
+        :return:
+        """
+        self.queues.pop(queue.name, None)
+        for exchange in self.exchanges.values():
+            exchange.unbind(queue=queue)
+        for consumer in list(queue.consumers):
+            consumer.channel.cancel(consumer.tag, notify=True)
+
+    def route(self, exchange, routing_key, headers):
+        """Find the queues that a message should be delivered to.
+
+        :param Exchange exchange:
+        :param str routing_key:
+        :param dict headers:
+        :rtype: list
+        """
+        if not exchange.name:
+            queue = self.queues.get(routing_key)
+            return [queue] if queue else []
+        queues = []
+        visited = set()
+        pending = [exchange]
+        while pending:
+            exchange = pending.pop()
+            if exchange.name in visited:
+                continue
+            visited.add(exchange.name)
+            for destination in exchange.match(routing_key, headers):
+                if isinstance(destination, Exchange):
+                    pending.append(destination)
+                elif destination not in queues:
+                    queues.append(destination)
+        return queues
+
+    def dispatch(self, queue):
+        """Deliver ready messages to the consumers of a queue, round robin,
+        as long as their prefetch allows.
+
+        :param Queue queue:
+        :return:
+        """
+        while queue.messages and queue.consumers:
+            consumer = queue.next_consumer()
+            if consumer is None:
+                return
+            message, redelivered = queue.messages.popleft()
+            consumer.channel.deliver(consumer, queue, message, redelivered)
+            self.delivered += 1
+
+    def remove_connection(self, connection):
+        """
+        :param BrokerConnection connection:
+        :return:
+        """
+        with self.lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+            for queue in list(self.queues.values()):
+                if queue.owner is connection:
+                    self.delete_queue(queue)
+
+    def _accept(self, listener):
+        """Accept connections from a listening socket in a new thread.
+
+        :param socket.socket listener:
+        :return:
+        """
+        listener.listen(16)
+        self._listeners.append(listener)
+        thread = threading.Thread(target=self._accept_loop,
+                                  args=(listener,), name=__name__)
+        thread.daemon = True
+        thread.start()
+
+    def _accept_loop(self, listener):
+        """
+        :param socket.socket listener:
+        :return:
+        """
+        while listener in self._listeners:
+            try:
+                ready, _, _ = select.select([listener], [], [], 0.1)
+                if ready:
+                    self.serve(listener.accept()[0])
+            except (socket.error, select.error, ValueError):
+                break
+
+
+class Exchange(object):
+    """A fake exchange, and its bindings."""
+
+    def __init__(self, name, exchange_type, auto_delete=False):
+        self.name = name
+        self.exchange_type = exchange_type
+        self.auto_delete = auto_delete
+        self.bindings = []
+
+    def bind(self, destination, routing_key, arguments):
+        """Bind a queue, or another exchange.
+
+        :param Queue|Exchange destination:
+        :param str routing_key:
+        :param dict arguments:
+        :return:
+        """
+        binding = (destination, routing_key, arguments or {})
+        if binding not in self.bindings:
+            self.bindings.append(binding)
+
+    def unbind(self, queue=None, routing_key=None, arguments=None):
+        """Remove matching bindings.
+
+        :param Queue|Exchange queue: Destination of the bindings.
+        :param str routing_key: Only remove bindings with this routing key.
+        :param dict arguments:
+        :return:
+        """
+        self.bindings = [
+            binding for binding in self.bindings
+            if binding[0] is not queue or
+            (routing_key is not None and
+             (binding[1], binding[2]) != (routing_key, arguments or {}))
+        ]
+
+    def match(self, routing_key, headers):
+        """Destinations bound with a matching routing key, or headers.
+
+        :param str routing_key:
+        :param dict headers:
+        :rtype: list
+        """
+        if self.exchange_type == 'fanout':
+            return [binding[0] for binding in self.bindings]
+        elif self.exchange_type == 'topic':
+            return [binding[0] for binding in self.bindings
+                    if topic_match(binding[1].split('.'),
+                                   routing_key.split('.'))]
+        elif self.exchange_type == 'headers':
+            return [binding[0] for binding in self.bindings
+                    if headers_match(binding[2], headers)]
+        return [binding[0] for binding in self.bindings
+                if binding[1] == routing_key]
+
+
+class Queue(object):
+    """A fake queue, its messages and consumers."""
+
+    def __init__(self, name, owner=None, auto_delete=False):
+        self.name = name
+        self.owner = owner
+        self.auto_delete = auto_delete
+        self.messages = deque()
+        self.consumers = []
+        self._next = 0
+
+    def next_consumer(self):
+        """The next consumer, in turn, that can take another message.
+
+        :rtype: Consumer|None
+        """
+        for _ in range(len(self.consumers)):
+            self._next = (self._next + 1) % len(self.consumers)
+            consumer = self.consumers[self._next]
+            if consumer.channel.can_deliver(consumer):
+                return consumer
+        return None
+
+
+class Consumer(object):
+    """A fake consumer."""
+
+    def __init__(self, channel, queue, tag, no_ack):
+        self.channel = channel
+        self.queue = queue
+        self.tag = tag
+        self.no_ack = no_ack
+
+
+class Message(object):
+    """A message routed by the fake broker."""
+
+    def __init__(self, exchange, routing_key, properties, body):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.properties = properties
+        self.body = body
+
+
+class BrokerChannel(object):
+    """Server side of a channel."""
+
+    def __init__(self, connection, channel_id):
+        self.broker = connection.broker
+        self.connection = connection
+        self.channel_id = channel_id
+        self.prefetch_count = 0
+        self.confirm = False
+        self.publish_count = 0
+        self.consumers = OrderedDict()
+        self.unacked = OrderedDict()
+        self._delivery_tags = itertools.count(1)
+        self._publish = None
+        self._header = None
+        self._body = []
+        self._body_size = 0
+
+    def can_deliver(self, consumer):
+        """Is the consumer allowed another unacknowledged message.
+
+        :param Consumer consumer:
+        :rtype: bool
+        """
+        return consumer.no_ack or not self.prefetch_count or \
+            len(self.unacked) < self.prefetch_count
+
+    def deliver(self, consumer, queue, message, redelivered):
+        """Send a message to a consumer.
+
+        :param Consumer consumer:
+        :param Queue queue:
+        :param Message message:
+        :param bool redelivered:
+        :return:
+        """
+        delivery_tag = next(self._delivery_tags)
+        if not consumer.no_ack:
+            self.unacked[delivery_tag] = (queue, message)
+        deliver = pamqp_spec.Basic.Deliver(consumer_tag=consumer.tag,
+                                           delivery_tag=delivery_tag,
+                                           redelivered=redelivered,
+                                           exchange=message.exchange,
+                                           routing_key=message.routing_key)
+        self.connection.send_content(self.channel_id, deliver, message)
+
+    def cancel(self, consumer_tag, notify=False):
+        """Remove a consumer.
+
+        :param str consumer_tag:
+        :param bool notify: Tell the client that it was cancelled.
+        :return:
+        """
+        consumer = self.consumers.pop(consumer_tag, None)
+        if consumer is None:
+            return
+        queue = consumer.queue
+        if consumer in queue.consumers:
+            queue.consumers.remove(consumer)
+        if notify:
+            self.connection.send(
+                self.channel_id,
+                pamqp_spec.Basic.Cancel(consumer_tag=consumer_tag))
+        elif queue.auto_delete and not queue.consumers:
+            self.broker.delete_queue(queue)
+
+    def close(self):
+        """Cancel all consumers, and requeue unacknowledged messages.
+
+        :return:
+        """
+        for consumer_tag in list(self.consumers):
+            self.cancel(consumer_tag)
+        self._requeue(list(self.unacked))
+
+    def on_frame(self, frame_in):
+        """Handle a frame sent by the client on this channel.
+
+        :param frame_in: Amqp frame.
+        :raises ChannelError: The channel should be closed.
+        :return:
+        """
+        if frame_in.name == 'ContentHeader':
+            self._on_content_header(frame_in)
+        elif frame_in.name == 'ContentBody':
+            self._on_content_body(frame_in)
+        else:
+            handler = getattr(self, '_' + frame_in.name.lower().replace(
+                '.', '_'), None)
+            if handler is None:
+                raise ChannelError(NOT_ALLOWED, 'NOT_IMPLEMENTED - %s' %
+                                   frame_in.name)
+            handler(frame_in)
+
+    def _reply(self, frame_in, frame_out):
+        """Send a reply, unless the client asked for no reply.
+
+        :param frame_in: Request frame.
+        :param frame_out: Reply frame.
+        :return:
+        """
+        if not getattr(frame_in, 'nowait', False):
+            self.connection.send(self.channel_id, frame_out)
+
+    def _exchange_declare(self, frame_in):
+        name = text(frame_in.exchange)
+        exchange_type = text(frame_in.exchange_type)
+        exchange = self.broker.exchanges.get(name)
+        if frame_in.passive:
+            self.broker.get_exchange(name)
+        elif exchange is None:
+            if exchange_type not in EXCHANGE_TYPES:
+                raise ChannelError(NOT_ALLOWED,
+                                   "COMMAND_INVALID - unknown exchange "
+                                   "type '%s'" % exchange_type)
+            self.broker.exchanges[name] = Exchange(name, exchange_type,
+                                                   frame_in.auto_delete)
+        elif exchange.exchange_type != exchange_type:
+            raise ChannelError(PRECONDITION_FAILED,
+                               "PRECONDITION_FAILED - inequivalent arg "
+                               "'type' for exchange '%s'" % name)
+        self._reply(frame_in, pamqp_spec.Exchange.DeclareOk())
+
+    def _exchange_delete(self, frame_in):
+        exchange = self.broker.exchanges.pop(text(frame_in.exchange), None)
+        if exchange is not None:
+            for other in self.broker.exchanges.values():
+                other.unbind(queue=exchange)
+        self._reply(frame_in, pamqp_spec.Exchange.DeleteOk())
+
+    def _exchange_bind(self, frame_in):
+        destination = self.broker.get_exchange(text(frame_in.destination))
+        source = self.broker.get_exchange(text(frame_in.source))
+        source.bind(destination, text(frame_in.routing_key),
+                    frame_in.arguments)
+        self._reply(frame_in, pamqp_spec.Exchange.BindOk())
+
+    def _exchange_unbind(self, frame_in):
+        destination = self.broker.get_exchange(text(frame_in.destination))
+        source = self.broker.get_exchange(text(frame_in.source))
+        source.unbind(destination, text(frame_in.routing_key),
+                      frame_in.arguments)
+        self._reply(frame_in, pamqp_spec.Exchange.UnbindOk())
+
+    def _queue_declare(self, frame_in):
+        name = text(frame_in.queue) or self.broker.next_name('amq.gen')
+        queue = self.broker.queues.get(name)
+        if frame_in.passive:
+            queue = self.broker.get_queue(name)
+        elif queue is None:
+            owner = self.connection if frame_in.exclusive else None
+            queue = Queue(name, owner, frame_in.auto_delete)
+            self.broker.queues[name] = queue
+        if queue.owner not in (None, self.connection):
+            raise ChannelError(405, "RESOURCE_LOCKED - cannot obtain "
+                                    "exclusive access to locked queue "
+                                    "'%s'" % name)
+        self._reply(frame_in, pamqp_spec.Queue.DeclareOk(
+            queue=name, message_count=len(queue.messages),
+            consumer_count=len(queue.consumers)))
+
+    def _queue_bind(self, frame_in):
+        queue = self.broker.get_queue(text(frame_in.queue))
+        exchange = self.broker.get_exchange(text(frame_in.exchange))
+        exchange.bind(queue, text(frame_in.routing_key), frame_in.arguments)
+        self._reply(frame_in, pamqp_spec.Queue.BindOk())
+
+    def _queue_unbind(self, frame_in):
+        queue = self.broker.get_queue(text(frame_in.queue))
+        exchange = self.broker.get_exchange(text(frame_in.exchange))
+        exchange.unbind(queue, text(frame_in.routing_key), frame_in.arguments)
+        self._reply(frame_in, pamqp_spec.Queue.UnbindOk())
+
+    def _queue_purge(self, frame_in):
+        queue = self.broker.get_queue(text(frame_in.queue))
+        message_count = len(queue.messages)
+        queue.messages.clear()
+        self._reply(frame_in,
+                    pamqp_spec.Queue.PurgeOk(message_count=message_count))
+
+    def _queue_delete(self, frame_in):
+        queue = self.broker.queues.get(text(frame_in.queue))
+        message_count = 0
+        if queue is not None:
+            if frame_in.if_unused and queue.consumers:
+                raise ChannelError(PRECONDITION_FAILED,
+                                   "PRECONDITION_FAILED - queue '%s' in use"
+                                   % queue.name)
+            elif frame_in.if_empty and queue.messages:
+                raise ChannelError(PRECONDITION_FAILED,
+                                   "PRECONDITION_FAILED - queue '%s' not "
+                                   "empty" % queue.name)
+            message_count = len(queue.messages)
+            self.broker.delete_queue(queue)
+        self._reply(frame_in,
+                    pamqp_spec.Queue.DeleteOk(message_count=message_count))
+
+    def _basic_qos(self, frame_in):
+        self.prefetch_count = frame_in.prefetch_count
+        self.connection.send(self.channel_id, pamqp_spec.Basic.QosOk())
+        for consumer in list(self.consumers.values()):
+            self.broker.dispatch(consumer.queue)
+
+    def _basic_consume(self, frame_in):
+        queue = self.broker.get_queue(text(frame_in.queue))
+        consumer_tag = text(frame_in.consumer_tag) or \
+            self.broker.next_name('amq.ctag')
+        if consumer_tag in self.consumers:
+            raise ChannelError(NOT_ALLOWED, "NOT_ALLOWED - attempt to reuse "
+                                            "consumer tag '%s'" %
+                               consumer_tag)
+        consumer = Consumer(self, queue, consumer_tag, frame_in.no_ack)
+        self.consumers[consumer_tag] = consumer
+        queue.consumers.append(consumer)
+        self._reply(frame_in,
+                    pamqp_spec.Basic.ConsumeOk(consumer_tag=consumer_tag))
+        self.broker.dispatch(queue)
+
+    def _basic_cancel(self, frame_in):
+        consumer_tag = text(frame_in.consumer_tag)
+        self.cancel(consumer_tag)
+        self._reply(frame_in,
+                    pamqp_spec.Basic.CancelOk(consumer_tag=consumer_tag))
+
+    def _basic_get(self, frame_in):
+        queue = self.broker.get_queue(text(frame_in.queue))
+        if not queue.messages:
+            self.connection.send(self.channel_id, pamqp_spec.Basic.GetEmpty())
+            return
+        message, redelivered = queue.messages.popleft()
+        delivery_tag = next(self._delivery_tags)
+        if not frame_in.no_ack:
+            self.unacked[delivery_tag] = (queue, message)
+        get_ok = pamqp_spec.Basic.GetOk(delivery_tag=delivery_tag,
+                                        redelivered=redelivered,
+                                        exchange=message.exchange,
+                                        routing_key=message.routing_key,
+                                        message_count=len(queue.messages))
+        self.connection.send_content(self.channel_id, get_ok, message)
+        self.broker.delivered += 1
+
+    def _basic_ack(self, frame_in):
+        self._settle(frame_in.delivery_tag, frame_in.multiple)
+
+    def _basic_nack(self, frame_in):
+        self._settle(frame_in.delivery_tag, frame_in.multiple,
+                     requeue=frame_in.requeue)
+
+    def _basic_reject(self, frame_in):
+        self._settle(frame_in.delivery_tag, False, requeue=frame_in.requeue)
+
+    def _basic_recover(self, frame_in):
+        self._requeue(list(self.unacked))
+        self.connection.send(self.channel_id, pamqp_spec.Basic.RecoverOk())
+
+    def _basic_publish(self, frame_in):
+        self._publish = frame_in
+        self._header = None
+        self._body = []
+        self._body_size = 0
+
+    def _confirm_select(self, frame_in):
+        self.confirm = True
+        self._reply(frame_in, pamqp_spec.Confirm.SelectOk())
+
+    def _on_content_header(self, frame_in):
+        if self._publish is None:
+            raise ChannelError(505, 'UNEXPECTED_FRAME - content header')
+        self._header = frame_in
+        if not frame_in.body_size:
+            self._route()
+
+    def _on_content_body(self, frame_in):
+        if self._header is None:
+            raise ChannelError(505, 'UNEXPECTED_FRAME - content body')
+        self._body.append(frame_in.value)
+        self._body_size += len(frame_in.value)
+        if self._body_size >= self._header.body_size:
+            self._route()
+
+    def _route(self):
+        """Route a complete published message to its queues.
+
+        :return:
+        """
+        publish = self._publish
+        message = Message(text(publish.exchange), text(publish.routing_key),
+                          self._header.properties, b''.join(self._body))
+        self._publish = None
+        self._header = None
+        self._body = []
+        self.publish_count += 1
+        self.broker.published += 1
+        exchange = self.broker.get_exchange(message.exchange)
+        queues = self.broker.route(exchange, message.routing_key,
+                                   message.properties.headers or {})
+        if not queues and publish.mandatory:
+            frame_out = pamqp_spec.Basic.Return(
+                reply_code=NO_ROUTE, reply_text='NO_ROUTE',
+                exchange=message.exchange, routing_key=message.routing_key)
+            self.connection.send_content(self.channel_id, frame_out, message)
+        for queue in queues:
+            queue.messages.append((message, False))
+        if self.confirm:
+            self.connection.send(
+                self.channel_id,
+                pamqp_spec.Basic.Ack(delivery_tag=self.publish_count))
+        for queue in queues:
+            self.broker.dispatch(queue)
+
+    def _settle(self, delivery_tag, multiple, requeue=None):
+        """Acknowledge, or reject, delivered messages.
+
+        :param int delivery_tag:
+        :param bool multiple: Include every earlier delivery.
+        :param bool requeue: None for an ack, otherwise whether the
+                             rejected messages should be requeued.
+        :raises ChannelError: Unknown delivery tag.
+        :return:
+        """
+        if multiple:
+            delivery_tags = [tag for tag in self.unacked
+                             if not delivery_tag or tag <= delivery_tag]
+        elif delivery_tag in self.unacked:
+            delivery_tags = [delivery_tag]
+        else:
+            raise ChannelError(PRECONDITION_FAILED,
+                               'PRECONDITION_FAILED - unknown delivery tag '
+                               '%d' % delivery_tag)
+        if requeue:
+            self._requeue(delivery_tags)
+            return
+        queues = set()
+        for tag in delivery_tags:
+            queues.add(self.unacked.pop(tag)[0])
+        for queue in queues:
+            self.broker.dispatch(queue)
+
+    def _requeue(self, delivery_tags):
+        """Put unacknowledged messages back at the front of their queues.
+
+        :param list delivery_tags:
+        :return:
+        """
+        queues = set()
+        for tag in reversed(delivery_tags):
+            queue, message = self.unacked.pop(tag)
+            queue.messages.appendleft((message, True))
+            queues.add(queue)
+        for queue in queues:
+            if queue.name in self.broker.queues:
+                self.broker.dispatch(queue)
+
+
+class BrokerConnection(object):
+    """Server side of a client connection, served by its own thread."""
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.socket = sock
+        self.frame_max = FRAME_MAX
+        self.heartbeat = 0
+        self.channels = {}
+        self.is_open = True
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=__name__)
+        self._thread.daemon = True
+
+    def start(self):
+        """Start serving the connection.
+
+        :return:
+        """
+        self._thread.start()
+
+    def close(self):
+        """Close the connection without a handshake.
+
+        :return:
+        """
+        self.is_open = False
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+
+    def send(self, channel_id, *frames):
+        """Send one or more frames.
+
+        :param int channel_id:
+        :return:
+        """
+        data = b''.join(pamqp_frame.marshal(frame_out, channel_id)
+                        for frame_out in frames)
+        with self._write_lock:
+            try:
+                self.socket.sendall(data)
+            except (socket.error, OSError) as why:
+                LOGGER.debug('Failed to send to client: %s', why)
+                self.close()
+
+    def send_content(self, channel_id, frame_out, message):
+        """Send a method frame followed by the message content.
+
+        :param int channel_id:
+        :param frame_out: Basic.Deliver, Basic.GetOk or Basic.Return
+        :param Message message:
+        :return:
+        """
+        frames = [frame_out,
+                  pamqp_header.ContentHeader(body_size=len(message.body),
+                                             properties=message.properties)]
+        chunk_size = self.frame_max - 8
+        for offset in range(0, len(message.body), chunk_size):
+            frames.append(pamqp_body.ContentBody(
+                message.body[offset:offset + chunk_size]))
+        self.send(channel_id, *frames)
+
+    def _run(self):
+        """Read and handle incoming frames until the connection closes.
+
+        :return:
+        """
+        buffer = b''
+        try:
+            while self.is_open:
+                timeout = self.heartbeat / 2.0 if self.heartbeat else None
+                ready, _, _ = select.select([self.socket], [], [], timeout)
+                if not ready:
+                    self.send(0, pamqp_heartbeat.Heartbeat())
+                    continue
+                data = self.socket.recv(RECEIVE_SIZE)
+                if not data:
+                    break
+                buffer = self._read_frames(buffer + data)
+        except (socket.error, select.error, OSError, ValueError) as why:
+            if self.is_open:
+                LOGGER.debug('Client connection failed: %s', why)
+        finally:
+            self.is_open = False
+            with self.broker.lock:
+                for channel in self.channels.values():
+                    channel.close()
+                self.channels.clear()
+            self.broker.remove_connection(self)
+            self.socket.close()
+
+    def _read_frames(self, buffer):
+        """Handle every complete frame in the buffer.
+
+        :param bytes buffer:
+        :return: The remaining, incomplete, data.
+        :rtype: bytes
+        """
+        offset = 0
+        while len(buffer) - offset >= 8:
+            if buffer.startswith(b'AMQP', offset):
+                frame_size = 8
+            else:
+                frame_size = BODY_FRAME_HEADER.unpack_from(
+                    buffer, offset)[2] + 8
+                if len(buffer) - offset < frame_size:
+                    break
+            _, channel_id, frame_in = pamqp_frame.unmarshal(
+                buffer[offset:offset + frame_size])
+            offset += frame_size
+            with self.broker.lock:
+                self._on_frame(channel_id, frame_in)
+            if not self.is_open:
+                break
+        return buffer[offset:]
+
+    def _on_frame(self, channel_id, frame_in):
+        """Direct a frame to the connection, or one of its channels.
+
+        :param int channel_id:
+        :param frame_in: Amqp frame.
+        :return:
+        """
+        if channel_id == 0:
+            self._on_connection_frame(frame_in)
+        elif frame_in.name == 'Channel.Open':
+            self.channels[channel_id] = BrokerChannel(self, channel_id)
+            self.send(channel_id, pamqp_spec.Channel.OpenOk())
+        elif channel_id not in self.channels:
+            LOGGER.debug('Frame on closed channel %d: %s', channel_id,
+                         frame_in.name)
+        elif frame_in.name == 'Channel.Close':
+            self.channels.pop(channel_id).close()
+            self.send(channel_id, pamqp_spec.Channel.CloseOk())
+        else:
+            try:
+                self.channels[channel_id].on_frame(frame_in)
+            except ChannelError as why:
+                LOGGER.debug('Closing channel %d: %s', channel_id,
+                             why.reply_text)
+                self.channels.pop(channel_id).close()
+                self.send(channel_id, pamqp_spec.Channel.Close(
+                    reply_code=why.reply_code, reply_text=why.reply_text))
+
+    def _on_connection_frame(self, frame_in):
+        """Handle the connection handshake, and connection close.
+
+        :param frame_in: Amqp frame.
+        :return:
+        """
+        if isinstance(frame_in, pamqp_header.ProtocolHeader):
+            self.send(0, pamqp_spec.Connection.Start(server_properties={
+                'product': 'AMQP-Storm FakeBroker',
+                'capabilities': {
+                    'basic.nack': True,
+                    'publisher_confirms': True,
+                    'consumer_cancel_notify': True,
+                    'exchange_exchange_bindings': True
+                }
+            }))
+        elif frame_in.name == 'Connection.StartOk':
+            self.send(0, pamqp_spec.Connection.Tune(frame_max=FRAME_MAX))
+        elif frame_in.name == 'Connection.TuneOk':
+            self.frame_max = frame_in.frame_max or FRAME_MAX
+            self.heartbeat = frame_in.heartbeat
+        elif frame_in.name == 'Connection.Open':
+            self.send(0, pamqp_spec.Connection.OpenOk())
+        elif frame_in.name == 'Connection.Close':
+            self.send(0, pamqp_spec.Connection.CloseOk())
+            self.close()
+        elif frame_in.name == 'Connection.CloseOk':
+            self.close()
+
+
+def topic_match(words, keys):
+    """Does a routing key match a topic binding key.
+
+        * matches exactly one word, and # matches zero or more words.
+
+    :param list words: Binding key, split on dots.
+    :param list keys: Routing key, split on dots.
+    :rtype: bool
+    """
+    if not words:
+        return not keys
+    elif words[0] == '#':
+        return any(topic_match(words[1:], keys[index:])
+                   for index in range(len(keys) + 1))
+    elif not keys:
+        return False
+    elif words[0] in ('*', keys[0]):
+        return topic_match(words[1:], keys[1:])
+    return False
+
+
+def headers_match(arguments, headers):
+    """Do the message headers match the arguments of a headers binding.
+
+    :param dict arguments: Binding arguments, including x-match.
+    :param dict headers: Message headers.
+    :rtype: bool
+    """
+    arguments = dict((text(key), value) for key, value in arguments.items())
+    headers = dict((text(key), value) for key, value in headers.items())
+    match_any = text(arguments.pop('x-match', 'all')) == 'any'
+    matches = [key in headers and headers[key] == value
+               for key, value in arguments.items()
+               if not key.startswith('x-')]
+    return any(matches) if match_any else all(matches)
+
+
+def text(value):
+    """pamqp decodes short strings as bytes.
+
+    :param bytes|str value:
+    :rtype: str
+    """
+    return compatibility.try_utf8_decode(value) if value else ''
@@ -0,0 +1,106 @@
+"""AMQP-Storm Connection.Heartbeat."""
+__author__ = 'eandersson'
+
+import logging
+import threading
+from time import time
+
+
+LOGGER = logging.getLogger(__name__)
+CHECK_INTERVAL = 1
+
+
+class Heartbeat(object):
+    """Client side Heartbeat monitor and sender.
+
+        This does not run its own thread. check is called periodically
+        by whatever is processing the inbound traffic of the connection
+        (the inbound thread, or a shared Reactor).
+    """
+
+    def __init__(self, io, send_heartbeat_impl, on_timeout):
+        """
+        :param IO io: The IO instance to monitor.
+        :param function send_heartbeat_impl: Sends a heartbeat frame.
+        :param function on_timeout: Called with the reason when the
+                                    connection is considered dead.
+        """
+        self.lock = threading.Lock()
+        self.interval = 0
+        self._io = io
+        self._send_heartbeat_impl = send_heartbeat_impl
+        self._on_timeout = on_timeout
+        self._running = False
+        self._next_check = 0
+        self._last_inbound = 0
+        self._last_outbound = 0
+        self._bytes_received = 0
+        self._bytes_written = 0
+
+    @property
+    def is_running(self):
+        """Is the Heartbeat monitor running.
+
+        :rtype: bool
+        """
+        return self._running
+
+    def start(self, interval):
+        """Start monitoring the connection.
+
+        :param int interval: Negotiated heartbeat interval in seconds.
+        :return:
+        """
+        with self.lock:
+            self.interval = interval
+            if not interval:
+                self._running = False
+                return
+            now = time()
+            self._next_check = now + CHECK_INTERVAL
+            self._last_inbound = now
+            self._last_outbound = now
+            self._bytes_received = self._io.receive_bytes
+            self._bytes_written = self._io.write_bytes
+            self._running = True
+        LOGGER.debug('Heartbeat started with an interval of %ds', interval)
+
+    def stop(self):
+        """Stop monitoring the connection.
+
+        :return:
+        """
+        self._running = False
+
+    def check(self):
+        """Send a heartbeat if nothing has been written for half the
+        interval, and declare the connection dead if nothing has been
+        received for twice the interval.
+
+        :return:
+        """
+        if not self._running:
+            return
+        now = time()
+        if now < self._next_check:
+            return
+        with self.lock:
+            if not self._running:
+                return
+            self._next_check = now + CHECK_INTERVAL
+            if self._io.receive_bytes != self._bytes_received:
+                self._bytes_received = self._io.receive_bytes
+                self._last_inbound = now
+            if self._io.write_bytes != self._bytes_written:
+                self._bytes_written = self._io.write_bytes
+                self._last_outbound = now
+            is_dead = now - self._last_inbound >= self.interval * 2
+            is_idle = now - self._last_outbound >= self.interval / 2.0
+            if is_dead:
+                self._running = False
+        if is_dead:
+            message = 'Connection dead, no heartbeat or data received ' \
+                      'in >= {0!s}s'.format(self.interval * 2)
+            self._on_timeout(message)
+        elif is_idle:
+            self._send_heartbeat_impl()
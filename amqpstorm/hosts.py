@@ -0,0 +1,278 @@
+"""AMQP-Storm Host Selection."""
+__author__ = 'eandersson'
+
+import os
+import select
+import socket
+import logging
+import threading
+from time import time
+from errno import EAGAIN
+from errno import EINPROGRESS
+from errno import EWOULDBLOCK
+
+from amqpstorm import compatibility
+from amqpstorm.exception import AMQPConnectionError
+
+
+LOGGER = logging.getLogger(__name__)
+CONNECTION_ATTEMPT_DELAY = 0.25
+FAILURE_PENALTY = 30
+LATENCY_WEIGHT = 0.3
+CONNECT_PENDING = (0, EINPROGRESS, EWOULDBLOCK, EAGAIN, 10035)
+
+
+def parse_hosts(hostname, port):
+    """Parse one or more hosts into a list of (host, port) tuples.
+
+        Each host may be a hostname, "hostname:port", "[ipv6]:port"
+        or a (hostname, port) tuple. Hosts without a port use the
+        default port.
+
+    :param str|list hostname: One or more hosts.
+    :param int port: Default port.
+    :rtype: list
+    """
+    if compatibility.is_string(hostname):
+        hostname = [hostname]
+    hosts = []
+    for host in hostname:
+        if isinstance(host, tuple):
+            hosts.append((host[0], int(host[1])))
+        elif host.startswith('['):
+            address, _, host_port = host[1:].partition(']')
+            hosts.append((address, int(host_port[1:] or port)))
+        elif host.count(':') == 1:
+            address, host_port = host.split(':')
+            hosts.append((address, int(host_port or port)))
+        else:
+            hosts.append((host, port))
+    return hosts
+
+
+class HostLatency(object):
+    """Measured connect latency of each broker host.
+
+        The latency is a moving average of the time it took to connect
+        (and complete the TLS handshake). Hosts without any measurements
+        are tried first, so that a faster host is discovered even after
+        a slower one has been measured, and hosts that recently failed
+        are tried last. Otherwise hosts keep the order they were given in.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._latency = {}
+        self._failed = {}
+
+    def latency(self, host, port):
+        """Get the measured latency of a host.
+
+        :param str host:
+        :param int port:
+        :return: Latency in seconds, or None if never measured.
+        :rtype: float|None
+        """
+        return self._latency.get((host, port))
+
+    def record(self, host, port, seconds):
+        """Record a successful connect.
+
+        :param str host:
+        :param int port:
+        :param float seconds: Time spent connecting.
+        :return:
+        """
+        key = (host, port)
+        with self.lock:
+            self._failed.pop(key, None)
+            previous = self._latency.get(key)
+            if previous is not None:
+                seconds = (previous * (1 - LATENCY_WEIGHT) +
+                           seconds * LATENCY_WEIGHT)
+            self._latency[key] = seconds
+
+    def record_failure(self, host, port):
+        """Record a failed connect.
+
+        :param str host:
+        :param int port:
+        :return:
+        """
+        with self.lock:
+            self._failed[(host, port)] = time() + FAILURE_PENALTY
+
+    def sort(self, hosts):
+        """Sort hosts by preference.
+
+        :param list hosts: List of (host, port) tuples.
+        :rtype: list
+        """
+        now = time()
+
+        def preference(item):
+            index, host = item
+            failed = self._failed.get(host, 0) > now
+            latency = self._latency.get(host)
+            return (failed, latency is not None, latency or 0, index)
+
+        return [host for _, host in sorted(enumerate(hosts), key=preference)]
+
+    def clear(self):
+        """Forget all measurements.
+
+        :return:
+        """
+        with self.lock:
+            self._latency.clear()
+            self._failed.clear()
+
+
+HOST_LATENCY = HostLatency()
+
+
+def resolve(hosts):
+    """Resolve hosts to a list of socket addresses.
+
+        The addresses of each host are interleaved by address family, so
+        that a broken IPv6 (or IPv4) route does not delay the other.
+
+    :param list hosts: List of (host, port) tuples.
+    :raises AMQPConnectionError: None of the hosts could be resolved.
+    :rtype: list
+    """
+    addresses = []
+    errors = []
+    for host, port in hosts:
+        try:
+            address_info = socket.getaddrinfo(host, port, 0,
+                                              socket.SOCK_STREAM)
+        except socket.gaierror as why:
+            HOST_LATENCY.record_failure(host, port)
+            errors.append('{0!s}:{1!s}: {2!s}'.format(host, port, why))
+            continue
+        for info in _interleave(address_info):
+            addresses.append(((host, port), info))
+    if not addresses:
+        raise AMQPConnectionError('; '.join(errors))
+    return addresses
+
+
+def connect(addresses, create_socket, timeout=None,
+            attempt_delay=CONNECTION_ATTEMPT_DELAY):
+    """Connect to the first address that answers.
+
+        A new connection attempt is started every attempt_delay seconds,
+        or as soon as the previous attempt failed, without cancelling the
+        attempts already in progress (Happy Eyeballs, RFC 8305). The first
+        attempt to succeed wins, and the others are closed. The connect
+        time of other attempts that had connected by then is recorded as
+        well, as their hosts would otherwise never be measured.
+
+    :param list addresses: List of ((host, port), address_info) tuples.
+    :param function create_socket: Create a socket for an address family.
+    :param int|float timeout: Give up after this many seconds.
+    :raises AMQPConnectionError: None of the addresses could be reached.
+    :return: The connected socket, the (host, port) it is connected to
+             and the time it took to connect.
+    :rtype: tuple
+    """
+    queue = list(addresses)
+    pending = {}
+    errors = []
+    start_time = time()
+    next_attempt = start_time
+    try:
+        while queue or pending:
+            now = time()
+            if timeout and now - start_time >= timeout:
+                errors.append('connection timed out')
+                break
+            if queue and (now >= next_attempt or not pending):
+                host, address_info = queue.pop(0)
+                sock = create_socket(address_info[0])
+                sock.setblocking(0)
+                error = sock.connect_ex(address_info[4])
+                if error not in CONNECT_PENDING:
+                    _failed(sock, host, error, errors)
+                    continue
+                pending[sock] = (host, now)
+                next_attempt = now + attempt_delay
+            wait = next_attempt - time() if queue else None
+            if timeout:
+                remaining = start_time + timeout - time()
+                wait = remaining if wait is None else min(wait, remaining)
+            if wait is not None:
+                wait = max(wait, 0)
+            _, writable, _ = select.select([], list(pending), [], wait)
+            for sock in writable:
+                host, started = pending.pop(sock)
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if error:
+                    _failed(sock, host, error, errors)
+                    continue
+                _record_connected(pending, host)
+                return sock, host, time() - started
+    finally:
+        for sock in pending:
+            sock.close()
+    raise AMQPConnectionError('could not connect to any host: ' +
+                              '; '.join(errors))
+
+
+def _failed(sock, host, error, errors):
+    """Close a socket that failed to connect, and remember why.
+
+    :param socket sock:
+    :param tuple host: (host, port)
+    :param int error: Socket error number.
+    :param list errors: List of error messages.
+    :return:
+    """
+    sock.close()
+    HOST_LATENCY.record_failure(*host)
+    errors.append('{0!s}:{1!s}: {2!s}'.format(host[0], host[1],
+                                              os.strerror(error)))
+
+
+def _record_connected(pending, winner):
+    """Record the connect time of the attempts that lost the race, but
+    did connect.
+
+    :param dict pending: Sockets still connecting, and their
+                         ((host, port), start time).
+    :param tuple winner: (host, port) that won the race.
+    :return:
+    """
+    if not pending:
+        return
+    now = time()
+    _, writable, _ = select.select([], list(pending), [], 0)
+    for sock in writable:
+        host, started = pending[sock]
+        if host == winner:
+            continue
+        elif sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            continue
+        HOST_LATENCY.record(host[0], host[1], now - started)
+
+
+def _interleave(address_info):
+    """Alternate between address families, keeping the resolver order.
+
+    :param list address_info: Result from getaddrinfo.
+    :rtype: list
+    """
+    families = []
+    by_family = {}
+    for info in address_info:
+        if info[0] not in by_family:
+            families.append(info[0])
+            by_family[info[0]] = []
+        by_family[info[0]].append(info)
+    result = []
+    while any(by_family.values()):
+        for family in families:
+            if by_family[family]:
+                result.append(by_family[family].pop(0))
+    return result
@@ -5,13 +5,23 @@ import select
 import socket
 import logging
 import threading
+from time import time
 from time import sleep
 from errno import EINTR
+from errno import EAGAIN
 from errno import EWOULDBLOCK
 
 from amqpstorm.base import Stateful
 from amqpstorm.base import IDLE_WAIT
 from amqpstorm.base import FRAME_MAX
+from amqpstorm.hosts import HOST_LATENCY
+from amqpstorm.hosts import parse_hosts
+from amqpstorm.hosts import resolve
+from amqpstorm.hosts import connect
+from amqpstorm.tls import CONTEXT_CACHE
+from amqpstorm.tls import SESSION_CACHE
+from amqpstorm.tls import DEFAULT_SSL_VERSION
+from amqpstorm.metrics import Metrics
 from amqpstorm.exception import AMQPConnectionError
 
 try:
@@ -22,16 +32,18 @@ except ImportError:
 
 EMPTY_BUFFER = bytes()
 LOGGER = logging.getLogger(__name__)
+MIN_RECEIVE_SIZE = 4096
+MAX_RECEIVE_SIZE = FRAME_MAX * 8
+RECEIVE_BYTE_BUDGET = MAX_RECEIVE_SIZE * 4
+RECEIVE_TIME_BUDGET = IDLE_WAIT
+IOV_MAX = 1024
+WOULD_BLOCK = (EWOULDBLOCK, EAGAIN)
+SSL_WANT_ERRORS = ()
+# TLS sessions can only be resumed on Python 3.6+.
+SSL_SESSIONS = bool(ssl) and hasattr(ssl, 'SSLSession')
 
-if ssl:
-    if hasattr(ssl, 'PROTOCOL_TLSv1_2'):
-        DEFAULT_SSL_VERSION = ssl.PROTOCOL_TLSv1_2
-    elif hasattr(ssl, 'PROTOCOL_TLSv1_1'):
-        DEFAULT_SSL_VERSION = ssl.PROTOCOL_TLSv1_1
-    elif hasattr(ssl, 'PROTOCOL_TLSv1'):
-        DEFAULT_SSL_VERSION = ssl.PROTOCOL_TLSv1
-    elif hasattr(ssl, 'PROTOCOL_SSLv3'):
-        DEFAULT_SSL_VERSION = ssl.PROTOCOL_SSLv3
+if ssl and hasattr(ssl, 'SSLWantReadError'):
+    SSL_WANT_ERRORS = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
 
 
 class Poller(object):
@@ -63,43 +75,342 @@ class Poller(object):
             if why.args[0] != EINTR:
                 raise
 
+    @property
+    def is_readable(self):
+        """Is there data to read, without waiting for it.
+
+            Unlike is_ready, this does not wait for the timeout when the
+            socket is not writable, e.g. while another thread is stuck
+            writing to a peer that stopped reading.
+
+        :rtype: bool
+        """
+        try:
+            ready, _, _ = select.select([self.fileno], [], [], 0)
+            return bool(ready)
+        except select.error as why:
+            if why.args[0] != EINTR:
+                raise
+            return False
+
+
+class Reactor(object):
+    """Shared inbound IO thread.
+
+        Multiplexes the inbound traffic of any number of connections using
+        a single thread, and a single epoll instance when available.
+
+        e.g.
+            reactor = Reactor()
+            connection = Connection('localhost', 'guest', 'guest',
+                                    reactor=reactor)
+    """
+
+    def __init__(self, timeout=1):
+        """
+        :param int|float timeout: Maximum time to block waiting for events.
+        """
+        self.lock = threading.Lock()
+        self.timeout = timeout
+        self._handlers = {}
+        self._thread = None
+        self._epoll = None
+        if hasattr(select, 'epoll'):
+            self._epoll = select.epoll()
+
+    @property
+    def connections(self):
+        """Number of IO instances registered.
+
+        :rtype: int
+        """
+        return len(self._handlers)
+
+    @property
+    def is_running(self):
+        """Is the Reactor thread running.
+
+        :rtype: bool
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def register(self, io):
+        """Start processing incoming data for an IO instance.
+
+        :param IO io:
+        :return:
+        """
+        fileno = io.socket.fileno()
+        with self.lock:
+            self._handlers[fileno] = io
+            if self._epoll:
+                self._epoll.register(fileno, select.EPOLLIN)
+            if not self.is_running:
+                self._thread = threading.Thread(target=self._run,
+                                                name=__name__)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def unregister(self, io):
+        """Stop processing incoming data for an IO instance.
+
+            This needs to be called before the socket is closed.
+
+        :param IO io:
+        :return:
+        """
+        with self.lock:
+            for fileno, handler in list(self._handlers.items()):
+                if handler is not io:
+                    continue
+                del self._handlers[fileno]
+                if self._epoll:
+                    try:
+                        self._epoll.unregister(fileno)
+                    except (IOError, OSError, ValueError):
+                        pass
+
+    def _run(self):
+        """Dispatch incoming data until there are no connections left.
+
+        :return:
+        """
+        while True:
+            with self.lock:
+                if not self._handlers:
+                    self._thread = None
+                    break
+                handlers = list(self._handlers.items())
+            # Data already decrypted by an SSL socket is never reported
+            # by epoll/select, so process it without waiting.
+            buffered = [fileno for fileno, handler in handlers
+                        if handler.pending()]
+            ready = set(self._poll(0 if buffered else self.timeout))
+            ready.update(buffered)
+            for fileno in ready:
+                handler = self._handlers.get(fileno)
+                if handler is None:
+                    continue
+                try:
+                    handler.process_readable()
+                except Exception as why:
+                    LOGGER.error('Unhandled exception in Reactor: %s', why,
+                                 exc_info=True)
+            for handler in list(self._handlers.values()):
+                if handler.on_tick:
+                    handler.on_tick()
+
+    def _poll(self, timeout):
+        """Wait for any registered socket to become readable.
+
+        :param int|float timeout: Maximum time to wait.
+        :rtype: list
+        """
+        try:
+            if self._epoll:
+                return [fileno for fileno, _ in
+                        self._epoll.poll(timeout)]
+            ready, _, _ = select.select(list(self._handlers), [], [],
+                                        timeout)
+            return ready
+        except (select.error, IOError, OSError, ValueError) as why:
+            if why.args and why.args[0] == EINTR:
+                return []
+            # A socket was most likely closed while we were waiting.
+            LOGGER.debug('Reactor poll failed: %s', why)
+            sleep(IDLE_WAIT)
+            return []
+
+
+class Transport(object):
+    """Opens the socket used by a connection.
+
+        Subclasses implement connect, and return a connected socket and
+        the address it is connected to.
+    """
+    name = None
+    supports_ssl = False
+
+    def connect(self, io, hostname, port):
+        """Open a connected socket.
+
+        :param IO io: The IO instance that the socket is opened for.
+        :param str|list hostname:
+        :param int port:
+        :raises AMQPConnectionError: Could not connect.
+        :rtype: tuple
+        """
+        raise NotImplementedError
+
+
+class TCPTransport(Transport):
+    """TCP, with optional SSL.
+
+        When given more than one host, every resolved address of every
+        host is tried in a staggered fashion, starting with the host
+        that has the lowest measured connect latency.
+    """
+    name = 'tcp'
+    supports_ssl = True
+
+    def connect(self, io, hostname, port):
+        hosts = HOST_LATENCY.sort(parse_hosts(hostname, port))
+        sock, address, latency = connect(resolve(hosts), io._create_socket,
+                                         timeout=io.parameters['timeout'])
+        sock.settimeout(io.parameters['timeout'] or None)
+        if io.parameters['ssl']:
+            try:
+                sock = io._ssl_wrap_socket(sock, *address)
+            except (socket.error, ssl.SSLError) as why:
+                sock.close()
+                HOST_LATENCY.record_failure(*address)
+                raise AMQPConnectionError(why)
+            latency += io.handshake_time
+            # Reads and writes retry on SSLWantRead/SSLWantWrite instead,
+            # so that a partial TLS record never blocks the inbound thread.
+            sock.setblocking(0)
+        HOST_LATENCY.record(address[0], address[1], latency)
+        LOGGER.debug('Connected to %s:%d in %.3fs', address[0], address[1],
+                     latency)
+        return sock, address
+
+
+class UnixTransport(Transport):
+    """Unix domain socket, e.g. to a broker, or proxy, on the same host.
+
+        Avoids the TCP/IP stack entirely, which is noticeably cheaper
+        than TCP over the loopback interface.
+    """
+    name = 'unix'
+
+    def __init__(self, path):
+        """
+        :param str path: Path of the Unix domain socket.
+        """
+        self.path = path
+
+    def connect(self, io, hostname, port):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise AMQPConnectionError('Unix domain sockets are not '
+                                      'supported on this platform')
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(io.parameters['timeout'] or None)
+        try:
+            sock.connect(self.path)
+        except socket.error as why:
+            sock.close()
+            raise AMQPConnectionError('could not connect to %s: %s' %
+                                      (self.path, why))
+        LOGGER.debug('Connected to %s', self.path)
+        return sock, (self.path, 0)
+
+
+class SocketPairTransport(Transport):
+    """In-process transport using a connected pair of sockets.
+
+        The other end of each pair is passed to on_connect, which is
+        expected to serve it, e.g. from a thread. Nothing leaves the
+        process, which also makes benchmarks deterministic.
+
+        e.g.
+            transport = SocketPairTransport(on_connect=broker.serve)
+            connection = Connection('localhost', 'guest', 'guest',
+                                    transport=transport)
+    """
+    name = 'socketpair'
+
+    def __init__(self, on_connect=None):
+        """
+        :param function on_connect: Called with the peer socket of every
+                                    new connection.
+        """
+        self.on_connect = on_connect
+        self.peer = None
+
+    def connect(self, io, hostname, port):
+        sock, self.peer = socket.socketpair()
+        sock.settimeout(io.parameters['timeout'] or None)
+        if self.on_connect:
+            self.on_connect(self.peer)
+        return sock, ('socketpair', 0)
+
+
+TCP_TRANSPORT = TCPTransport()
+
 
 class IO(Stateful):
     lock = threading.Lock()
     socket = None
     poller = None
+    address = None
     buffer = EMPTY_BUFFER
+    handshake_time = 0.0
+    session_reused = False
+    _ssl_context = None
 
-    def __init__(self, parameters, on_read=None, on_error=None):
+    def __init__(self, parameters, on_read=None, on_error=None, reactor=None,
+                 on_tick=None, metrics=None):
         super(IO, self).__init__()
         self.parameters = parameters
+        self.metrics = metrics or Metrics()
         self.on_read = on_read
         self.on_error = on_error
+        self.on_tick = on_tick
+        self.reactor = reactor
+        self.write_bytes = 0
+        self._write_lock = threading.Lock()
+        self.receive_size = FRAME_MAX
+        self.receive_calls = 0
+        self.receive_bytes = 0
+        self.wakeups = 0
+
+    @property
+    def bytes_per_receive(self):
+        """Average number of bytes returned by each recv call.
+
+        :rtype: float
+        """
+        if not self.receive_calls:
+            return 0.0
+        return self.receive_bytes / float(self.receive_calls)
+
+    @property
+    def receives_per_wakeup(self):
+        """Average number of recv calls each time the socket was readable.
+
+        :rtype: float
+        """
+        if not self.wakeups:
+            return 0.0
+        return self.receive_calls / float(self.wakeups)
 
     def open(self, hostname, port):
         """Open Socket and establish a connection.
 
-        :param str hostname:
-        :param int port:
+            The socket is opened by the transport parameter, and defaults
+            to TCP.
+
+        :param str|list hostname: One or more hosts.
+        :param int port: Default port.
         :return:
         """
         self.buffer = EMPTY_BUFFER
         self.set_state(self.OPENING)
-        sock_address_tuple = self._get_socket_address(hostname, port)
-        sock = self._create_socket(socket_family=sock_address_tuple[0])
-        if self.parameters['ssl']:
-            if not ssl:
-                raise AMQPConnectionError('Python not compiled '
-                                          'with SSL support')
-            sock = self._ssl_wrap_socket(sock)
-        try:
-            sock.connect(sock_address_tuple[4])
-        except (socket.error, ssl.SSLError) as why:
-            raise AMQPConnectionError(why)
+        if self.parameters['ssl'] and not ssl:
+            raise AMQPConnectionError('Python not compiled '
+                                      'with SSL support')
+        transport = self.parameters.get('transport') or TCP_TRANSPORT
+        if self.parameters['ssl'] and not transport.supports_ssl:
+            raise AMQPConnectionError('ssl is not supported by the %s '
+                                      'transport' % transport.name)
+        sock, self.address = transport.connect(self, hostname, port)
         self.socket = sock
         self.poller = Poller(self.socket.fileno())
-        self._create_inbound_thread()
         self.set_state(self.OPEN)
+        if self.reactor:
+            self.reactor.register(self)
+        else:
+            self._create_inbound_thread()
 
     def close(self):
         """Close Socket.
@@ -109,6 +420,12 @@ class IO(Stateful):
         self.set_state(self.CLOSING)
         if not self.socket:
             return
+        if self.reactor:
+            self.reactor.unregister(self)
+        if self._ssl_context:
+            # TLS 1.3 sessions are only sent after the handshake.
+            SESSION_CACHE.store(self._ssl_context, self.address[0],
+                                self.address[1], self.socket)
         try:
             self.socket.shutdown(socket.SHUT_RDWR)
         except socket.error:
@@ -117,14 +434,64 @@ class IO(Stateful):
         self.socket = None
         self.set_state(self.CLOSED)
 
-    def write_to_socket(self, frame_data):
+    def write_to_socket(self, frame_data, blocking=True):
         """Write data to the socket.
 
-        :param str frame_data:
+            A list of buffers is written using a single vectored write
+            (sendmsg) when the socket supports it.
+
+        :param bytes|list frame_data:
+        :param bool blocking: Wait for other threads to finish writing,
+                              and for the socket to become writable.
+                              Otherwise nothing is written if either
+                              would have to wait.
+        :return: Bytes written, or None if nothing was written.
+        :rtype: int|None
+        """
+        if not self._write_lock.acquire(blocking):
+            return None
+        try:
+            if not self.poller.is_ready[1]:
+                if not blocking:
+                    return None
+                self._wait_until_writable()
+            if isinstance(frame_data, list):
+                if self._supports_vectored_write():
+                    total_bytes_written = self._write_vectored(frame_data)
+                    self.write_bytes += total_bytes_written
+                    return total_bytes_written
+                frame_data = EMPTY_BUFFER.join(frame_data)
+            total_bytes_written = self._write(frame_data)
+            self.write_bytes += total_bytes_written
+            return total_bytes_written
+        finally:
+            self._write_lock.release()
+
+    def _wait_until_writable(self):
+        """Wait for a full socket send buffer to drain, and record the
+        write stall.
+
         :return:
         """
+        start_time = time()
         while not self.poller.is_ready[1]:
             sleep(0.001)
+        self._record_write_stall(start_time)
+
+    def _record_write_stall(self, start_time):
+        """
+        :param float start_time: When the write stalled.
+        :return:
+        """
+        self.metrics.increment('write_stalls')
+        self.metrics.increment('write_stall_time', time() - start_time)
+
+    def _write(self, frame_data):
+        """Write a single buffer to the socket.
+
+        :param bytes frame_data:
+        :return:
+        """
         total_bytes_written = 0
         bytes_to_send = len(frame_data)
         while total_bytes_written < bytes_to_send:
@@ -134,34 +501,81 @@ class IO(Stateful):
                 if bytes_written == 0:
                     raise socket.error('connection/socket error')
                 total_bytes_written += bytes_written
+            except SSL_WANT_ERRORS as why:
+                self._wait_for_socket(isinstance(why, ssl.SSLWantReadError))
             except socket.timeout:
                 pass
             except socket.error as why:
-                if why.args[0] == EWOULDBLOCK:
+                if why.args[0] in WOULD_BLOCK:
+                    self._wait_for_socket()
                     continue
                 self.on_error(why)
                 break
         return total_bytes_written
 
-    @staticmethod
-    def _get_socket_address(hostname, port):
-        """Get Socket address information.
+    def _wait_for_socket(self, want_read=False):
+        """Wait for the socket to become writable, or readable when the
+        SSL layer needs to read before it can write.
 
-        :param str hostname:
-        :param int port:
-        :rtype: tuple
+        :param bool want_read:
+        :return:
         """
+        sock = self.socket
+        start_time = time()
         try:
-            addresses = socket.getaddrinfo(hostname, port)
-        except socket.gaierror as why:
-            raise AMQPConnectionError(why)
-        result = None
-        for address in addresses:
-            if not address:
+            if want_read:
+                select.select([sock], [], [], self.poller.timeout)
+            else:
+                select.select([], [sock], [], self.poller.timeout)
+        except (select.error, ValueError, TypeError):
+            # The socket was closed, the next write reports the error.
+            pass
+        self._record_write_stall(start_time)
+
+    def _supports_vectored_write(self):
+        """Can we use sendmsg to write to this socket.
+
+            SSL sockets do not implement sendmsg.
+
+        :rtype: bool
+        """
+        if not hasattr(self.socket, 'sendmsg'):
+            return False
+        return not (ssl and isinstance(self.socket, ssl.SSLSocket))
+
+    def _write_vectored(self, buffers):
+        """Write a list of buffers to the socket without joining them.
+
+        :param list buffers:
+        :return:
+        """
+        buffers = [memoryview(buf) for buf in buffers if len(buf)]
+        total_bytes_written = 0
+        index = 0
+        while index < len(buffers):
+            try:
+                bytes_written = \
+                    self.socket.sendmsg(buffers[index:index + IOV_MAX])
+                if bytes_written == 0:
+                    raise socket.error('connection/socket error')
+            except socket.timeout:
                 continue
-            result = address
-            break
-        return result
+            except socket.error as why:
+                if why.args[0] in WOULD_BLOCK:
+                    self._wait_for_socket()
+                    continue
+                self.on_error(why)
+                break
+            total_bytes_written += bytes_written
+            # Skip everything that was written, and keep the remainder
+            # of a partially written buffer.
+            while bytes_written:
+                if bytes_written < len(buffers[index]):
+                    buffers[index] = buffers[index][bytes_written:]
+                    break
+                bytes_written -= len(buffers[index])
+                index += 1
+        return total_bytes_written
 
     def _create_socket(self, socket_family):
         """Create Socket.
@@ -176,16 +590,44 @@ class IO(Stateful):
         sock.settimeout(self.parameters['timeout'] or None)
         return sock
 
-    def _ssl_wrap_socket(self, sock):
-        """Wrap SSLSocket around the socket.
+    def _ssl_wrap_socket(self, sock, host, port):
+        """Wrap SSLSocket around the socket, and perform the handshake.
+
+            The SSLContext is shared between connections with the same
+            SSL options, and the previous session with the host is
+            resumed when possible.
 
         :param socket sock:
+        :param str host:
+        :param int port:
         :return:
         """
-        if 'ssl_version' not in self.parameters['ssl_options']:
-            self.parameters['ssl_options']['ssl_version'] = DEFAULT_SSL_VERSION
-        return ssl.wrap_socket(sock, do_handshake_on_connect=True,
-                               **self.parameters['ssl_options'])
+        options = self.parameters['ssl_options']
+        start_time = time()
+        if not hasattr(ssl, 'SSLContext'):
+            if 'ssl_version' not in options:
+                options['ssl_version'] = DEFAULT_SSL_VERSION
+            sock = ssl.wrap_socket(sock, do_handshake_on_connect=True,
+                                   **options)
+            self.handshake_time = time() - start_time
+            SESSION_CACHE.record_handshake(self.handshake_time, False)
+            return sock
+        context = CONTEXT_CACHE.get(options)
+        kwargs = {}
+        if SSL_SESSIONS:
+            kwargs['session'] = SESSION_CACHE.get(context, host, port)
+        sock = context.wrap_socket(sock, do_handshake_on_connect=True,
+                                   server_hostname=host if ssl.HAS_SNI
+                                   else None, **kwargs)
+        self.handshake_time = time() - start_time
+        self.session_reused = SSL_SESSIONS and sock.session_reused
+        self._ssl_context = context
+        SESSION_CACHE.record_handshake(self.handshake_time,
+                                       self.session_reused)
+        SESSION_CACHE.store(context, host, port, sock)
+        LOGGER.debug('TLS handshake with %s:%d took %.3fs (resumed: %s)',
+                     host, port, self.handshake_time, self.session_reused)
+        return sock
 
     def _create_inbound_thread(self):
         """Internal Thread that handles all incoming traffic.
@@ -201,29 +643,122 @@ class IO(Stateful):
     def _process_incoming_data(self):
         """Retrieve and process any incoming data.
 
+            The thread stops as soon as the socket it was started for
+            has been closed, or replaced by a new connection.
+
         :return:
         """
-        while not self.is_closed:
+        sock = self.socket
+        while not self.is_closed and self.socket is sock:
             if self.is_closing:
                 break
-            if self.poller.is_ready[0]:
-                self.buffer += self._receive()
-                self.buffer = self.on_read(self.buffer)
+            if self.pending() or self.poller.is_readable:
+                self.process_readable()
+            if self.on_tick:
+                self.on_tick()
             sleep(IDLE_WAIT)
 
+    def process_readable(self):
+        """Read and process incoming data, once the socket is readable.
+
+            Keeps reading for as long as more data is available, up to
+            a byte and time budget, before the data is processed.
+
+        :return:
+        """
+        self.wakeups += 1
+        data_in = self._receive()
+        if data_in is None:
+            return
+        elif not data_in:
+            if self.reactor and not self.is_closed:
+                # A readable socket without any data has been closed.
+                self.on_error('connection/socket closed')
+            return
+        chunks = [data_in]
+        total_bytes = len(data_in)
+        deadline = time() + RECEIVE_TIME_BUDGET
+        # An SSL socket returns at most one TLS record per recv, and keeps
+        # the rest of the decrypted data buffered, so a short read does not
+        # mean that the socket has been drained.
+        tls = ssl and isinstance(self.socket, ssl.SSLSocket)
+        while True:
+            filled = tls or len(data_in) == self.receive_size
+            # Adapt once for every recv that returned data.
+            self._adapt_receive_size(len(data_in))
+            if total_bytes >= RECEIVE_BYTE_BUDGET or time() >= deadline:
+                break
+            elif not self.pending() and \
+                    not (filled and self._has_pending_data()):
+                break
+            data_in = self._receive()
+            if not data_in:
+                # Nothing more to read yet (e.g. an incomplete TLS record),
+                # or the socket was closed. Keep what was already read.
+                break
+            chunks.append(data_in)
+            total_bytes += len(data_in)
+        self.buffer += EMPTY_BUFFER.join(chunks)
+        self.buffer = self.on_read(self.buffer)
+
+    def _adapt_receive_size(self, bytes_received):
+        """Grow the receive size when recv fills it, and shrink it when
+        the incoming data is much smaller.
+
+        :param int bytes_received:
+        :return:
+        """
+        if bytes_received >= self.receive_size:
+            self.receive_size = min(self.receive_size * 2, MAX_RECEIVE_SIZE)
+        elif bytes_received < self.receive_size // 4:
+            self.receive_size = max(self.receive_size // 2, MIN_RECEIVE_SIZE)
+
+    def pending(self):
+        """Number of bytes that have already been received and decrypted
+        by the SSL layer, and can be read without the socket becoming
+        readable.
+
+        :rtype: int
+        """
+        sock = self.socket
+        if not ssl or not isinstance(sock, ssl.SSLSocket):
+            return 0
+        try:
+            return sock.pending()
+        except (socket.error, ValueError):
+            return 0
+
+    def _has_pending_data(self):
+        """Check, without blocking, if there is more data to read.
+
+        :rtype: bool
+        """
+        try:
+            ready, _, _ = select.select([self.socket.fileno()], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return False
+        return bool(ready)
+
     def _receive(self):
         """Receive any incoming socket data.
 
             If an error is thrown, handle it and return an empty string.
 
-        :return: buffer
-        :rtype: str
+        :return: buffer, or None if there was nothing to read yet (e.g. an
+                 incomplete TLS record).
+        :rtype: str|None
         """
         result = EMPTY_BUFFER
         try:
-            result = self.socket.recv(FRAME_MAX)
+            result = self.socket.recv(self.receive_size)
+            self.receive_calls += 1
+            self.receive_bytes += len(result)
+        except SSL_WANT_ERRORS:
+            return None
         except socket.timeout:
-            pass
+            return None
         except (socket.error, AttributeError) as why:
+            if getattr(why, 'args', None) and why.args[0] in WOULD_BLOCK:
+                return None
             self.on_error(why)
         return result
@@ -0,0 +1,383 @@
+"""AMQP-Storm Metrics."""
+__author__ = 'eandersson'
+
+import math
+import threading
+
+from amqpstorm.exception import AMQPInvalidArgument
+
+FRAMES_IN = 'frames_in'
+FRAMES_OUT = 'frames_out'
+DEFAULT_CONSUMER = 'default'
+
+# Message level counters, derived from the frame counters when a snapshot
+# is taken, so that recording them costs nothing extra.
+DERIVED_COUNTERS = (
+    ('publishes', FRAMES_OUT, ('Basic.Publish',)),
+    ('deliveries', FRAMES_IN, ('Basic.Deliver', 'Basic.GetOk')),
+    ('confirms_acked', FRAMES_IN, ('Basic.Ack',)),
+    ('confirms_nacked', FRAMES_IN, ('Basic.Nack',)),
+    ('acks', FRAMES_OUT, ('Basic.Ack',)),
+    ('nacks', FRAMES_OUT, ('Basic.Nack',)),
+    ('rejects', FRAMES_OUT, ('Basic.Reject',)),
+)
+
+# Latencies are recorded in microseconds. Each power of two is split into
+# 32 buckets, so a recorded value is off by at most 1/32 (about 3%).
+SUB_BUCKET_BITS = 6
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_LATENCY_BITS = 36
+HISTOGRAM_BUCKETS = (MAX_LATENCY_BITS - SUB_BUCKET_BITS + 2) << \
+    (SUB_BUCKET_BITS - 1)
+PERCENTILES = (('p50', 50), ('p90', 90), ('p99', 99), ('p999', 99.9))
+
+
+class Histogram(object):
+    """Latency histogram with a fixed number of log scale buckets.
+
+        Records anything from a microsecond up to about 19 hours, using
+        the same amount of memory regardless of how many values have been
+        recorded.
+    """
+
+    def __init__(self, counts=None, total=0.0):
+        """
+        :param list counts: Number of values recorded in each bucket.
+        :param float total: Sum of the recorded values, in seconds.
+        """
+        self.counts = counts or [0] * HISTOGRAM_BUCKETS
+        self.total = total
+
+    @property
+    def count(self):
+        """Number of recorded values.
+
+        :rtype: int
+        """
+        return sum(self.counts)
+
+    @property
+    def mean(self):
+        """Mean of the recorded values in seconds.
+
+        :rtype: float
+        """
+        count = self.count
+        if not count:
+            return 0.0
+        return self.total / count
+
+    @property
+    def max(self):
+        """Highest recorded value in seconds, rounded up to its bucket.
+
+        :rtype: float
+        """
+        for index in range(HISTOGRAM_BUCKETS - 1, -1, -1):
+            if self.counts[index]:
+                return _highest_value(index) / 1e6
+        return 0.0
+
+    def record(self, seconds):
+        """Record a value.
+
+        :param float seconds:
+        :return:
+        """
+        self.counts[_bucket(int(seconds * 1e6))] += 1
+        self.total += seconds
+
+    def percentile(self, percentile):
+        """The value that the given percentage of values are at or below.
+
+        :param float percentile: e.g. 99.9
+        :rtype: float
+        """
+        count = self.count
+        if not count:
+            return 0.0
+        target = max(int(math.ceil(percentile / 100.0 * count)), 1)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return _highest_value(index) / 1e6
+        return self.max
+
+    def cumulative_counts(self, bounds):
+        """Number of values at or below each bound, e.g. to export the
+        histogram using fixed buckets.
+
+            Values are counted in the first bound that is at or above
+            the highest value of their bucket.
+
+        :param list bounds: Ascending bounds in seconds.
+        :rtype: list
+        """
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            limit = bound * 1e6
+            while index < HISTOGRAM_BUCKETS and \
+                    _highest_value(index) <= limit:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def summary(self):
+        """Count, mean, max and percentiles in seconds.
+
+        :rtype: dict
+        """
+        summary = {'count': self.count, 'mean': self.mean, 'max': self.max}
+        for name, percentile in PERCENTILES:
+            summary[name] = self.percentile(percentile)
+        return summary
+
+    def add(self, other):
+        """Add the values recorded in another histogram.
+
+        :param Histogram other:
+        :return:
+        """
+        counts = self.counts
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                counts[index] += bucket_count
+        self.total += other.total
+
+    def subtract(self, other):
+        """Remove the values recorded in an earlier copy of this
+        histogram.
+
+        :param Histogram other:
+        :return:
+        """
+        counts = self.counts
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                counts[index] -= bucket_count
+        self.total -= other.total
+
+    def copy(self):
+        """
+        :rtype: Histogram
+        """
+        return Histogram(self.counts[:], self.total)
+
+
+class Metrics(object):
+    """Counters that are cheap enough to leave on in production.
+
+        Every thread increments its own set of counters, so recording
+        never takes a lock and never loses an update. The counters of
+        all threads are only added up when a snapshot is taken.
+
+        Counters named using a tuple, e.g. ('frames_in', 'Basic.Deliver'),
+        are grouped in the snapshot, e.g. {'frames_in': {'Basic.Deliver': 1}}.
+
+        Latencies are recorded in Histograms the same way.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._threads = []
+        self._retired = {}
+        self._retired_histograms = {}
+        self._baselines = {}
+
+    def increment(self, name, value=1):
+        """Increment a counter.
+
+        :param str|tuple name: Counter name.
+        :param int|float value:
+        :return:
+        """
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            counters = self._register_thread()[0]
+        counters[name] = counters.get(name, 0) + value
+
+    def record_latency(self, name, seconds):
+        """Record a latency.
+
+        :param str name: Histogram name, e.g. rpc.
+        :param float seconds:
+        :return:
+        """
+        try:
+            histograms = self._local.histograms
+        except AttributeError:
+            histograms = self._register_thread()[1]
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.record(seconds)
+
+    def snapshot(self):
+        """Current value of all counters.
+
+        :rtype: dict
+        """
+        totals = {}
+        with self.lock:
+            self._retire_threads()
+            for _, counters, _ in self._threads:
+                _add(totals, counters.copy())
+            _add(totals, self._retired)
+        snapshot = {FRAMES_IN: {}, FRAMES_OUT: {}}
+        for name, value in totals.items():
+            if isinstance(name, tuple):
+                snapshot.setdefault(name[0], {})[name[1]] = value
+                continue
+            snapshot[name] = value
+        return snapshot
+
+    def histograms(self, reset=False, consumer=DEFAULT_CONSUMER):
+        """Latency histograms, with the values recorded since the
+        consumer last reset them.
+
+            Every consumer has its own baseline, so a reset never changes
+            the values seen by other consumers.
+
+        :param bool reset: Start over, e.g. at the end of a scrape
+                           interval.
+        :param str|None consumer: Name of the consumer, or None for the
+                                  cumulative values, e.g. to export them.
+        :raises AMQPInvalidArgument: Cumulative values cannot be reset.
+        :rtype: dict
+        """
+        if reset and consumer is None:
+            raise AMQPInvalidArgument('a consumer is required to reset '
+                                      'the histograms')
+        totals = {}
+        with self.lock:
+            self._retire_threads()
+            for _, _, histograms in self._threads:
+                for name, histogram in histograms.copy().items():
+                    _add_histogram(totals, name, histogram.copy())
+            for name, histogram in self._retired_histograms.items():
+                _add_histogram(totals, name, histogram)
+            baseline = {}
+            if consumer is not None:
+                baseline = self._baselines.get(consumer, baseline)
+            result = {}
+            for name, histogram in totals.items():
+                result[name] = histogram.copy()
+                if name in baseline:
+                    result[name].subtract(baseline[name])
+            if reset:
+                self._baselines[consumer] = totals
+        return result
+
+    def _register_thread(self):
+        """Create the counters and histograms of the current thread.
+
+        :rtype: tuple
+        """
+        counters = {}
+        histograms = {}
+        with self.lock:
+            self._threads.append((threading.current_thread(), counters,
+                                  histograms))
+        self._local.counters = counters
+        self._local.histograms = histograms
+        return counters, histograms
+
+    def _retire_threads(self):
+        """Move the values recorded by finished threads, as nothing can
+        update them any longer.
+
+        :return:
+        """
+        alive = []
+        for thread, counters, histograms in self._threads:
+            if thread.is_alive():
+                alive.append((thread, counters, histograms))
+                continue
+            _add(self._retired, counters)
+            for name, histogram in histograms.items():
+                _add_histogram(self._retired_histograms, name, histogram)
+        self._threads = alive
+
+
+def merge(target, snapshot):
+    """Add the counters of a snapshot to another snapshot.
+
+    :param dict target:
+    :param dict snapshot:
+    :return:
+    """
+    for name, value in snapshot.items():
+        if isinstance(value, dict):
+            merge(target.setdefault(name, {}), value)
+            continue
+        target[name] = target.get(name, 0) + value
+
+
+def add_derived_counters(snapshot):
+    """Add the message level counters, e.g. publishes and deliveries.
+
+    :param dict snapshot:
+    :return:
+    """
+    for name, group, frames in DERIVED_COUNTERS:
+        counters = snapshot.get(group, {})
+        snapshot[name] = sum(counters.get(frame, 0) for frame in frames)
+
+
+def _add(target, counters):
+    """
+    :param dict target:
+    :param dict counters:
+    :return:
+    """
+    for name, value in counters.items():
+        target[name] = target.get(name, 0) + value
+
+
+def _add_histogram(target, name, histogram):
+    """
+    :param dict target:
+    :param str name:
+    :param Histogram histogram:
+    :return:
+    """
+    if name in target:
+        target[name].add(histogram)
+        return
+    target[name] = histogram.copy()
+
+
+def _bucket(value):
+    """Bucket index of a value in microseconds.
+
+        Values below SUB_BUCKETS have a bucket each, and larger values
+        share a bucket with values that have the same top SUB_BUCKET_BITS
+        bits.
+
+    :param int value:
+    :rtype: int
+    """
+    if value < SUB_BUCKETS:
+        return max(value, 0)
+    shift = min(value.bit_length(), MAX_LATENCY_BITS) - SUB_BUCKET_BITS
+    value = min(value >> shift, SUB_BUCKETS - 1)
+    return (shift << (SUB_BUCKET_BITS - 1)) + value
+
+
+def _highest_value(index):
+    """Highest value in microseconds that is recorded in a bucket.
+
+    :param int index:
+    :rtype: int
+    """
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    value = index - (shift << (SUB_BUCKET_BITS - 1))
+    return ((value + 1) << shift) - 1
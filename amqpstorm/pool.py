@@ -0,0 +1,567 @@
+"""AMQP-Storm Connection and Channel Pools."""
+__author__ = 'eandersson'
+
+import logging
+import threading
+from time import time
+from contextlib import contextmanager
+
+from amqpstorm.connection import Connection
+from amqpstorm.exception import AMQPError
+from amqpstorm.exception import AMQPConnectionError
+from amqpstorm.exception import AMQPInvalidArgument
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _PooledConnection(object):
+    """A Connection, and the channels it has available for lease."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.idle_channels = []
+        self.leased = 0
+        self.last_used = time()
+
+    @property
+    def is_healthy(self):
+        """Is the connection still usable.
+
+        :rtype: bool
+        """
+        if not self.connection.is_open:
+            return False
+        try:
+            self.connection.check_for_errors()
+        except AMQPError:
+            return False
+        return True
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of Connections, that leases out Channels.
+
+        Channels are re-used between leases, so that only the first lease
+        on a channel pays for the connection and channel handshakes.
+        Channels that were left consuming are closed when released. Any
+        other channel state, e.g. confirm mode or basic.qos, carries over
+        to the next lease, so set it on each lease if you depend on it.
+
+        Broken connections are dropped when leasing, and idle connections
+        above min_size are closed when releasing. At most once every
+        health_check_interval a lease also runs check_health, which
+        re-opens connections up to min_size.
+
+        e.g.
+            pool = ConnectionPool('localhost', 'guest', 'guest')
+            with pool.channel() as channel:
+                channel.basic.publish('Hello World!', 'my_queue')
+    """
+
+    def __init__(self, hostname, username, password, port=5672, **kwargs):
+        """
+        :param str|list hostname:
+        :param str username:
+        :param str password:
+        :param int port:
+        :param int min_size: Number of connections to keep open
+        :param int max_size: Maximum number of connections
+        :param int max_channels: Maximum number of channels leased out
+                                 per connection
+        :param int|float max_idle_time: Close connections above min_size
+                                        after being unused for this long
+        :param int|float lease_timeout: How long to wait for a channel
+                                        when the pool is exhausted
+        :param int|float health_check_interval: How often a lease runs
+                                                check_health, or None to
+                                                never run it
+        :param class connection_class: Connection class to use
+
+            Any other arguments are passed on to the Connection.
+        """
+        self.min_size = kwargs.pop('min_size', 1)
+        self.max_size = kwargs.pop('max_size', 10)
+        self.max_channels = kwargs.pop('max_channels', 64)
+        self.max_idle_time = kwargs.pop('max_idle_time', 60)
+        self.lease_timeout = kwargs.pop('lease_timeout', 30)
+        self.health_check_interval = kwargs.pop('health_check_interval', 30)
+        self._connection_class = kwargs.pop('connection_class', Connection)
+        self._connection_args = (hostname, username, password, port)
+        self._connection_kwargs = kwargs
+        self._condition = threading.Condition()
+        self._connections = []
+        self._opening = 0
+        self._closed = False
+        self.leases = 0
+        self.lease_timeouts = 0
+        self.lease_wait_time = 0.0
+        self.max_lease_wait_time = 0.0
+        self._validate_parameters()
+        self._next_health_check = self._health_check_deadline()
+        try:
+            for _ in range(self.min_size):
+                self._connections.append(self._open_connection())
+        except Exception:
+            for pooled in self._connections:
+                self._close_connection(pooled)
+            del self._connections[:]
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, _):
+        self.close()
+
+    @property
+    def size(self):
+        """Number of open connections in the pool.
+
+        :rtype: int
+        """
+        return len(self._connections)
+
+    @property
+    def utilisation(self):
+        """Fraction of the channel capacity of the pool that is leased out.
+
+        :rtype: float
+        """
+        with self._condition:
+            return self._leased() / float(self.max_size * self.max_channels)
+
+    @contextmanager
+    def channel(self, timeout=None):
+        """Lease a Channel.
+
+            The channel is returned to the pool at the end of the
+            with block, unless it was closed or left consuming.
+
+        :param int|float timeout: Override the lease_timeout.
+        :raises AMQPConnectionError: No channel became available in time.
+        :rtype: Channel
+        """
+        pooled, channel = self._lease(timeout)
+        try:
+            yield channel
+        finally:
+            self._release(pooled, channel)
+
+    def stats(self):
+        """Pool statistics.
+
+        :rtype: dict
+        """
+        with self._condition:
+            leased = self._leased()
+            return {
+                'connections': len(self._connections),
+                'leased_channels': leased,
+                'idle_channels': sum(len(pooled.idle_channels)
+                                     for pooled in self._connections),
+                'utilisation': leased / float(self.max_size *
+                                              self.max_channels),
+                'leases': self.leases,
+                'lease_timeouts': self.lease_timeouts,
+                'lease_wait_time': self.lease_wait_time,
+                'average_lease_wait_time': (self.lease_wait_time /
+                                            self.leases
+                                            if self.leases else 0.0),
+                'max_lease_wait_time': self.max_lease_wait_time
+            }
+
+    def check_health(self):
+        """Remove broken connections, close connections that have been
+        idle for too long, and make sure that min_size connections are
+        open.
+
+        :return:
+        """
+        with self._condition:
+            removed = self._remove_unhealthy() + self._evict_idle()
+            missing = self.min_size - len(self._connections) - self._opening
+            self._opening += max(missing, 0)
+        for pooled in removed:
+            self._close_connection(pooled)
+        for _ in range(missing):
+            try:
+                pooled = self._open_connection()
+            except AMQPError as why:
+                LOGGER.warning('Failed to open pooled connection: %s', why)
+                with self._condition:
+                    self._opening -= 1
+                continue
+            with self._condition:
+                self._opening -= 1
+                self._connections.append(pooled)
+                self._condition.notify()
+
+    def close(self):
+        """Close all connections in the pool.
+
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            connections = list(self._connections)
+            del self._connections[:]
+            self._condition.notify_all()
+        for pooled in connections:
+            self._close_connection(pooled)
+
+    def _lease(self, timeout):
+        """Wait for, and take, a channel from the pool.
+
+        :param int|float timeout:
+        :rtype: tuple
+        """
+        if timeout is None:
+            timeout = self.lease_timeout
+        if self._health_check_due():
+            self.check_health()
+        start_time = time()
+        deadline = start_time + timeout
+        removed = []
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise AMQPConnectionError('connection pool is closed')
+                removed += self._remove_unhealthy()
+                pooled = self._select_connection()
+                if pooled:
+                    pooled.leased += 1
+                    break
+                if len(self._connections) + self._opening < self.max_size:
+                    self._opening += 1
+                    pooled = None
+                    break
+                remaining = deadline - time()
+                if remaining <= 0:
+                    self.lease_timeouts += 1
+                    raise AMQPConnectionError('timed out waiting for a '
+                                              'channel')
+                self._condition.wait(remaining)
+        for broken in removed:
+            self._close_connection(broken)
+        if pooled is None:
+            pooled = self._add_connection()
+        try:
+            channel = self._take_channel(pooled)
+        except AMQPError:
+            with self._condition:
+                pooled.leased -= 1
+                self._condition.notify()
+            raise
+        wait_time = time() - start_time
+        with self._condition:
+            self.leases += 1
+            self.lease_wait_time += wait_time
+            self.max_lease_wait_time = max(self.max_lease_wait_time,
+                                           wait_time)
+        return pooled, channel
+
+    def _release(self, pooled, channel):
+        """Return a leased channel to the pool.
+
+        :param _PooledConnection pooled:
+        :param Channel channel:
+        :return:
+        """
+        if channel.is_open and channel.consumer_tags:
+            try:
+                channel.close()
+            except AMQPError:
+                pass
+        with self._condition:
+            pooled.leased -= 1
+            pooled.last_used = time()
+            if channel.is_open and pooled in self._connections:
+                pooled.idle_channels.append(channel)
+            self._condition.notify()
+            removed = self._evict_idle()
+        for idle in removed:
+            self._close_connection(idle)
+
+    def _add_connection(self):
+        """Open a new connection, for a lease that has already been
+        counted in _opening.
+
+        :rtype: _PooledConnection
+        """
+        try:
+            pooled = self._open_connection()
+        except AMQPError:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opening -= 1
+            pooled.leased += 1
+            self._connections.append(pooled)
+        return pooled
+
+    def _select_connection(self):
+        """Pick the connection to lease a channel from.
+
+            Prefer connections that have an idle channel, and then the
+            connection with the fewest leased channels.
+
+        :rtype: _PooledConnection|None
+        """
+        candidates = [pooled for pooled in self._connections
+                      if pooled.leased < self.max_channels]
+        if not candidates:
+            return None
+        for pooled in candidates:
+            if pooled.idle_channels:
+                return pooled
+        pooled = min(candidates, key=lambda item: item.leased)
+        if pooled.leased and \
+                len(self._connections) + self._opening < self.max_size:
+            return None
+        return pooled
+
+    @staticmethod
+    def _take_channel(pooled):
+        """Take an idle channel, or open a new one.
+
+        :param _PooledConnection pooled:
+        :rtype: Channel
+        """
+        while pooled.idle_channels:
+            channel = pooled.idle_channels.pop()
+            if channel.is_open:
+                return channel
+        return pooled.connection.channel()
+
+    def _open_connection(self):
+        """Open a new Connection.
+
+        :rtype: _PooledConnection
+        """
+        connection = self._connection_class(*self._connection_args,
+                                            **self._connection_kwargs)
+        return _PooledConnection(connection)
+
+    def _health_check_deadline(self):
+        """When the next lease should run check_health.
+
+        :rtype: float|None
+        """
+        if self.health_check_interval is None:
+            return None
+        return time() + self.health_check_interval
+
+    def _health_check_due(self):
+        """Is a health check due, and if so claim it for this lease, so
+        that concurrent leases do not run it too.
+
+        :rtype: bool
+        """
+        with self._condition:
+            if self._closed or self._next_health_check is None or \
+                    time() < self._next_health_check:
+                return False
+            self._next_health_check = self._health_check_deadline()
+            return True
+
+    def _remove_unhealthy(self):
+        """Remove connections that are no longer usable.
+
+        :return: The removed connections, that still need to be closed.
+        :rtype: list
+        """
+        removed = []
+        for pooled in list(self._connections):
+            if pooled.is_healthy:
+                continue
+            LOGGER.warning('Removing broken connection from the pool.')
+            self._connections.remove(pooled)
+            removed.append(pooled)
+        return removed
+
+    def _evict_idle(self):
+        """Close connections above min_size, that have been unused for
+        longer than max_idle_time.
+
+        :return: The removed connections, that still need to be closed.
+        :rtype: list
+        """
+        removed = []
+        now = time()
+        for pooled in list(self._connections):
+            if len(self._connections) <= self.min_size:
+                break
+            if pooled.leased or now - pooled.last_used < self.max_idle_time:
+                continue
+            LOGGER.debug('Closing idle pooled connection.')
+            self._connections.remove(pooled)
+            removed.append(pooled)
+        return removed
+
+    def _leased(self):
+        """Total number of leased channels.
+
+        :rtype: int
+        """
+        return sum(pooled.leased for pooled in self._connections)
+
+    @staticmethod
+    def _close_connection(pooled):
+        """Close a pooled connection, ignoring any errors.
+
+        :param _PooledConnection pooled:
+        :return:
+        """
+        try:
+            pooled.connection.close()
+        except AMQPError as why:
+            LOGGER.debug('Failed to close pooled connection: %s', why)
+
+    def _validate_parameters(self):
+        """Validate Pool Parameters.
+
+        :return:
+        """
+        if not isinstance(self.min_size, int) or self.min_size < 0:
+            raise AMQPInvalidArgument('min_size should be a positive integer')
+        elif not isinstance(self.max_size, int) or self.max_size < 1:
+            raise AMQPInvalidArgument('max_size should be a positive integer')
+        elif self.min_size > self.max_size:
+            raise AMQPInvalidArgument('min_size should not be larger '
+                                      'than max_size')
+        elif not isinstance(self.max_channels, int) or self.max_channels < 1:
+            raise AMQPInvalidArgument('max_channels should be a positive '
+                                      'integer')
+        elif not isinstance(self.max_idle_time, (int, float)):
+            raise AMQPInvalidArgument('max_idle_time should be an integer '
+                                      'or float')
+        elif not isinstance(self.lease_timeout, (int, float)):
+            raise AMQPInvalidArgument('lease_timeout should be an integer '
+                                      'or float')
+        elif self.health_check_interval is not None and \
+                not isinstance(self.health_check_interval, (int, float)):
+            raise AMQPInvalidArgument('health_check_interval should be an '
+                                      'integer, float or None')
+
+
+class ChannelPool(object):
+    """Hands each thread its own Channel on a shared Connection.
+
+        Channels are opened up front (warm), or on first use, and re-used
+        by new threads once the thread that owned them has exited.
+        Channels that have been closed, e.g. by the remote server, are
+        transparently replaced. Channel state set by a thread, e.g.
+        basic.qos, carries over to the next thread given the channel.
+
+        e.g.
+            pool = ChannelPool(connection, size=8, confirm_deliveries=True)
+
+            # In each publisher thread.
+            pool.channel.basic.publish('Hello World!', 'my_queue')
+    """
+
+    def __init__(self, connection, size=0, confirm_deliveries=False,
+                 rpc_timeout=360):
+        """
+        :param Connection connection: amqp-storm Connection
+        :param int size: Number of channels to open up front
+        :param bool confirm_deliveries: Enable publisher confirms on
+                                        each channel
+        :param int rpc_timeout: Rpc timeout of each channel
+        """
+        if not isinstance(size, int) or size < 0:
+            raise AMQPInvalidArgument('size should be a positive integer')
+        elif not isinstance(confirm_deliveries, bool):
+            raise AMQPInvalidArgument('confirm_deliveries should be a '
+                                      'boolean')
+        self.lock = threading.Lock()
+        self.confirm_deliveries = confirm_deliveries
+        self.rpc_timeout = rpc_timeout
+        self.channels_opened = 0
+        self._connection = connection
+        self._idle = []
+        self._assigned = {}
+        for _ in range(size):
+            self._idle.append(self._open_channel())
+
+    def __len__(self):
+        return len(self._idle) + len(self._assigned)
+
+    @property
+    def channel(self):
+        """The Channel of the calling thread.
+
+        :rtype: Channel
+        """
+        thread = threading.current_thread()
+        channel = self._assigned.get(thread)
+        if channel is not None and channel.is_open:
+            return channel
+        with self.lock:
+            self._reclaim()
+            while self._idle:
+                channel = self._idle.pop()
+                if channel.is_open:
+                    break
+            else:
+                channel = None
+        if channel is None:
+            channel = self._open_channel()
+        with self.lock:
+            self._assigned[thread] = channel
+        return channel
+
+    def release(self):
+        """Give the channel of the calling thread back to the pool.
+
+        :return:
+        """
+        thread = threading.current_thread()
+        with self.lock:
+            channel = self._assigned.pop(thread, None)
+            if channel is not None and channel.is_open:
+                self._idle.append(channel)
+
+    def close(self):
+        """Close all channels in the pool.
+
+        :return:
+        """
+        with self.lock:
+            channels = self._idle + list(self._assigned.values())
+            del self._idle[:]
+            self._assigned.clear()
+        for channel in channels:
+            if not channel.is_open:
+                continue
+            try:
+                channel.close()
+            except AMQPError as why:
+                LOGGER.debug('Failed to close pooled channel: %s', why)
+
+    def _reclaim(self):
+        """Move the channels of threads that have exited back to idle.
+
+        :return:
+        """
+        for thread in list(self._assigned):
+            if thread.is_alive():
+                continue
+            channel = self._assigned.pop(thread)
+            if channel.is_open:
+                self._idle.append(channel)
+
+    def _open_channel(self):
+        """Open a new Channel, in confirm mode if requested.
+
+        :rtype: Channel
+        """
+        channel = self._connection.channel(rpc_timeout=self.rpc_timeout)
+        if self.confirm_deliveries:
+            channel.confirm_deliveries()
+        with self.lock:
+            self.channels_opened += 1
+        return channel
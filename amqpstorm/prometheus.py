@@ -0,0 +1,348 @@
+"""AMQP-Storm Prometheus Exporter.
+
+    Renders the metrics of connections and their channels in the
+    Prometheus text format, and optionally serves them over HTTP.
+
+    e.g.
+        exporter = Exporter([connection])
+        exporter.start(port=9419)
+        ...
+        exporter.stop()
+"""
+__author__ = 'eandersson'
+
+import logging
+import threading
+
+try:
+    from http.server import HTTPServer
+    from http.server import BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+    from BaseHTTPServer import BaseHTTPRequestHandler
+
+from amqpstorm.metrics import FRAMES_IN
+from amqpstorm.metrics import FRAMES_OUT
+from amqpstorm.metrics import Histogram
+from amqpstorm.metrics import add_derived_counters
+
+LOGGER = logging.getLogger(__name__)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_PORT = 9419
+MAX_CHANNELS = 32
+OTHER_CHANNELS = 'other'
+LATENCY = 'amqpstorm_latency_seconds'
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (stats key, metric name, type, help)
+CONNECTION_METRICS = (
+    ('bytes_in', 'amqpstorm_received_bytes_total', 'counter',
+     'Bytes received.'),
+    ('bytes_out', 'amqpstorm_sent_bytes_total', 'counter', 'Bytes sent.'),
+    ('write_stalls', 'amqpstorm_write_stalls_total', 'counter',
+     'Writes that had to wait for the socket to become writable.'),
+    ('write_stall_time', 'amqpstorm_write_stall_seconds_total', 'counter',
+     'Time spent waiting for the socket to become writable.'),
+    ('reconnects', 'amqpstorm_reconnects_total', 'counter',
+     'Connections re-established after being lost.'),
+    ('channels', 'amqpstorm_open_channels', 'gauge', 'Open channels.'),
+)
+CHANNEL_METRICS = (
+    ('publishes', 'amqpstorm_publishes_total', 'counter',
+     'Messages published.'),
+    ('deliveries', 'amqpstorm_deliveries_total', 'counter',
+     'Messages received, including basic.get.'),
+    ('confirms_acked', 'amqpstorm_confirms_acked_total', 'counter',
+     'Published messages acknowledged by the broker.'),
+    ('confirms_nacked', 'amqpstorm_confirms_nacked_total', 'counter',
+     'Published messages rejected by the broker.'),
+    ('acks', 'amqpstorm_acks_total', 'counter', 'Messages acknowledged.'),
+    ('nacks', 'amqpstorm_nacks_total', 'counter',
+     'Messages negatively acknowledged.'),
+    ('rejects', 'amqpstorm_rejects_total', 'counter', 'Messages rejected.'),
+    ('rpc_requests', 'amqpstorm_rpc_requests_total', 'counter',
+     'Requests that waited for a reply from the broker.'),
+    ('inbound_frames', 'amqpstorm_inbound_frames', 'gauge',
+     'Frames received, but not yet consumed.'),
+)
+FRAME_METRICS = (
+    (FRAMES_IN, 'amqpstorm_frames_received_total', 'counter',
+     'Frames received, by frame.'),
+    (FRAMES_OUT, 'amqpstorm_frames_sent_total', 'counter',
+     'Frames sent, by frame.'),
+)
+
+
+class Exporter(object):
+    """Exports the metrics of a set of connections."""
+
+    def __init__(self, connections=None, max_channels=MAX_CHANNELS):
+        """
+        :param list connections: Connections to export.
+        :param int max_channels: Channels with a higher channel id are
+                                 combined, to bound the number of series.
+        """
+        self.lock = threading.Lock()
+        self.max_channels = max_channels
+        self._connections = list(connections or [])
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self):
+        """Host and port of the HTTP endpoint, if started.
+
+        :rtype: tuple|None
+        """
+        if not self._server:
+            return None
+        return self._server.server_address[:2]
+
+    def add(self, connection):
+        """Start exporting the metrics of a connection.
+
+        :param Connection connection:
+        :return:
+        """
+        with self.lock:
+            if connection not in self._connections:
+                self._connections.append(connection)
+
+    def remove(self, connection):
+        """Stop exporting the metrics of a connection.
+
+        :param Connection connection:
+        :return:
+        """
+        with self.lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def render(self):
+        """Render the metrics in the Prometheus text format.
+
+        :rtype: str
+        """
+        with self.lock:
+            connections = list(self._connections)
+        return render(connections, max_channels=self.max_channels)
+
+    def start(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        """Serve the metrics on http://host:port/metrics using a
+        background thread.
+
+        :param int port: Use 0 to pick a free port.
+        :param str host:
+        :return: The host and port listened on.
+        :rtype: tuple
+        """
+        if self._server:
+            return self.address
+        self._server = HTTPServer((host, port), MetricsHandler)
+        self._server.exporter = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name=__name__)
+        self._thread.daemon = True
+        self._thread.start()
+        LOGGER.debug('Exporting metrics on %s:%d', *self.address)
+        return self.address
+
+    def stop(self):
+        """Stop the HTTP endpoint.
+
+        :return:
+        """
+        if not self._server:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers GET /metrics with the metrics of the server's Exporter."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.exporter.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message, *args):
+        LOGGER.debug(message, *args)
+
+
+def render(connections, max_channels=MAX_CHANNELS):
+    """Render the metrics of connections in the Prometheus text format.
+
+        Series are labelled by host, vhost and channel id. Connections
+        with the same labels are added up, and channels with an id above
+        max_channels are combined as channel="other".
+
+    :param list connections:
+    :param int max_channels:
+    :rtype: str
+    """
+    samples = {}
+    latency = {}
+    for connection in connections:
+        _collect(connection, max_channels, samples, latency)
+
+    lines = []
+    for key, name, metric_type, description in CONNECTION_METRICS + \
+            CHANNEL_METRICS + FRAME_METRICS:
+        series = samples.get(key)
+        if not series:
+            continue
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for labels in sorted(series):
+            lines.append('%s%s %s' % (name, _format_labels(labels),
+                                      _format_value(series[labels])))
+    if latency:
+        lines.append('# HELP %s Latency of rpc requests, confirms, '
+                     'deliveries and consumer callbacks.' % LATENCY)
+        lines.append('# TYPE %s histogram' % LATENCY)
+        for labels in sorted(latency):
+            lines.extend(_render_histogram(labels, latency[labels]))
+    return '\n'.join(lines) + '\n'
+
+
+def _collect(connection, max_channels, samples, latency):
+    """Add the metrics of a connection, and its channels.
+
+    :param Connection connection:
+    :param int max_channels:
+    :param dict samples: Values by stats key, and labels.
+    :param dict latency: Histograms by labels.
+    :return:
+    """
+    labels = (('host', _host(connection)),
+              ('vhost', connection.parameters['virtual_host']))
+    stats = connection.metrics.snapshot()
+    stats['bytes_in'] = getattr(connection.io, 'receive_bytes', 0)
+    stats['bytes_out'] = getattr(connection.io, 'write_bytes', 0)
+    stats['channels'] = 0
+    channels = list(connection.channels.values())
+    for channel in channels:
+        if channel.is_open:
+            stats['channels'] += 1
+    for key, _, _, _ in CONNECTION_METRICS:
+        _add_sample(samples, key, labels, stats.get(key, 0))
+    _add_frames(samples, labels + (('channel', '0'),), stats)
+
+    for channel in channels:
+        channel_id = channel.channel_id
+        channel_labels = labels + (('channel', str(channel_id)
+                                    if channel_id <= max_channels
+                                    else OTHER_CHANNELS),)
+        stats = channel.metrics.snapshot()
+        add_derived_counters(stats)
+        stats['inbound_frames'] = len(channel._inbound)
+        for key, _, _, _ in CHANNEL_METRICS:
+            _add_sample(samples, key, channel_labels, stats.get(key, 0))
+        _add_frames(samples, channel_labels, stats)
+        # Prometheus expects cumulative values, regardless of resets.
+        for operation, histogram in channel.latency(consumer=None).items():
+            key = channel_labels + (('operation', operation),)
+            latency.setdefault(key, Histogram()).add(histogram)
+
+
+def _add_frames(samples, labels, stats):
+    """
+    :param dict samples:
+    :param tuple labels:
+    :param dict stats:
+    :return:
+    """
+    for key, _, _, _ in FRAME_METRICS:
+        for frame, value in stats.get(key, {}).items():
+            _add_sample(samples, key, labels + (('frame', frame),), value)
+
+
+def _add_sample(samples, key, labels, value):
+    """
+    :param dict samples:
+    :param str key:
+    :param tuple labels:
+    :param int|float value:
+    :return:
+    """
+    series = samples.setdefault(key, {})
+    series[labels] = series.get(labels, 0) + value
+
+
+def _render_histogram(labels, histogram):
+    """
+    :param tuple labels:
+    :param Histogram histogram:
+    :rtype: list
+    """
+    lines = []
+    counts = histogram.cumulative_counts(LATENCY_BUCKETS)
+    for bound, count in zip(LATENCY_BUCKETS, counts):
+        lines.append('%s_bucket%s %d' % (
+            LATENCY, _format_labels(labels + (('le', repr(bound)),)), count))
+    count = histogram.count
+    lines.append('%s_bucket%s %d' % (
+        LATENCY, _format_labels(labels + (('le', '+Inf'),)), count))
+    lines.append('%s_sum%s %s' % (LATENCY, _format_labels(labels),
+                                  _format_value(histogram.total)))
+    lines.append('%s_count%s %d' % (LATENCY, _format_labels(labels), count))
+    return lines
+
+
+def _host(connection):
+    """The host connected to, or the configured hostname(s).
+
+    :param Connection connection:
+    :rtype: str
+    """
+    address = getattr(connection.io, 'address', None)
+    if address:
+        host, port = address[:2]
+        if not port:
+            return str(host)
+        return '%s:%d' % (host, port)
+    hostname = connection.parameters['hostname']
+    if not isinstance(hostname, (list, tuple)):
+        return hostname
+    return ','.join(str(host[0] if isinstance(host, tuple) else host)
+                    for host in hostname)
+
+
+def _format_labels(labels):
+    """
+    :param tuple labels: Label name and value pairs.
+    :rtype: str
+    """
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    """
+    :param int|float value:
+    :rtype: str
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    """Escape a label value.
+
+    :param str value:
+    :rtype: str
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
@@ -0,0 +1,124 @@
+"""AMQP-Storm Channel.Basic Publisher."""
+__author__ = 'eandersson'
+
+import struct
+import logging
+
+from pamqp import frame as pamqp_frame
+from pamqp import header as pamqp_header
+from pamqp import specification as pamqp_spec
+
+from amqpstorm import compatibility
+from amqpstorm.base import FRAME_MAX
+from amqpstorm.base import FRAME_END
+from amqpstorm.base import BODY_FRAME_HEADER
+from amqpstorm.metrics import FRAMES_OUT
+from amqpstorm.exception import AMQPInvalidArgument
+
+
+LOGGER = logging.getLogger(__name__)
+BODY_SIZE = struct.Struct('>Q')
+
+# Frame header (7 bytes), class id (2 bytes) and weight (2 bytes) precede
+# the 8 byte body size in a marshalled content header frame.
+BODY_SIZE_OFFSET = 11
+PUBLISH_FRAME = (FRAMES_OUT, 'Basic.Publish')
+HEADER_FRAME = (FRAMES_OUT, 'ContentHeader')
+BODY_FRAME = (FRAMES_OUT, 'ContentBody')
+
+
+class Publisher(object):
+    """Pre-compiled Publisher for a fixed exchange, routing key and
+    set of properties.
+
+        The method frame and the content header are marshalled once, and
+        only the body size is patched in for each message.
+
+        e.g.
+            publisher = channel.basic.publisher('my_exchange', 'my_key',
+                                                {'delivery_mode': 2})
+            publisher.publish(b'Hello World!')
+    """
+
+    def __init__(self, channel, exchange, routing_key, properties=None,
+                 mandatory=False, immediate=False):
+        """
+        :param Channel channel: amqp-storm Channel
+        :param str exchange:
+        :param str routing_key:
+        :param dict properties:
+        :param bool mandatory:
+        :param bool immediate:
+        """
+        self._channel = channel
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.properties = properties or {}
+        self.mandatory = mandatory
+        self.immediate = immediate
+        method_frame = pamqp_spec.Basic.Publish(exchange=exchange,
+                                                routing_key=routing_key,
+                                                mandatory=mandatory,
+                                                immediate=immediate)
+        header_frame = pamqp_header.ContentHeader(
+            properties=pamqp_spec.Basic.Properties(**self.properties))
+        self._method = pamqp_frame.marshal(method_frame, channel.channel_id)
+        header = pamqp_frame.marshal(header_frame, channel.channel_id)
+        self._header_prefix = header[:BODY_SIZE_OFFSET]
+        self._header_suffix = header[BODY_SIZE_OFFSET + BODY_SIZE.size:]
+
+    def publish(self, body):
+        """Publish Message.
+
+            Text bodies are utf-8 encoded. Messages are published using
+            basic.publish instead while tracing hooks are registered, as
+            hooks may change the properties of each message.
+
+        :param bytes|str|unicode body:
+        :rtype: bool|None
+        :raises AMQPInvalidArgument: Invalid Parameters
+        """
+        if not compatibility.is_string(body):
+            raise AMQPInvalidArgument('body should be a string')
+        elif compatibility.is_unicode(body) or \
+                (compatibility.PYTHON3 and isinstance(body, str)):
+            body = body.encode('utf-8')
+        if self._channel.hooks.active:
+            return self._channel.basic.publish(body, self.routing_key,
+                                               self.exchange, self.properties,
+                                               self.mandatory, self.immediate)
+
+        send_buffer = [self._method,
+                       self._header_prefix +
+                       BODY_SIZE.pack(len(body)) +
+                       self._header_suffix]
+        self._append_content_body(send_buffer, body)
+        metrics = self._channel.metrics
+        metrics.increment(PUBLISH_FRAME)
+        metrics.increment(HEADER_FRAME)
+        metrics.increment(BODY_FRAME, (len(send_buffer) - 2) // 3)
+
+        if self._channel.confirming_deliveries:
+            with self._channel.rpc.lock:
+                return self._channel.basic._publish_confirm(send_buffer)
+        self._channel.write_frames(send_buffer)
+
+    def _append_content_body(self, send_buffer, body):
+        """Append marshalled content body frames, without copying the body.
+
+            Python 2 has no vectored socket writes, and cannot join a
+            memoryview with bytes, so the body is sliced there instead.
+
+        :param list send_buffer:
+        :param bytes body:
+        :return:
+        """
+        if len(body) > FRAME_MAX and compatibility.PYTHON3:
+            body = memoryview(body)
+        for offset in compatibility.RANGE(0, len(body), FRAME_MAX):
+            body_piece = body[offset:offset + FRAME_MAX]
+            send_buffer.append(BODY_FRAME_HEADER.pack(
+                pamqp_spec.FRAME_BODY, self._channel.channel_id,
+                len(body_piece)))
+            send_buffer.append(body_piece)
+            send_buffer.append(FRAME_END)
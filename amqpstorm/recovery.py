@@ -0,0 +1,393 @@
+"""AMQP-Storm Recovering Connection."""
+__author__ = 'eandersson'
+
+import random
+import logging
+import threading
+from time import time
+from time import sleep
+from collections import OrderedDict
+
+from amqpstorm import compatibility
+from amqpstorm.channel import Channel
+from amqpstorm.connection import Connection
+from amqpstorm.exception import AMQPError
+from amqpstorm.exception import AMQPConnectionError
+from amqpstorm.exception import AMQPInvalidArgument
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _to_text(value):
+    """Names are decoded as bytes by pamqp, but passed in as text.
+
+    :param bytes|str value:
+    :rtype: str
+    """
+    return compatibility.try_utf8_decode(value)
+
+
+class Topology(object):
+    """Record of everything declared on a channel.
+
+        Only successful requests are recorded, and deleting or cancelling
+        something removes it (and anything depending on it) again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._frames = OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        with self.lock:
+            frames = list(self._frames.items())
+        for key, frame in frames:
+            yield key, frame
+
+    def record(self, frame_out, result):
+        """Record a successful RPC request.
+
+        :param pamqp_spec.Frame frame_out: Amqp frame that was sent.
+        :param dict result: The response from the remote server.
+        :return:
+        """
+        name = frame_out.name
+        with self.lock:
+            if name == 'Exchange.Declare' and not frame_out.passive:
+                self._frames[('exchange', frame_out.exchange)] = frame_out
+            elif name == 'Queue.Declare' and not frame_out.passive:
+                queue = result['queue'] if result else frame_out.queue
+                self._frames[('queue', _to_text(queue))] = frame_out
+            elif name == 'Queue.Bind':
+                self._frames[('queue.bind', frame_out.queue,
+                              frame_out.exchange,
+                              frame_out.routing_key)] = frame_out
+            elif name == 'Exchange.Bind':
+                self._frames[('exchange.bind', frame_out.destination,
+                              frame_out.source,
+                              frame_out.routing_key)] = frame_out
+            elif name == 'Basic.Qos':
+                self._frames.pop(('qos',), None)
+                self._frames[('qos',)] = frame_out
+            elif name == 'Confirm.Select':
+                self._frames[('confirm',)] = frame_out
+            elif name == 'Basic.Consume':
+                # Replay using the tag assigned by the server, so that
+                # the consumer keeps the same tag after a recovery.
+                frame_out.consumer_tag = _to_text(result['consumer_tag'])
+                self._frames[('consume', frame_out.consumer_tag)] = \
+                    frame_out
+            elif name == 'Queue.Delete':
+                self._remove(lambda key, frame: key == ('queue',
+                                                        frame_out.queue) or
+                             (key[0] in ('queue.bind', 'consume') and
+                              frame.queue == frame_out.queue))
+            elif name == 'Exchange.Delete':
+                exchange = frame_out.exchange
+                self._remove(lambda key, frame: key == ('exchange',
+                                                        exchange) or
+                             (key[0] == 'queue.bind' and
+                              frame.exchange == exchange) or
+                             (key[0] == 'exchange.bind' and
+                              exchange in (frame.source, frame.destination)))
+            elif name == 'Queue.Unbind':
+                self._frames.pop(('queue.bind', frame_out.queue,
+                                  frame_out.exchange,
+                                  frame_out.routing_key), None)
+            elif name == 'Exchange.Unbind':
+                self._frames.pop(('exchange.bind', frame_out.destination,
+                                  frame_out.source,
+                                  frame_out.routing_key), None)
+            elif name == 'Basic.Cancel':
+                self._frames.pop(('consume',
+                                  _to_text(frame_out.consumer_tag)), None)
+
+    def rename_queue(self, old_name, new_name):
+        """Point everything recorded for a server-named queue to the name
+        it received after a recovery.
+
+        :param str old_name:
+        :param str new_name:
+        :return:
+        """
+        with self.lock:
+            for key, frame in list(self._frames.items()):
+                if key[0] in ('queue.bind', 'consume') and \
+                        frame.queue == old_name:
+                    frame.queue = new_name
+            frames = OrderedDict()
+            for key, frame in self._frames.items():
+                if key == ('queue', old_name):
+                    key = ('queue', new_name)
+                elif key[0] == 'queue.bind' and key[1] == old_name:
+                    key = ('queue.bind', new_name) + key[2:]
+                frames[key] = frame
+            self._frames = frames
+
+    def _remove(self, predicate):
+        """Remove every recorded frame that matches the predicate.
+
+        :param function predicate:
+        :return:
+        """
+        for key, frame in list(self._frames.items()):
+            if predicate(key, frame):
+                del self._frames[key]
+
+
+class RecoveringChannel(Channel):
+    """RabbitMQ Channel that restores its state after a reconnect."""
+
+    def __init__(self, channel_id, connection, rpc_timeout, validate=True):
+        super(RecoveringChannel, self).__init__(channel_id, connection,
+                                                rpc_timeout,
+                                                validate=validate)
+        self.topology = Topology()
+
+    def rpc_request(self, frame_out):
+        """Perform a RPC Request, and record it if successful.
+
+        :param pamqp_spec.Frame frame_out: Amqp frame.
+        :rtype: dict
+        """
+        result = super(RecoveringChannel, self).rpc_request(frame_out)
+        self.topology.record(frame_out, result)
+        return result
+
+    def start_consuming(self, to_tuple=True):
+        """Start consuming events.
+
+            Keeps consuming across connection recoveries.
+
+        :param bool to_tuple: Should incoming messages be converted to
+                              arguments before delivery.
+        :return:
+        """
+        while True:
+            try:
+                super(RecoveringChannel, self).start_consuming(
+                    to_tuple=to_tuple)
+                return
+            except AMQPConnectionError:
+                if not self._connection.wait_for_recovery():
+                    raise
+
+    def recover(self):
+        """Re-open the channel and replay its recorded topology.
+
+        :return:
+        """
+        del self._inbound[:]
+        self.rpc.request.clear()
+        self.rpc.response.clear()
+        self.remove_consumer_tag()
+        self.open()
+        for key, frame in self.topology:
+            result = Channel.rpc_request(self, frame)
+            if key[0] == 'queue' and not frame.queue and \
+                    _to_text(result['queue']) != key[1]:
+                self.topology.rename_queue(key[1], _to_text(result['queue']))
+            elif key[0] == 'consume':
+                self.add_consumer_tag(result['consumer_tag'])
+        LOGGER.debug('Channel #%d Recovered.', self.channel_id)
+
+
+class RecoveringConnection(Connection):
+    """RabbitMQ Connection that automatically reconnects.
+
+        Declared exchanges, queues, bindings, QoS, confirm mode and
+        consumers are recorded per channel, and replayed on the same
+        channel objects once the connection has been re-established.
+
+        While the connection is recovering, operations raise
+        AMQPConnectionError. Use wait_for_recovery to block until the
+        connection is usable again.
+
+        Publisher confirms are not carried across a recovery. A publish
+        waiting for its confirmation when the connection is lost raises
+        AMQPConnectionError, and the message may or may not have reached
+        the broker, so publish it again if duplicates are acceptable.
+    """
+
+    def __init__(self, hostname, username, password, port=5672, **kwargs):
+        """Create a new instance of the RecoveringConnection class.
+
+        :param str hostname:
+        :param str username:
+        :param str password:
+        :param int port:
+        :param int|float min_recovery_delay: Initial delay between
+                                             reconnect attempts
+        :param int|float max_recovery_delay: Maximum delay between
+                                             reconnect attempts
+        :param int max_recovery_attempts: Give up after this many failed
+                                          attempts (None for unlimited)
+        :return:
+        """
+        self.min_recovery_delay = kwargs.pop('min_recovery_delay', 0.1)
+        self.max_recovery_delay = kwargs.pop('max_recovery_delay', 30)
+        self.max_recovery_attempts = kwargs.pop('max_recovery_attempts',
+                                                None)
+        self.reconnects = 0
+        self.recovery_attempts = 0
+        self.last_recovery_time = 0.0
+        self.total_recovery_time = 0.0
+        self._recovery_lock = threading.Lock()
+        self._recovered = threading.Event()
+        self._recovered.set()
+        self._recovery_thread = None
+        self._closed_by_user = False
+        super(RecoveringConnection, self).__init__(hostname, username,
+                                                   password, port, **kwargs)
+
+    @property
+    def is_recovering(self):
+        """Is the connection currently being recovered.
+
+        :rtype: bool
+        """
+        return not self._recovered.is_set()
+
+    def open(self):
+        """Open Connection."""
+        self._closed_by_user = False
+        super(RecoveringConnection, self).open()
+
+    def close(self):
+        """Close connection, and stop any ongoing recovery."""
+        self._closed_by_user = True
+        super(RecoveringConnection, self).close()
+
+    def channel(self, rpc_timeout=360):
+        """Open Channel."""
+        LOGGER.debug('Opening new Channel.')
+        if not compatibility.is_integer(rpc_timeout):
+            raise AMQPInvalidArgument('rpc_timeout should be an integer')
+        with self.io.lock:
+            channel = self._create_channel(RecoveringChannel, rpc_timeout)
+            channel.open()
+        LOGGER.debug('Channel #%d Opened.', channel.channel_id)
+        return channel
+
+    def check_for_errors(self):
+        """Check connection for potential errors.
+
+        :return:
+        """
+        if self.is_recovering and \
+                threading.current_thread() is not self._recovery_thread:
+            raise AMQPConnectionError('connection is recovering')
+        super(RecoveringConnection, self).check_for_errors()
+
+    def set_state(self, state):
+        """Set State.
+
+            Starts a recovery when an open connection is lost.
+
+        :param int state:
+        :return:
+        """
+        previous_state = self._state
+        super(RecoveringConnection, self).set_state(state)
+        if state == self.CLOSED and previous_state == self.OPEN and \
+                not self._closed_by_user:
+            self._start_recovery()
+
+    def _handle_socket_error(self, why):
+        """Handle any critical errors.
+
+            The error is recorded, and the socket closed, before the state
+            is changed, as closing the connection starts the recovery,
+            which opens a new socket and resets the recorded errors.
+
+        :param exception why:
+        :return:
+        """
+        previous_state = self._state
+        self.heartbeat.stop()
+        self._exceptions.append(AMQPConnectionError(why))
+        self.io.close()
+        if previous_state != self.CLOSED:
+            LOGGER.error(why, exc_info=False)
+        self.set_state(self.CLOSED)
+
+    def wait_for_recovery(self, timeout=None):
+        """Wait for an ongoing recovery to finish.
+
+        :param int|float timeout: Maximum time to wait in seconds.
+        :return: True if the connection is open.
+        :rtype: bool
+        """
+        self._recovered.wait(timeout)
+        return self.is_open
+
+    def _start_recovery(self):
+        """Start recovering the connection in the background.
+
+        :return:
+        """
+        with self._recovery_lock:
+            if self.is_recovering:
+                return
+            self._recovered.clear()
+            channels = [channel for channel in self._channels.values()
+                        if channel.is_open]
+            self._recovery_thread = threading.Thread(
+                target=self._recover, args=(channels,), name=__name__)
+            self._recovery_thread.daemon = True
+            self._recovery_thread.start()
+
+    def _recover(self, channels):
+        """Reconnect using exponential backoff with jitter, and restore
+        the channels that were open when the connection was lost.
+
+        :param list channels: Channels to recover.
+        :return:
+        """
+        LOGGER.warning('Connection lost, recovering.')
+        start_time = time()
+        attempt = 0
+        try:
+            while not self._closed_by_user:
+                sleep(self._recovery_delay(attempt))
+                if self._closed_by_user:
+                    break
+                attempt += 1
+                self.recovery_attempts += 1
+                try:
+                    self.io.close()
+                    super(RecoveringConnection, self).open()
+                    for channel in channels:
+                        channel.recover()
+                except AMQPError as why:
+                    LOGGER.warning('Recovery attempt %d failed: %s',
+                                   attempt, why)
+                    if self.max_recovery_attempts and \
+                            attempt >= self.max_recovery_attempts:
+                        LOGGER.error('Giving up recovering the connection '
+                                     'after %d attempts.', attempt)
+                        break
+                    continue
+                self.reconnects += 1
+                self.metrics.increment('reconnects')
+                self.last_recovery_time = time() - start_time
+                self.total_recovery_time += self.last_recovery_time
+                LOGGER.warning('Connection recovered in %.3fs.',
+                               self.last_recovery_time)
+                break
+        finally:
+            self._recovered.set()
+
+    def _recovery_delay(self, attempt):
+        """Exponential backoff, with half of the delay randomized.
+
+        :param int attempt:
+        :rtype: float
+        """
+        delay = min(self.max_recovery_delay,
+                    self.min_recovery_delay * (2 ** attempt))
+        return delay / 2.0 + random.uniform(0, delay / 2.0)
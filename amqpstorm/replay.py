@@ -0,0 +1,161 @@
+"""AMQP-Storm Frame Replay.
+
+    Feeds the frames received in a capture file (see amqpstorm.capture)
+    back through the frame decoder, channel dispatch and message
+    building, without a broker, e.g. to profile a consumer using real
+    traffic.
+
+    e.g.
+        stats = replay('/tmp/consumer.capture', on_message=on_message)
+        print(stats['deliveries'], stats['elapsed'])
+
+    Frames sent by the client are not replayed, as the replay writes them
+    again itself, e.g. when on_message acknowledges a message. Anything
+    written is discarded.
+"""
+__author__ = 'eandersson'
+
+import struct
+import logging
+from time import time
+from time import sleep
+
+from pamqp import specification as pamqp_spec
+
+from amqpstorm.channel import Channel
+from amqpstorm.capture import INBOUND
+from amqpstorm.capture import read_capture
+from amqpstorm.connection import Connection
+
+LOGGER = logging.getLogger(__name__)
+CHANNEL_ID = struct.Struct('>H')
+DISPATCHED_FRAMES = ('Basic.Deliver', 'ContentHeader', 'ContentBody',
+                     'Basic.ConsumeOk', 'Basic.Cancel', 'Basic.CancelOk')
+
+
+class ReplayConnection(Connection):
+    """Connection without a socket, that discards everything written."""
+
+    def __init__(self):
+        super(ReplayConnection, self).__init__('localhost', 'guest', 'guest',
+                                               lazy=True)
+        self.io.write_to_socket = _discard
+        self.set_state(self.OPEN)
+
+    def check_for_errors(self):
+        """Check connection for errors, without requiring a socket.
+
+        :return:
+        """
+        super(Connection, self).check_for_errors()
+
+
+class ReplayChannel(Channel):
+    """Channel that dispatches replayed frames.
+
+        Nothing waits for the replies to requests during a replay, so they
+        are only counted. Messages fetched using basic.get are built like
+        deliveries, and returned messages are ignored.
+    """
+
+    def on_frame(self, frame_in):
+        """Handle a replayed frame sent to this channel.
+
+        :param pamqp.Frame frame_in: Amqp frame.
+        :return:
+        """
+        if frame_in.name == 'Basic.GetOk':
+            frame_in = pamqp_spec.Basic.Deliver(
+                delivery_tag=frame_in.delivery_tag,
+                redelivered=frame_in.redelivered,
+                exchange=frame_in.exchange,
+                routing_key=frame_in.routing_key)
+        elif frame_in.name == 'Channel.OpenOk':
+            self.set_state(self.OPEN)
+            return
+        elif frame_in.name == 'Channel.Close':
+            self.remove_consumer_tag()
+            del self._inbound[:]
+            self.set_state(self.CLOSED)
+            return
+        elif frame_in.name not in DISPATCHED_FRAMES:
+            return
+        super(ReplayChannel, self).on_frame(frame_in)
+
+    def dispatch(self, on_message=None):
+        """Build the complete messages in the inbound queue.
+
+        :param function on_message: Called with each Message.
+        :return: Number of messages built.
+        :rtype: int
+        """
+        messages = 0
+        while len(self._inbound) >= 3 and self._inbound_is_complete():
+            message = self._build_message()
+            if message is None:
+                continue
+            messages += 1
+            if on_message:
+                on_message(message)
+        return messages
+
+
+def replay(path, on_message=None, speed=None):
+    """Replay the frames received in a capture file.
+
+    :param str path: Capture file.
+    :param function on_message: Called with each Message, e.g. the
+                                consumer callback to profile.
+    :param float speed: Keep the original gaps between frames, divided by
+                        speed. By default frames are replayed as fast as
+                        possible.
+    :raises AMQPInvalidArgument: Not a capture file.
+    :return: Connection stats, and the number of records and messages
+             replayed, the bytes received and sent, and the time taken.
+    :rtype: dict
+    """
+    connection = ReplayConnection()
+    channels = connection.channels
+    records = messages = bytes_in = bytes_out = 0
+    first_timestamp = None
+    start_time = time()
+    for timestamp, direction, data in read_capture(path):
+        records += 1
+        if first_timestamp is None:
+            first_timestamp = timestamp
+        if speed:
+            delay = (timestamp - first_timestamp) / speed - \
+                (time() - start_time)
+            if delay > 0:
+                sleep(delay)
+        if direction != INBOUND:
+            bytes_out += len(data)
+            continue
+        bytes_in += len(data)
+        channel_id = CHANNEL_ID.unpack_from(data, 1)[0]
+        if channel_id and channel_id not in channels:
+            channels[channel_id] = ReplayChannel(channel_id, connection,
+                                                 rpc_timeout=360)
+            channels[channel_id].set_state(Channel.OPEN)
+        connection._read_buffer(data)
+        if channel_id:
+            messages += channels[channel_id].dispatch(on_message)
+    elapsed = time() - start_time
+    LOGGER.debug('Replayed %d records, and %d messages in %.3fs',
+                 records, messages, elapsed)
+
+    stats = connection.stats()
+    stats['records'] = records
+    stats['messages'] = messages
+    stats['bytes_in'] = bytes_in
+    stats['bytes_out'] = bytes_out
+    stats['elapsed'] = elapsed
+    return stats
+
+
+def _discard(frame_data):
+    """Stands in for the socket during a replay.
+
+    :param bytes|list frame_data:
+    :return:
+    """
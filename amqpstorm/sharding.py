@@ -0,0 +1,253 @@
+"""AMQP-Storm Sharded Publisher."""
+__author__ = 'eandersson'
+
+import zlib
+import logging
+import itertools
+import threading
+
+from amqpstorm import compatibility
+from amqpstorm.pool import ChannelPool
+from amqpstorm.connection import Connection
+from amqpstorm.exception import AMQPError
+from amqpstorm.exception import AMQPConnectionError
+from amqpstorm.exception import AMQPInvalidArgument
+
+
+LOGGER = logging.getLogger(__name__)
+ROUND_ROBIN = 'round_robin'
+ROUTING_KEY = 'routing_key'
+STRATEGIES = (ROUND_ROBIN, ROUTING_KEY)
+
+
+class Shard(object):
+    """A Connection owned by the ShardedPublisher, and its statistics."""
+
+    def __init__(self, connection, confirm_deliveries):
+        """
+        :param Connection connection: amqp-storm Connection
+        :param bool confirm_deliveries: Enable publisher confirms
+        """
+        self.lock = threading.Lock()
+        self.connection = connection
+        self.channels = ChannelPool(connection,
+                                    confirm_deliveries=confirm_deliveries)
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.errors = 0
+        self.last_error = None
+
+    def channel(self):
+        """The channel of the calling thread.
+
+            Nothing has been written when this fails, so the message can
+            safely be published using another shard instead.
+
+        :raises AMQPError: The connection, or the channel, is not open.
+        :rtype: Channel
+        """
+        try:
+            if not self.connection.is_open:
+                raise AMQPConnectionError('connection is not open')
+            return self.channels.channel
+        except AMQPError as why:
+            self._record_error(why)
+            raise
+
+    def publish(self, body, routing_key, exchange, properties, mandatory,
+                immediate, channel=None):
+        """Publish a message using the channel of the calling thread.
+
+        :param Channel channel: Channel returned by channel()
+        :rtype: bool|None
+        """
+        if channel is None:
+            channel = self.channel()
+        try:
+            result = channel.basic.publish(
+                body, routing_key, exchange=exchange, properties=properties,
+                mandatory=mandatory, immediate=immediate)
+        except AMQPError as why:
+            self._record_error(why)
+            raise
+        with self.lock:
+            self.published += 1
+            if result is True:
+                self.confirmed += 1
+            elif result is False:
+                self.nacked += 1
+        return result
+
+    def _record_error(self, why):
+        """
+        :param AMQPError why:
+        :return:
+        """
+        with self.lock:
+            self.errors += 1
+            self.last_error = why
+
+    def stats(self):
+        """Shard statistics.
+
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'published': self.published,
+                'confirmed': self.confirmed,
+                'nacked': self.nacked,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'is_open': self.connection.is_open
+            }
+
+    def close(self):
+        """Close the channels, and the connection, of the shard.
+
+        :return:
+        """
+        self.channels.close()
+        try:
+            self.connection.close()
+        except AMQPError as why:
+            LOGGER.debug('Failed to close shard connection: %s', why)
+
+
+class ShardedPublisher(object):
+    """Publish over multiple Connections.
+
+        A single connection is limited by its single socket and write
+        lock. The ShardedPublisher spreads messages over a number of
+        connections, optionally to different nodes in the cluster.
+
+        With the round_robin strategy messages are spread evenly, and a
+        shard whose connection or channel is not open is skipped. A
+        message is never retried once it has been written, e.g. after a
+        nack or a confirm timeout, as it may already have been delivered.
+        With the routing_key strategy every message with the same routing
+        key goes to the same shard, which preserves their order.
+
+        e.g.
+            publisher = ShardedPublisher(['node1', 'node2'], 'guest',
+                                         'guest', shards=4,
+                                         confirm_deliveries=True)
+            publisher.publish('Hello World!', 'my_queue')
+    """
+
+    def __init__(self, hostname, username, password, port=5672, shards=None,
+                 strategy=ROUND_ROBIN, confirm_deliveries=False, **kwargs):
+        """
+        :param str|list hostname: One or more hosts. The shards are spread
+                                  over the hosts.
+        :param str username:
+        :param str password:
+        :param int port:
+        :param int shards: Number of connections (defaults to the number
+                           of hosts)
+        :param str strategy: round_robin or routing_key
+        :param bool confirm_deliveries: Enable publisher confirms
+        :param class connection_class: Connection class to use
+
+            Any other arguments are passed on to each Connection.
+        """
+        hosts = [hostname] if compatibility.is_string(hostname) \
+            else list(hostname)
+        if shards is None:
+            shards = len(hosts)
+        if not hosts:
+            raise AMQPInvalidArgument('hostname should be a string or a '
+                                      'list of strings')
+        elif not compatibility.is_integer(shards) or shards < 1:
+            raise AMQPInvalidArgument('shards should be a positive integer')
+        elif strategy not in STRATEGIES:
+            raise AMQPInvalidArgument('strategy should be one of: %s' %
+                                      ', '.join(STRATEGIES))
+        elif not isinstance(confirm_deliveries, bool):
+            raise AMQPInvalidArgument('confirm_deliveries should be a '
+                                      'boolean')
+        connection_class = kwargs.pop('connection_class', Connection)
+        self.strategy = strategy
+        self._counter = itertools.count()
+        self.shards = []
+        try:
+            for index in range(shards):
+                connection = connection_class(hosts[index % len(hosts)],
+                                              username, password, port,
+                                              **kwargs)
+                self.shards.append(Shard(connection, confirm_deliveries))
+        except AMQPError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, _):
+        self.close()
+
+    def publish(self, body, routing_key, exchange='', properties=None,
+                mandatory=False, immediate=False):
+        """Publish Message.
+
+        :param str|unicode body:
+        :param str routing_key:
+        :param str exchange:
+        :param dict properties:
+        :param bool mandatory:
+        :param bool immediate:
+        :rtype: bool|None
+        :raises AMQPInvalidArgument: Invalid Parameters
+        """
+        if self.strategy == ROUTING_KEY:
+            shard = self.shards[self.shard_index(routing_key)]
+            return shard.publish(body, routing_key, exchange, properties,
+                                 mandatory, immediate)
+        start = next(self._counter)
+        for attempt in range(len(self.shards)):
+            shard = self.shards[(start + attempt) % len(self.shards)]
+            try:
+                channel = shard.channel()
+            except AMQPError as why:
+                if attempt + 1 == len(self.shards):
+                    raise
+                LOGGER.warning('Shard unavailable, trying the next shard: '
+                               '%s', why)
+                continue
+            return shard.publish(body, routing_key, exchange, properties,
+                                 mandatory, immediate, channel=channel)
+
+    def shard_index(self, routing_key):
+        """The index of the shard used for a routing key.
+
+            Stable across processes, unlike the built-in hash.
+
+        :param str routing_key:
+        :rtype: int
+        """
+        if not isinstance(routing_key, bytes):
+            routing_key = routing_key.encode('utf-8')
+        return (zlib.crc32(routing_key) & 0xffffffff) % len(self.shards)
+
+    def stats(self):
+        """Aggregated, and per shard, statistics.
+
+        :rtype: dict
+        """
+        shards = [shard.stats() for shard in self.shards]
+        result = {
+            'shards': shards,
+            'open_shards': sum(1 for shard in shards if shard['is_open'])
+        }
+        for key in ('published', 'confirmed', 'nacked', 'errors'):
+            result[key] = sum(shard[key] for shard in shards)
+        return result
+
+    def close(self):
+        """Close all shards.
+
+        :return:
+        """
+        for shard in self.shards:
+            shard.close()
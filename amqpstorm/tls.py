@@ -0,0 +1,192 @@
+"""AMQP-Storm TLS Context and Session Cache."""
+__author__ = 'eandersson'
+
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+
+from amqpstorm.exception import AMQPInvalidArgument
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_SSL_VERSION = None
+SSL_OPTIONS = ('ssl_version', 'cert_reqs', 'certfile', 'keyfile', 'ca_certs',
+               'ciphers', 'context')
+
+if ssl:
+    if hasattr(ssl, 'PROTOCOL_TLSv1_2'):
+        DEFAULT_SSL_VERSION = ssl.PROTOCOL_TLSv1_2
+    elif hasattr(ssl, 'PROTOCOL_TLSv1_1'):
+        DEFAULT_SSL_VERSION = ssl.PROTOCOL_TLSv1_1
+    elif hasattr(ssl, 'PROTOCOL_TLSv1'):
+        DEFAULT_SSL_VERSION = ssl.PROTOCOL_TLSv1
+    elif hasattr(ssl, 'PROTOCOL_SSLv3'):
+        DEFAULT_SSL_VERSION = ssl.PROTOCOL_SSLv3
+
+
+def create_context(options, default_version=None):
+    """Build an SSLContext from the SSL Kwargs.
+
+        Certificates are not verified unless cert_reqs is set, the same
+        as with ssl.wrap_socket.
+
+    :param dict options: SSL Kwargs (ssl_version, cert_reqs, certfile,
+                         keyfile, ca_certs, ciphers)
+    :param int default_version: Protocol used when ssl_version is not set.
+    :raises AMQPInvalidArgument: Unsupported SSL Kwargs
+    :rtype: ssl.SSLContext
+    """
+    unsupported = sorted(set(options) - set(SSL_OPTIONS))
+    if unsupported:
+        raise AMQPInvalidArgument('unsupported ssl_options: %s' %
+                                  ', '.join(unsupported))
+    context = ssl.SSLContext(options.get('ssl_version',
+                                         default_version or
+                                         DEFAULT_SSL_VERSION))
+    if hasattr(context, 'check_hostname'):
+        context.check_hostname = False
+    context.verify_mode = options.get('cert_reqs', ssl.CERT_NONE)
+    if options.get('certfile'):
+        context.load_cert_chain(options['certfile'], options.get('keyfile'))
+    if options.get('ca_certs'):
+        context.load_verify_locations(options['ca_certs'])
+    if options.get('ciphers'):
+        context.set_ciphers(options['ciphers'])
+    return context
+
+
+class ContextCache(object):
+    """Shared SSLContext for each set of SSL Kwargs.
+
+        Loading certificates is expensive, and TLS sessions can only be
+        resumed using the context that created them, so every connection
+        with the same options shares one context.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._contexts = {}
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def get(self, options, default_version=None):
+        """Get the SSLContext for a set of SSL Kwargs.
+
+            An SSLContext passed as the context option is used as is.
+
+        :param dict options: SSL Kwargs
+        :param int default_version: Protocol used when ssl_version is
+                                    not set.
+        :rtype: ssl.SSLContext
+        """
+        if options.get('context'):
+            return options['context']
+        key = repr((sorted(options.items()), default_version))
+        with self.lock:
+            context = self._contexts.get(key)
+            if context is None:
+                context = create_context(options, default_version)
+                self._contexts[key] = context
+            return context
+
+    def clear(self):
+        """Remove all cached contexts.
+
+        :return:
+        """
+        with self.lock:
+            self._contexts.clear()
+
+
+class SessionCache(object):
+    """Most recent TLS session of each host, so that a reconnect can skip
+    the full handshake. Also keeps track of handshake statistics.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        :param int max_size: Maximum number of cached sessions.
+        """
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.handshakes = 0
+        self.resumed = 0
+        self.handshake_time = 0.0
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def average_handshake_time(self):
+        """Average time spent on a TLS handshake.
+
+        :rtype: float
+        """
+        if not self.handshakes:
+            return 0.0
+        return self.handshake_time / self.handshakes
+
+    def get(self, context, host, port):
+        """Get the last session for a host.
+
+        :param ssl.SSLContext context:
+        :param str host:
+        :param int port:
+        :rtype: ssl.SSLSession|None
+        """
+        with self.lock:
+            return self._sessions.get((context, host, port))
+
+    def store(self, context, host, port, sock):
+        """Remember the session of a connected socket.
+
+        :param ssl.SSLContext context:
+        :param str host:
+        :param int port:
+        :param ssl.SSLSocket sock:
+        :return:
+        """
+        session = getattr(sock, 'session', None)
+        if session is None:
+            return
+        key = (context, host, port)
+        with self.lock:
+            self._sessions.pop(key, None)
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_size:
+                self._sessions.popitem(last=False)
+
+    def record_handshake(self, seconds, resumed):
+        """Record a completed handshake.
+
+        :param float seconds: Time spent on the handshake.
+        :param bool resumed: Was a previous session resumed.
+        :return:
+        """
+        with self.lock:
+            self.handshakes += 1
+            self.handshake_time += seconds
+            if resumed:
+                self.resumed += 1
+
+    def clear(self):
+        """Remove all cached sessions, and reset the statistics.
+
+        :return:
+        """
+        with self.lock:
+            self._sessions.clear()
+            self.handshakes = 0
+            self.resumed = 0
+            self.handshake_time = 0.0
+
+
+CONTEXT_CACHE = ContextCache()
+SESSION_CACHE = SessionCache()
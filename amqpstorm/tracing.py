@@ -0,0 +1,223 @@
+"""AMQP-Storm Tracing Hooks.
+
+    Hooks are called around publishing, message delivery and RPC
+    requests, e.g. to propagate trace context in the message headers,
+    or to time each stage.
+
+    e.g.
+        class TraceHook(Hook):
+            def before_publish(self, channel, body, routing_key, exchange,
+                               properties):
+                properties['headers']['trace_id'] = current_trace_id()
+
+            def on_message(self, channel, message):
+                headers = message.properties.get('headers') or {}
+                start_trace(headers.get('trace_id'))
+
+        connection.hooks.add(TraceHook())
+"""
+__author__ = 'eandersson'
+
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Hook(object):
+    """Tracing hook. Override the methods that are needed.
+
+        Anything returned by a before_ method is passed on to the
+        matching after_ method as context, e.g. a span or a start time.
+    """
+
+    def before_publish(self, channel, body, routing_key, exchange,
+                       properties):
+        """Called before a message is marshalled.
+
+            properties is a copy, including a copy of its headers, and
+            changes to it are published.
+
+        :param Channel channel:
+        :param bytes body:
+        :param str routing_key:
+        :param str exchange:
+        :param dict properties:
+        :return: Context passed on to after_publish.
+        """
+
+    def after_publish(self, channel, context, result, error):
+        """Called once a message has been written, or confirmed, or when
+        publishing it failed.
+
+        :param Channel channel:
+        :param context: Returned by before_publish.
+        :param bool|None result: Confirmation, if confirming deliveries,
+                                 or a future on an AsyncChannel.
+        :param Exception|None error: Raised while publishing.
+        :return:
+        """
+
+    def on_message(self, channel, message):
+        """Called when a delivered message has been built.
+
+        :param Channel channel:
+        :param Message message:
+        :return:
+        """
+
+    def before_callback(self, channel, message):
+        """Called before a message is passed to the consumer callback.
+
+        :param Channel channel:
+        :param Message message:
+        :return: Context passed on to after_callback.
+        """
+
+    def after_callback(self, channel, context, message, error):
+        """Called after the consumer callback returned, or raised.
+
+        :param Channel channel:
+        :param context: Returned by before_callback.
+        :param Message message:
+        :param Exception|None error: Raised by the callback.
+        :return:
+        """
+
+    def before_rpc(self, channel, uuid):
+        """Called before waiting for the response to a RPC request.
+
+        :param Channel channel:
+        :param str uuid: Rpc Identifier.
+        :return: Context passed on to after_rpc.
+        """
+
+    def after_rpc(self, channel, context, response, error):
+        """Called once the response to a RPC request arrived, or waiting
+        for it failed, e.g. timed out.
+
+        :param Channel channel:
+        :param context: Returned by before_rpc.
+        :param pamqp_spec.Frame|None response:
+        :param Exception|None error: Raised while waiting.
+        :return:
+        """
+
+
+class Hooks(object):
+    """Hooks registered on a connection, and shared by its channels.
+
+        Callers check active before calling any of the methods, so that
+        hooks cost a single attribute lookup when none are registered.
+        Exceptions raised by hooks are logged, and do not interrupt
+        publishing or consuming.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._hooks = ()
+
+    def add(self, hook):
+        """Register a hook.
+
+        :param Hook hook:
+        :return:
+        """
+        if hook not in self._hooks:
+            self._hooks += (hook,)
+        self.active = True
+
+    def remove(self, hook):
+        """Unregister a hook.
+
+        :param Hook hook:
+        :return:
+        """
+        self._hooks = tuple(registered for registered in self._hooks
+                            if registered is not hook)
+        self.active = bool(self._hooks)
+
+    def before_publish(self, channel, body, routing_key, exchange,
+                       properties):
+        """
+        :rtype: list
+        """
+        return self._before('before_publish', channel, body, routing_key,
+                            exchange, properties)
+
+    def after_publish(self, traces, channel, result, error=None):
+        """
+        :param list traces: Returned by before_publish.
+        :return:
+        """
+        self._after(traces, 'after_publish', channel, result, error)
+
+    def on_message(self, channel, message):
+        """
+        :return:
+        """
+        for hook in self._hooks:
+            self._call(hook, 'on_message', channel, message)
+
+    def before_callback(self, channel, message):
+        """
+        :rtype: list
+        """
+        return self._before('before_callback', channel, message)
+
+    def after_callback(self, traces, channel, message, error=None):
+        """
+        :param list traces: Returned by before_callback.
+        :return:
+        """
+        self._after(traces, 'after_callback', channel, message, error)
+
+    def before_rpc(self, channel, uuid):
+        """
+        :rtype: list
+        """
+        return self._before('before_rpc', channel, uuid)
+
+    def after_rpc(self, traces, channel, response, error=None):
+        """
+        :param list traces: Returned by before_rpc.
+        :return:
+        """
+        self._after(traces, 'after_rpc', channel, response, error)
+
+    def _before(self, method, channel, *args):
+        """Call a before_ method of every hook, and keep the contexts.
+
+        :param str method:
+        :param Channel channel:
+        :return: Hook and context pairs.
+        :rtype: list
+        """
+        return [(hook, self._call(hook, method, channel, *args))
+                for hook in self._hooks]
+
+    def _after(self, traces, method, channel, *args):
+        """Call an after_ method of the hooks that the before_ method
+        was called on.
+
+        :param list traces: Hook and context pairs.
+        :param str method:
+        :param Channel channel:
+        :return:
+        """
+        for hook, context in traces:
+            self._call(hook, method, channel, context, *args)
+
+    @staticmethod
+    def _call(hook, method, *args):
+        """
+        :param Hook hook:
+        :param str method:
+        :return: Whatever the hook returned.
+        """
+        try:
+            return getattr(hook, method)(*args)
+        except Exception as why:
+            LOGGER.warning('Tracing hook %s.%s failed: %s',
+                           hook.__class__.__name__, method, why,
+                           exc_info=True)
+        return None
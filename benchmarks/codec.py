@@ -0,0 +1,307 @@
+"""Microbenchmarks of the frame encoding and decoding paths.
+
+    Synthetic frame streams are fed straight through the codec functions,
+    without a socket, so that codec changes can be measured in isolation.
+
+    Reports the time per frame, and two tracemalloc measurements per
+    frame, taken during a separate run:
+
+        allocs/frame: Blocks allocated, and still referenced once the run
+                      has finished, i.e. the objects each step hands on
+                      to the next.
+        peak B/frame: Peak growth of the traced memory during the run,
+                      which also includes short lived temporaries, e.g.
+                      copies of the input buffer.
+
+    tracemalloc can not count blocks that have already been freed again,
+    so temporaries only show up in the peak. Memory measurements need
+    Python 3.4+, and reset_peak (3.9+) for the peak.
+
+    python -m benchmarks.codec
+    python -m benchmarks.codec --body-size 1048576 --output codec.json
+"""
+__author__ = 'eandersson'
+
+import gc
+import sys
+import json
+import time
+import argparse
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from pamqp import body as pamqp_body
+from pamqp import frame as pamqp_frame
+from pamqp import header as pamqp_header
+from pamqp import specification as pamqp_spec
+
+from amqpstorm.basic import Basic
+from amqpstorm.channel import Channel
+from amqpstorm.message import Message
+from amqpstorm.connection import Connection
+
+from benchmarks.suite import compare
+from benchmarks.suite import metadata
+
+MESSAGES = 1000
+STREAM_BYTES = 16 * 1024 ** 2
+REPEAT = 5
+PROPERTIES = {
+    'content_type': 'text/plain',
+    'correlation_id': 'd5c2b5f4-1d3a-4c5e-9a9e-4b7e2f1c0a11',
+    'delivery_mode': 2,
+    'headers': {'source': 'benchmark'}
+}
+
+
+def create_connection():
+    """Connection that is never opened, and keeps everything written to
+    it in a list instead.
+
+    :rtype: Connection
+    """
+    connection = Connection('localhost', 'guest', 'guest', lazy=True)
+    connection.written = []
+    connection.io.write_to_socket = connection.written.append
+    return connection
+
+
+def delivery_frames(body):
+    """Basic.Deliver, ContentHeader and ContentBody frames of a message.
+
+    :param bytes body:
+    :rtype: list
+    """
+    return [pamqp_spec.Basic.Deliver(consumer_tag='ctag', delivery_tag=1,
+                                     exchange='exchange',
+                                     routing_key='routing_key'),
+            pamqp_header.ContentHeader(
+                body_size=len(body),
+                properties=pamqp_spec.Basic.Properties(**PROPERTIES)),
+            pamqp_body.ContentBody(body)]
+
+
+def bench_read_buffer(body, messages):
+    """Unmarshal a stream of incoming deliveries, and hand the frames to
+    the channel.
+
+    :param bytes body:
+    :param int messages:
+    :return: Frames per run, and the function to run.
+    :rtype: tuple
+    """
+    connection = create_connection()
+    channel = Channel(1, connection, 360)
+    connection._channels[1] = channel
+    stream = b''.join(pamqp_frame.marshal(frame, 1)
+                      for frame in delivery_frames(body)) * messages
+
+    def run():
+        channel._inbound = []
+        connection._read_buffer(stream)
+        return channel._inbound
+
+    return messages * 3, run
+
+
+def bench_write_frames(body, messages):
+    """Marshal outgoing publishes.
+
+    :param bytes body:
+    :param int messages:
+    :rtype: tuple
+    """
+    connection = create_connection()
+    frames = [pamqp_spec.Basic.Publish(exchange='exchange',
+                                       routing_key='routing_key'),
+              pamqp_header.ContentHeader(
+                  body_size=len(body),
+                  properties=pamqp_spec.Basic.Properties(**PROPERTIES)),
+              pamqp_body.ContentBody(body)]
+
+    def run():
+        del connection.written[:]
+        for _ in range(messages):
+            connection.write_frames(1, frames)
+        return list(connection.written)
+
+    return messages * len(frames), run
+
+
+def bench_create_content_body(body, messages):
+    """Split outgoing bodies into body frames.
+
+    :param bytes body:
+    :param int messages:
+    :rtype: tuple
+    """
+    frames_per_body = len(list(Basic._create_content_body(body)))
+
+    def run():
+        frames = []
+        for _ in range(messages):
+            frames.extend(Basic._create_content_body(body))
+        return frames
+
+    return messages * frames_per_body, run
+
+
+def bench_build_message(body, messages):
+    """Assemble Messages from unmarshalled incoming frames.
+
+    :param bytes body:
+    :param int messages:
+    :rtype: tuple
+    """
+    channel = Channel(1, create_connection(), 360)
+    frames = delivery_frames(body) * messages
+
+    def run():
+        channel._inbound = list(frames)
+        return [channel._build_message() for _ in range(messages)]
+
+    return len(frames), run
+
+
+def bench_message_decode(body, messages):
+    """Create Messages, and read the decoded body and properties.
+
+    :param bytes body:
+    :param int messages:
+    :rtype: tuple
+    """
+    channel = Channel(1, create_connection(), 360)
+    deliver, header, _ = delivery_frames(body)
+    method = dict(deliver)
+    properties = dict(header.properties)
+
+    def run():
+        decoded = []
+        for _ in range(messages):
+            message = Message(channel=channel, body=body, method=method,
+                              properties=properties)
+            decoded.append((message.body, message.properties))
+        return decoded
+
+    return messages * 3, run
+
+
+BENCHMARKS = (
+    ('connection.read_buffer', bench_read_buffer),
+    ('connection.write_frames', bench_write_frames),
+    ('basic.create_content_body', bench_create_content_body),
+    ('channel.build_message', bench_build_message),
+    ('message.decode', bench_message_decode)
+)
+
+
+def measure(frames, run, repeat):
+    """Best time per frame, and memory allocated per frame.
+
+    :param int frames: Frames processed by each run.
+    :param function run: Processes the frames, and returns the output.
+    :param int repeat:
+    :return: Nanoseconds, allocated blocks and peak bytes per frame.
+    :rtype: tuple
+    """
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start_time)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    allocations, peak = trace_allocations(run)
+    if allocations is not None:
+        allocations /= float(frames)
+    if peak is not None:
+        peak /= float(frames)
+    return min(timings) / frames * 1e9, allocations, peak
+
+
+def trace_allocations(run):
+    """Blocks still allocated after a run, and the peak growth of the
+    traced memory during it.
+
+    :param function run:
+    :rtype: tuple
+    """
+    if tracemalloc is None:
+        return None, None
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        baseline = tracemalloc.get_traced_memory()[0]
+        has_peak = hasattr(tracemalloc, 'reset_peak')
+        if has_peak:
+            tracemalloc.reset_peak()
+        output = run()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+    finally:
+        tracemalloc.stop()
+    del output
+    blocks = sum(stat.count_diff
+                 for stat in after.compare_to(before, 'filename'))
+    return blocks, peak if has_peak else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--body-size', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--output', help='write the results to a file')
+    parser.add_argument('--compare', help='earlier results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change counted as a regression')
+    args = parser.parse_args(argv)
+
+    body = b'x' * args.body_size
+    # Large bodies use fewer messages, to keep the streams in memory.
+    messages = max(min(MESSAGES, STREAM_BYTES // max(args.body_size, 1)), 10)
+    results = {}
+    print('{0:<30} {1:>12} {2:>14} {3:>14}'.format(
+        '', 'ns/frame', 'allocs/frame', 'peak B/frame'))
+    for name, benchmark in BENCHMARKS:
+        nanoseconds, allocations, peak = measure(*benchmark(body, messages),
+                                                 repeat=args.repeat)
+        results[name + '.time'] = {'value': round(nanoseconds, 1),
+                                   'unit': 'ns/frame'}
+        if allocations is not None:
+            results[name + '.allocs'] = {'value': round(allocations, 2),
+                                         'unit': 'allocs/frame'}
+        if peak is not None:
+            results[name + '.peak'] = {'value': round(peak, 1),
+                                       'unit': 'B/frame'}
+        print('{0:<30} {1:>12,.1f} {2:>14} {3:>14}'.format(
+            name, nanoseconds,
+            '-' if allocations is None else '%.2f' % allocations,
+            '-' if peak is None else '{0:,.1f}'.format(peak)))
+
+    results = {'meta': metadata(body_size=args.body_size,
+                                messages=messages, repeat=args.repeat),
+               'results': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline), results,
+                                  args.threshold)
+        if regressions:
+            print('Regressions: %s' % ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
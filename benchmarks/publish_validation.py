@@ -0,0 +1,82 @@
+"""Measure the per-publish cost of argument validation.
+
+    Both modes are timed in turn, REPEAT times, and the best run of each
+    is kept, so that noise from other processes affects both equally.
+
+    python -m benchmarks.publish_validation
+"""
+__author__ = 'eandersson'
+
+import timeit
+
+from amqpstorm.base import Stateful
+from amqpstorm.channel import Channel
+
+NUMBER = 20000
+REPEAT = 25
+
+
+class NullConnection(Stateful):
+    """Connection that discards everything written to it."""
+
+    def __init__(self):
+        super(NullConnection, self).__init__()
+        self.set_state(self.OPEN)
+
+    def write_frame(self, channel_id, frame_out):
+        pass
+
+    def write_frames(self, channel_id, frames_out):
+        pass
+
+
+def create_publish(validate, properties):
+    """Create a function that publishes a single message.
+
+    :param bool validate:
+    :param dict properties:
+    :rtype: function
+    """
+    channel = Channel(1, NullConnection(), 360, validate=validate)
+    channel.set_state(Channel.OPEN)
+
+    def publish():
+        channel.basic.publish(b'Hello World!', 'routing_key',
+                              exchange='exchange', properties=properties)
+
+    return publish
+
+
+def time_publish(properties):
+    """Best time in microseconds for a single Basic.publish, with and
+    without validation.
+
+    :param dict properties:
+    :rtype: tuple
+    """
+    validated = create_publish(True, properties)
+    trusted = create_publish(False, properties)
+    best_validated = best_trusted = float('inf')
+    for _ in range(REPEAT):
+        best_validated = min(best_validated,
+                             timeit.timeit(validated, number=NUMBER))
+        best_trusted = min(best_trusted,
+                           timeit.timeit(trusted, number=NUMBER))
+    return (best_validated / NUMBER * 1e6,
+            best_trusted / NUMBER * 1e6)
+
+
+def main():
+    for name, properties in (('no properties', None),
+                             ('content_type', {'content_type':
+                                               'text/plain'})):
+        validated, trusted = time_publish(properties)
+        print(name)
+        print('  validate=True:  {0:.3f} us/publish'.format(validated))
+        print('  validate=False: {0:.3f} us/publish'.format(trusted))
+        print('  saving:         {0:.3f} us/publish ({1:.1f}%)'.format(
+            validated - trusted, (validated - trusted) / validated * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Replay a frame capture offline, optionally under the profiler.
+
+    Captures are recorded using connection.start_capture(path).
+
+    python -m benchmarks.replay consumer.capture
+    python -m benchmarks.replay consumer.capture --ack --profile
+"""
+__author__ = 'eandersson'
+
+import sys
+import pstats
+import cProfile
+import argparse
+
+from amqpstorm.replay import replay
+
+
+def ack_message(message):
+    """Acknowledge a replayed message, to include acks in the replay.
+
+    :param Message message:
+    :return:
+    """
+    message.ack()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('capture', help='capture file to replay')
+    parser.add_argument('--speed', type=float,
+                        help='keep the captured gaps between frames, '
+                             'divided by speed')
+    parser.add_argument('--ack', action='store_true',
+                        help='acknowledge every message')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the functions that took the most time')
+    parser.add_argument('--sort', default='cumulative',
+                        help='profile sort order')
+    parser.add_argument('--limit', type=int, default=30,
+                        help='number of functions to print')
+    args = parser.parse_args(argv)
+
+    on_message = ack_message if args.ack else None
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    stats = replay(args.capture, on_message=on_message, speed=args.speed)
+    if profiler:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats(args.sort).print_stats(args.limit)
+
+    elapsed = stats['elapsed']
+    print('records:  {0:,}'.format(stats['records']))
+    print('messages: {0:,}'.format(stats['messages']))
+    print('bytes:    {0:,} in, {1:,} out'.format(stats['bytes_in'],
+                                                 stats['bytes_out']))
+    print('elapsed:  {0:.3f}s ({1:,.0f} messages/s)'.format(
+        elapsed, stats['messages'] / elapsed if elapsed else 0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
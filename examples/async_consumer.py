@@ -0,0 +1,28 @@
+__author__ = 'eandersson'
+
+import asyncio
+import logging
+
+from amqpstorm.aio import AsyncConnection
+
+from examples import HOST
+from examples import USERNAME
+from examples import PASSWORD
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+async def consumer():
+    async with AsyncConnection(HOST, USERNAME, PASSWORD) as connection:
+        channel = await connection.channel()
+        await channel.queue.declare('simple_queue')
+        await channel.confirm_deliveries()
+        if await channel.basic.publish(b'Hello World!', 'simple_queue'):
+            print("Message was delivered.")
+        async for message in channel.consume('simple_queue'):
+            print("Message:", message.body)
+            message.ack()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(consumer())
@@ -16,6 +16,7 @@ setup(name='AMQP-Storm',
       license='MIT License',
       url='http://github.com/eandersson/amqp-storm',
       install_requires=['pamqp>=1.6.1,<2.0'],
+      python_requires='>=2.7, !=3.0.*, !=3.1.*',
       package_data={'': ['README.md', 'LICENSE', 'CHANGELOG']},
       classifiers=[
           'Development Status :: 5 - Production/Stable',
@@ -24,7 +25,6 @@ setup(name='AMQP-Storm',
           'Natural Language :: English',
           'Operating System :: OS Independent',
           'Programming Language :: Python :: 2',
-          'Programming Language :: Python :: 2.6',
           'Programming Language :: Python :: 2.7',
           'Programming Language :: Python :: 3',
           'Programming Language :: Python :: 3.2',
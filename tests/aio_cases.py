@@ -0,0 +1,169 @@
+__author__ = 'eandersson'
+
+import asyncio
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pamqp import specification
+from pamqp.body import ContentBody
+from pamqp.header import ContentHeader
+
+from amqpstorm import exception
+from amqpstorm.aio import AsyncIO
+from amqpstorm.aio import AsyncChannel
+
+from tests.utility import FakeConnection
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+class AsyncChannelTests(unittest.TestCase):
+    def test_rpc_request(self):
+        async def declare():
+            channel = AsyncChannel(1, FakeConnection(), 1)
+            channel.set_state(AsyncChannel.OPEN)
+            request = asyncio.ensure_future(channel.queue.declare('test'))
+            await asyncio.sleep(0)
+            channel.on_frame(specification.Queue.DeclareOk(queue='test'))
+            return await request
+
+        result = run(declare())
+        self.assertEqual(result['queue'], 'test')
+
+    def test_rpc_request_timeout(self):
+        async def declare():
+            channel = AsyncChannel(1, FakeConnection(), 0.01)
+            channel.set_state(AsyncChannel.OPEN)
+            await channel.queue.declare('test')
+
+        self.assertRaises(exception.AMQPChannelError, run, declare())
+
+    def test_publish_confirm(self):
+        async def publish():
+            channel = AsyncChannel(1, FakeConnection(), 1)
+            channel.set_state(AsyncChannel.OPEN)
+            channel.confirming_deliveries = True
+            first = channel.basic.publish(b'first', 'test')
+            second = channel.basic.publish(b'second', 'test')
+            third = channel.basic.publish(b'third', 'test')
+            channel.on_frame(specification.Basic.Ack(delivery_tag=2,
+                                                     multiple=True))
+            channel.on_frame(specification.Basic.Nack(delivery_tag=3))
+            return await asyncio.gather(first, second, third)
+
+        self.assertEqual(run(publish()), [True, True, False])
+
+    def test_consume_iterator(self):
+        async def consume():
+            channel = AsyncChannel(1, FakeConnection(), 1)
+            channel.set_state(AsyncChannel.OPEN)
+            consumer = channel.consume('test')
+            start = asyncio.ensure_future(consumer.start())
+            await asyncio.sleep(0)
+            channel.on_frame(
+                specification.Basic.ConsumeOk(consumer_tag=b'tag'))
+            await start
+            channel.on_frame(
+                specification.Basic.Deliver(consumer_tag=b'tag'))
+            channel.on_frame(ContentHeader(body_size=10))
+            channel.on_frame(ContentBody(b'Hello'))
+            channel.on_frame(ContentBody(b'World'))
+            channel.unregister_consumer(b'tag')
+            return [message.body async for message in consumer]
+
+        self.assertEqual(run(consume()), ['HelloWorld'])
+
+    def test_get(self):
+        async def get():
+            channel = AsyncChannel(1, FakeConnection(), 1)
+            channel.set_state(AsyncChannel.OPEN)
+            request = asyncio.ensure_future(channel.basic.get('test'))
+            await asyncio.sleep(0)
+            channel.on_frame(specification.Basic.GetOk())
+            channel.on_frame(ContentHeader(body_size=5))
+            channel.on_frame(ContentBody(b'Hello'))
+            return await request
+
+        self.assertEqual(run(get())['body'], b'Hello')
+
+    def test_get_empty(self):
+        async def get():
+            channel = AsyncChannel(1, FakeConnection(), 1)
+            channel.set_state(AsyncChannel.OPEN)
+            request = asyncio.ensure_future(channel.basic.get('test'))
+            await asyncio.sleep(0)
+            channel.on_frame(specification.Basic.GetEmpty())
+            return await request
+
+        self.assertIsNone(run(get()))
+
+    def test_channel_close_aborts_waiters(self):
+        async def publish():
+            channel = AsyncChannel(1, FakeConnection(), 1)
+            channel.set_state(AsyncChannel.OPEN)
+            channel.confirming_deliveries = True
+            future = channel.basic.publish(b'body', 'test')
+            channel.on_frame(specification.Channel.Close(reply_code=404,
+                                                         reply_text=b''))
+            await future
+
+        self.assertRaises(exception.AMQPChannelError, run, publish())
+
+    def test_futures_use_the_connection_loop(self):
+        loop = asyncio.new_event_loop()
+        connection = FakeConnection()
+        connection.loop = loop
+        channel = AsyncChannel(1, connection, 1)
+        channel.set_state(AsyncChannel.OPEN)
+        channel.confirming_deliveries = True
+        try:
+            future = channel.basic.publish(b'body', 'test')
+            uuid = channel.rpc.register_request(['Queue.DeclareOk'])
+        finally:
+            loop.close()
+
+        self.assertIs(channel.loop, loop)
+        self.assertIs(future._loop, loop)
+        self.assertIs(channel.rpc._futures[uuid]._loop, loop)
+
+
+class AsyncIOTests(unittest.TestCase):
+    def setUp(self):
+        self.errors = []
+        self.io = AsyncIO({}, on_error=self.errors.append)
+        self.io.connection_made(object())
+        self.io.set_state(AsyncIO.OPEN)
+
+    def test_drain_without_backpressure(self):
+        run(self.io.drain())
+
+    def test_drain_waits_for_resume_writing(self):
+        async def drain():
+            self.io.pause_writing()
+            waiter = asyncio.ensure_future(self.io.drain())
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            self.io.resume_writing()
+            await asyncio.wait_for(waiter, 1)
+
+        run(drain())
+
+    def test_connection_lost_wakes_up_drain(self):
+        async def drain():
+            self.io.pause_writing()
+            waiter = asyncio.ensure_future(self.io.drain())
+            await asyncio.sleep(0)
+            self.io.connection_lost(None)
+            await asyncio.wait_for(waiter, 1)
+
+        run(drain())
+        self.assertEqual(self.errors, ['connection/socket closed'])
@@ -0,0 +1,8 @@
+__author__ = 'eandersson'
+
+import sys
+
+# async/await is a SyntaxError before Python 3.5, so the test cases are
+# only imported, and collected, on Python 3.5+.
+if sys.version_info >= (3, 5):
+    from tests.aio_cases import *  # noqa
@@ -101,6 +101,17 @@ class BasicBasicTests(unittest.TestCase):
         self.assertEqual(basic._get_content_body(uuid, len(message)),
                          message)
 
+    def test_get_content_body_from_many_frames(self):
+        channel = Channel(0, FakeConnection(), 360)
+        channel.set_state(Channel.OPEN)
+        basic = Basic(channel)
+        uuid = channel.rpc.register_request(['ContentBody'])
+        for piece in (b'Hello', b' ', b'World!'):
+            channel.rpc.on_frame(ContentBody(value=piece))
+
+        self.assertEqual(basic._get_content_body(uuid, 12), b'Hello World!')
+        self.assertNotIn(uuid, channel.rpc.response)
+
     def test_get_content_body_timeout_error(self):
         message = b'Hello World!'
         body = ContentBody(value=message)
@@ -111,3 +122,31 @@ class BasicBasicTests(unittest.TestCase):
         self.assertRaises(exception.AMQPChannelError, basic._get_content_body,
                           uuid, len(message))
 
+    def test_basic_publish_without_validation(self):
+        connection = FakeConnection()
+        channel = Channel(9, connection, 0.0001, validate=False)
+        channel.set_state(Channel.OPEN)
+        channel.basic.publish(body=b'Hello World!', routing_key='hello',
+                              mandatory=1)
+
+        _, payload = connection.frames_out.pop()
+        self.assertIsInstance(payload[0], spec_basic.Publish)
+
+    def test_basic_publish_invalid_parameters(self):
+        channel = Channel(9, FakeConnection(), 0.0001)
+        channel.set_state(Channel.OPEN)
+        self.assertRaises(exception.AMQPInvalidArgument,
+                          channel.basic.publish, b'Hello World!', 'hello',
+                          mandatory=1)
+
+    def test_basic_ack_without_validation(self):
+        connection = FakeConnection()
+        channel = Channel(9, connection, 0.0001, validate=False)
+        channel.set_state(Channel.OPEN)
+        channel.basic.ack(delivery_tag=1, multiple=True)
+
+        _, frame_out = connection.frames_out.pop()
+        self.assertIsInstance(frame_out, spec_basic.Ack)
+        self.assertRaises(exception.AMQPInvalidArgument,
+                          Channel(9, connection, 0.0001).basic.ack,
+                          delivery_tag='1')
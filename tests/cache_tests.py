@@ -0,0 +1,135 @@
+__author__ = 'eandersson'
+
+import logging
+from decimal import Decimal
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pamqp import header as pamqp_header
+from pamqp import specification as pamqp_spec
+
+from amqpstorm.cache import EMPTY_PROPERTIES
+from amqpstorm.cache import PROPERTIES_CACHE
+from amqpstorm.cache import PropertiesCache
+from amqpstorm.cache import CachedContentHeader
+from amqpstorm.channel import Channel
+
+from tests.utility import FakeConnection
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class PropertiesCacheTests(unittest.TestCase):
+    def test_hit_rate(self):
+        cache = PropertiesCache()
+        self.assertEqual(cache.hit_rate, 0.0)
+        for _ in range(4):
+            cache.get({'content_type': 'text/plain',
+                       'headers': {'key': 'value', 'list': [1, 2]}})
+
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hit_rate, 0.75)
+        self.assertEqual(len(cache), 1)
+
+    def test_encoded_properties_match_pamqp(self):
+        cache = PropertiesCache()
+        properties = {'app_id': 'test', 'delivery_mode': 2,
+                      'headers': {'key': 'value'}}
+        result, encoded = cache.get(properties)
+
+        self.assertIsInstance(result, pamqp_spec.Basic.Properties)
+        self.assertEqual(
+            encoded, pamqp_spec.Basic.Properties(**properties).marshal())
+
+    def test_types_are_part_of_the_key(self):
+        cache = PropertiesCache()
+        _, encoded_bool = cache.get({'headers': {'flag': True}})
+        _, encoded_int = cache.get({'headers': {'flag': 1}})
+
+        self.assertNotEqual(encoded_bool, encoded_int)
+        self.assertEqual(cache.misses, 2)
+
+    def test_key_order_does_not_matter(self):
+        cache = PropertiesCache()
+        cache.get({'app_id': 'test', 'headers': {'a': 1, 'b': [1, 2]}})
+        _, encoded = cache.get({'headers': {'b': [1, 2], 'a': 1},
+                                'app_id': 'test'})
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_nested_types_are_part_of_the_key(self):
+        cache = PropertiesCache()
+        cache.get({'headers': {'list': [True], 'decimal': Decimal('1.0')}})
+        cache.get({'headers': {'list': [1], 'decimal': Decimal('1.0')}})
+        cache.get({'headers': {'list': [True], 'decimal': Decimal('1.00')}})
+
+        self.assertEqual(cache.misses, 3)
+
+    def test_unsupported_values_are_not_cached(self):
+        cache = PropertiesCache()
+        properties = {'headers': {'value': bytearray(b'data')}}
+        _, encoded = cache.get(properties)
+
+        self.assertEqual(
+            encoded, pamqp_spec.Basic.Properties(**properties).marshal())
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PropertiesCache(max_size=2)
+        cache.get({'app_id': 'first'})
+        cache.get({'app_id': 'second'})
+        cache.get({'app_id': 'first'})
+        cache.get({'app_id': 'third'})
+        cache.get({'app_id': 'first'})
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.hits, 2)
+        cache.get({'app_id': 'second'})
+        self.assertEqual(cache.misses, 4)
+
+    def test_clear(self):
+        cache = PropertiesCache()
+        cache.get({})
+        cache.get({})
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(cache.misses, 0)
+
+
+class CachedContentHeaderTests(unittest.TestCase):
+    def test_marshal_matches_pamqp(self):
+        properties, encoded = PropertiesCache().get({'app_id': 'test'})
+        header = CachedContentHeader(1024, properties, encoded)
+        expected = pamqp_header.ContentHeader(body_size=1024,
+                                              properties=properties)
+
+        self.assertEqual(header.marshal(), expected.marshal())
+        self.assertEqual(dict(header.properties)['app_id'], 'test')
+
+
+class PublishCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.channel = Channel(1, self.connection, 360)
+        self.channel.set_state(Channel.OPEN)
+        PROPERTIES_CACHE.clear()
+
+    def test_empty_properties_skip_the_cache(self):
+        self.channel.basic.publish(b'hello', 'routing_key')
+        self.channel.basic.publish(b'hello', 'routing_key', properties={})
+
+        self.assertEqual(PROPERTIES_CACHE.hits + PROPERTIES_CACHE.misses, 0)
+        header = self.connection.frames_out[-1][1][1]
+        self.assertEqual(header.marshal(),
+                         pamqp_header.ContentHeader(
+                             body_size=5,
+                             properties=EMPTY_PROPERTIES[0]).marshal())
@@ -0,0 +1,170 @@
+__author__ = 'eandersson'
+
+import os
+import shutil
+import logging
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pamqp import frame as pamqp_frame
+from pamqp import specification as pamqp_spec
+
+from amqpstorm import Connection
+from amqpstorm.capture import MAGIC
+from amqpstorm.capture import RECORD
+from amqpstorm.capture import INBOUND
+from amqpstorm.capture import OUTBOUND
+from amqpstorm.capture import Capture
+from amqpstorm.capture import read_capture
+from amqpstorm.replay import replay
+from amqpstorm.exception import AMQPInvalidArgument
+from amqpstorm.fake_broker import FakeBroker
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class CaptureTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.capture')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record(self):
+        capture = Capture(self.path)
+        capture.record(INBOUND, b'inbound')
+        capture.record(OUTBOUND, [b'out', memoryview(b'bound')])
+        capture.close()
+
+        records = list(read_capture(self.path))
+        self.assertEqual([(direction, data)
+                          for _, direction, data in records],
+                         [(INBOUND, b'inbound'), (OUTBOUND, b'outbound')])
+        self.assertEqual(capture.records, 2)
+        self.assertEqual(capture.size, os.path.getsize(self.path))
+
+    def test_max_bytes(self):
+        capture = Capture(self.path, max_bytes=len(MAGIC) +
+                          2 * (RECORD.size + 4))
+        for _ in range(5):
+            capture.record(INBOUND, b'data')
+        capture.close()
+
+        self.assertEqual(len(list(read_capture(self.path))), 2)
+        self.assertEqual(capture.dropped, 3)
+        self.assertLessEqual(os.path.getsize(self.path), capture.max_bytes)
+
+    def test_closed(self):
+        capture = Capture(self.path)
+        capture.close()
+        capture.record(INBOUND, b'data')
+        capture.close()
+
+        self.assertTrue(capture.is_closed)
+        self.assertEqual(capture.records, 0)
+
+    def test_truncated_record(self):
+        capture = Capture(self.path)
+        capture.record(INBOUND, b'complete')
+        capture.record(INBOUND, b'truncated')
+        capture.close()
+        with open(self.path, 'r+b') as capture_file:
+            capture_file.truncate(capture.size - 1)
+
+        self.assertEqual([data for _, _, data in read_capture(self.path)],
+                         [b'complete'])
+
+    def test_not_a_capture(self):
+        with open(self.path, 'wb') as capture_file:
+            capture_file.write(b'not a capture file')
+
+        self.assertRaises(AMQPInvalidArgument, list,
+                          read_capture(self.path))
+
+    def test_invalid_arguments(self):
+        self.assertRaises(AMQPInvalidArgument, Capture, None)
+        self.assertRaises(AMQPInvalidArgument, Capture, self.path, 'max')
+
+
+class ReplayTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.capture')
+        self.broker = FakeBroker()
+        self.connection = Connection('localhost', 'guest', 'guest',
+                                     transport=self.broker.transport(),
+                                     lazy=True)
+
+    def tearDown(self):
+        self.connection.stop_capture()
+        self.connection.close()
+        self.broker.stop()
+        shutil.rmtree(self.directory)
+
+    def consume(self, messages):
+        self.connection.start_capture(self.path)
+        self.connection.open()
+        channel = self.connection.channel()
+        channel.queue.declare('test')
+        for index in range(messages):
+            channel.basic.publish(b'x' * 300000, 'test',
+                                  properties={'headers': {'index': index}})
+        channel.basic.get('test', to_dict=False).ack()
+        received = []
+
+        def on_message(message):
+            received.append(message)
+            message.ack()
+            if len(received) == messages - 1:
+                channel.stop_consuming()
+
+        channel.basic.consume(on_message, 'test')
+        channel.start_consuming(to_tuple=False)
+        self.connection.stop_capture()
+
+    def test_capture(self):
+        self.consume(3)
+
+        records = list(read_capture(self.path))
+        inbound = [data for _, direction, data in records
+                   if direction == INBOUND]
+        outbound = [data for _, direction, data in records
+                    if direction == OUTBOUND]
+        _, _, start = pamqp_frame.unmarshal(inbound[0])
+        _, _, start_ok = pamqp_frame.unmarshal(outbound[0])
+        self.assertIsInstance(start, pamqp_spec.Connection.Start)
+        self.assertIsInstance(start_ok, pamqp_spec.Connection.StartOk)
+        self.assertEqual(sum(len(data) for data in inbound),
+                         self.connection.io.receive_bytes)
+
+    def test_replay(self):
+        self.consume(3)
+        headers = []
+
+        def on_message(message):
+            headers.append(message.properties['headers'])
+            message.ack()
+
+        stats = replay(self.path, on_message=on_message)
+
+        self.assertEqual(headers, [{'index': 0}, {'index': 1},
+                                   {'index': 2}])
+        self.assertEqual(stats['messages'], 3)
+        self.assertEqual(stats['deliveries'], 3)
+        self.assertEqual(stats['acks'], 3)
+        self.assertEqual(stats['frames_in']['ContentBody'], 9)
+        self.assertEqual(stats['bytes_in'],
+                         self.connection.io.receive_bytes)
+
+    def test_replay_speed(self):
+        self.consume(2)
+
+        stats = replay(self.path, speed=1000.0)
+
+        self.assertEqual(stats['messages'], 2)
@@ -102,3 +102,25 @@ class BasicChannel0Tests(unittest.TestCase):
         channel_id, frame_out = connection.frames_out.pop()
         self.assertEqual(channel_id, 0)
         self.assertIsInstance(frame_out, Connection.Close)
+
+    def test_negotiate_heartbeat(self):
+        connection = FakeConnection()
+        channel = Channel0(connection)
+        connection.parameters['heartbeat'] = 60
+        self.assertEqual(channel._negotiate_heartbeat(30), 30)
+        self.assertEqual(channel._negotiate_heartbeat(120), 60)
+        self.assertEqual(channel._negotiate_heartbeat(0), 60)
+        connection.parameters['heartbeat'] = 0
+        self.assertEqual(channel._negotiate_heartbeat(30), 0)
+        connection.parameters['heartbeat'] = 60
+
+    def test_tune_uses_negotiated_heartbeat(self):
+        connection = FakeConnection()
+        connection.parameters['virtual_host'] = '/'
+        channel = Channel0(connection)
+        channel.on_frame(Connection.Tune(heartbeat=10))
+
+        self.assertEqual(channel.heartbeat_interval, 10)
+        _, tune_ok = connection.frames_out[-2]
+        self.assertIsInstance(tune_ok, Connection.TuneOk)
+        self.assertEqual(tune_ok.heartbeat, 10)
@@ -2,6 +2,7 @@ __author__ = 'eandersson'
 
 import sys
 import logging
+import threading
 
 try:
     import unittest2 as unittest
@@ -70,4 +71,30 @@ class CompatibilityTests(unittest.TestCase):
 
     def test_try_utf8_decode_on_dict(self):
         x = dict(hello='world')
-        self.assertEqual(x, compatibility.try_utf8_decode(x))
\ No newline at end of file
+        self.assertEqual(x, compatibility.try_utf8_decode(x))
+
+
+class ThreadFutureTests(unittest.TestCase):
+    def test_result_from_another_thread(self):
+        future = compatibility.ThreadFuture()
+        thread = threading.Thread(target=future.set_result, args=('done',))
+        thread.start()
+
+        self.assertEqual(future.result(timeout=5), 'done')
+        self.assertTrue(future.done())
+        self.assertIsNone(future.exception())
+        thread.join()
+
+    def test_exception_is_raised(self):
+        future = compatibility.ThreadFuture()
+        future.set_exception(ValueError('failed'))
+
+        self.assertRaises(ValueError, future.result, 5)
+        self.assertIsInstance(future.exception(), ValueError)
+
+    def test_timeout(self):
+        future = compatibility.ThreadFuture()
+
+        self.assertFalse(future.done())
+        self.assertRaises(compatibility.FutureTimeoutError, future.result,
+                          0.01)
@@ -0,0 +1,194 @@
+__author__ = 'eandersson'
+
+import socket
+import logging
+from time import time
+from time import sleep
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pamqp import frame as pamqp_frame
+from pamqp import body as pamqp_body
+from pamqp import header as pamqp_header
+from pamqp import specification as pamqp_spec
+
+from amqpstorm import Connection
+from amqpstorm import AMQPConnectionError
+from amqpstorm.io import Poller
+from amqpstorm.channel import Channel
+from amqpstorm.connection import open_connections
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeIO(object):
+    def __init__(self):
+        self.frames_out = []
+
+    def write_to_socket(self, frame_data):
+        self.frames_out.append(frame_data)
+
+
+class SlowConnection(Connection):
+    def __init__(self, delay=0.2, error=None):
+        super(SlowConnection, self).__init__('localhost', 'guest', 'guest',
+                                             lazy=True)
+        self.delay = delay
+        self.error = error
+
+    def open(self):
+        sleep(self.delay)
+        if self.error:
+            raise self.error
+        self.set_state(self.OPEN)
+
+
+class ConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = Connection('localhost', 'guest', 'guest',
+                                     lazy=True)
+        self.connection.io = FakeIO()
+
+    def open_channel(self):
+        channel = self.connection._create_channel(Channel, 360)
+        channel.set_state(channel.OPEN)
+        return channel
+
+    def test_lazy_connection_is_not_opened(self):
+        connection = Connection('localhost', 'guest', 'guest', lazy=True)
+        self.assertTrue(connection.is_closed)
+        self.assertIsNone(connection.socket)
+
+    def test_write_frames_matches_pamqp(self):
+        frames = [
+            pamqp_spec.Basic.Publish(exchange='ex', routing_key='key'),
+            pamqp_header.ContentHeader(body_size=10),
+            pamqp_body.ContentBody(b'Hello'),
+            pamqp_body.ContentBody(b'World')
+        ]
+        self.connection.write_frames(5, frames)
+
+        expected = b''.join([pamqp_frame.marshal(frame, 5)
+                             for frame in frames])
+        buffers = self.connection.io.frames_out.pop()
+        self.assertIsInstance(buffers, list)
+        self.assertEqual(b''.join(buffers), expected)
+
+    def test_write_frames_does_not_copy_body(self):
+        body = b'Hello World!'
+        self.connection.write_frames(1, [pamqp_body.ContentBody(body)])
+
+        buffers = self.connection.io.frames_out.pop()
+        self.assertIs(buffers[1], body)
+
+    def test_heartbeat_does_not_wait_for_a_busy_writer(self):
+        connection = Connection('localhost', 'guest', 'guest', lazy=True)
+        client, server = socket.socketpair()
+        self.addCleanup(client.close)
+        self.addCleanup(server.close)
+        connection.io.socket = client
+        connection.io.poller = Poller(client.fileno())
+        connection.set_state(connection.OPEN)
+
+        with connection.io._write_lock:
+            connection._send_heartbeat()
+        self.assertEqual(connection.io.write_bytes, 0)
+
+        connection._send_heartbeat()
+        self.assertEqual(connection.io.write_bytes, 8)
+        self.assertEqual(
+            connection.metrics.snapshot()['frames_out']['Heartbeat'], 1)
+
+    def test_read_buffer(self):
+        channel = Channel(1, self.connection, 360)
+        self.connection._channels[1] = channel
+        frames = [
+            pamqp_spec.Basic.Deliver(consumer_tag='ctag', delivery_tag=1),
+            pamqp_header.ContentHeader(body_size=5),
+            pamqp_body.ContentBody(b'Hello')
+        ]
+        data = b''.join([pamqp_frame.marshal(frame, 1) for frame in frames])
+
+        remaining = self.connection._read_buffer(data + data[:10])
+
+        self.assertEqual(remaining, data[:10])
+        self.assertEqual([frame.name for frame in channel._inbound],
+                         ['Basic.Deliver', 'ContentHeader', 'ContentBody'])
+        remaining = self.connection._read_buffer(remaining + data[10:])
+        self.assertEqual(remaining, b'')
+        self.assertEqual(len(channel._inbound), 6)
+
+    def test_read_buffer_unknown_channel(self):
+        data = pamqp_frame.marshal(pamqp_spec.Basic.Ack(), 7)
+
+        self.assertEqual(self.connection._read_buffer(data), b'')
+
+    def test_create_channel_uses_the_lowest_free_id(self):
+        channels = [self.open_channel() for _ in range(3)]
+        channels[1].set_state(channels[1].CLOSED)
+        channels[1].metrics.increment(('frames_out', 'Queue.Declare'))
+
+        channel = self.open_channel()
+
+        self.assertEqual(channel.channel_id, 2)
+        self.assertIs(channel.metrics, channels[1].metrics)
+        self.assertIs(self.connection.channels[2], channel)
+        self.assertEqual(sorted(self.connection.channels), [1, 2, 3])
+
+    def test_closed_channel_metrics_are_kept(self):
+        channels = [self.open_channel() for _ in range(3)]
+        channels[1].metrics.increment(('frames_out', 'Queue.Declare'))
+        channels[1].set_state(channels[1].CLOSED)
+        channels[2].set_state(channels[2].CLOSED)
+        self.open_channel()
+
+        self.assertEqual(sorted(self.connection.channels), [1, 2])
+        self.assertEqual(
+            self.connection.stats()['frames_out']['Queue.Declare'], 1)
+
+    def test_read_buffer_incomplete_header(self):
+        data = pamqp_frame.marshal(pamqp_spec.Basic.Ack(), 1)
+
+        self.assertEqual(self.connection._read_buffer(data[:3]), data[:3])
+
+    def test_open_async(self):
+        connection = SlowConnection(delay=0.01)
+        future = connection.open_async()
+
+        self.assertIs(future.result(timeout=5), connection)
+        self.assertTrue(connection.is_open)
+
+    def test_open_async_error(self):
+        connection = SlowConnection(delay=0.01,
+                                    error=AMQPConnectionError('refused'))
+        future = connection.open_async()
+
+        self.assertRaises(AMQPConnectionError, future.result, 5)
+
+    def test_open_connections_concurrently(self):
+        connections = [SlowConnection(delay=0.2) for _ in range(10)]
+        start_time = time()
+        open_connections(connections, timeout=5)
+
+        self.assertLess(time() - start_time, 1.0)
+        for connection in connections:
+            self.assertTrue(connection.is_open)
+
+    def test_open_connections_error(self):
+        connections = [SlowConnection(delay=0.01),
+                       SlowConnection(delay=0.01,
+                                      error=AMQPConnectionError('refused'))]
+
+        self.assertRaises(AMQPConnectionError, open_connections,
+                          connections, 5)
+        self.assertTrue(connections[0].is_open)
+
+    def test_open_connections_timeout(self):
+        connections = [SlowConnection(delay=1)]
+
+        self.assertRaises(AMQPConnectionError, open_connections,
+                          connections, 0.05)
@@ -0,0 +1,174 @@
+__author__ = 'eandersson'
+
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import Connection
+from amqpstorm import AMQPChannelError
+from amqpstorm import AMQPMessageError
+from amqpstorm.fake_broker import FakeBroker
+from amqpstorm.fake_broker import topic_match
+from amqpstorm.fake_broker import headers_match
+
+from tests.io_tests import wait_for
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeBrokerTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.connection = self.connect()
+        self.channel = self.connection.channel()
+
+    def tearDown(self):
+        self.connection.close()
+        self.broker.stop()
+
+    def connect(self):
+        return Connection('localhost', 'guest', 'guest',
+                          transport=self.broker.transport())
+
+    def test_publish_and_get(self):
+        self.channel.queue.declare('test')
+        self.channel.basic.publish('hello', 'test',
+                                   properties={'message_id': 'id'})
+
+        message = self.channel.basic.get('test', to_dict=False)
+        self.assertEqual(message.body, 'hello')
+        self.assertEqual(message.properties['message_id'], 'id')
+        self.assertIsNone(self.channel.basic.get('test'))
+
+    def test_large_message_is_split_into_frames(self):
+        body = b'a' * 500000
+        received = []
+
+        def on_message(message):
+            received.append(message.body)
+            message.channel.stop_consuming()
+
+        self.channel.queue.declare('test')
+        self.channel.basic.publish(body, 'test')
+        self.channel.basic.consume(on_message, 'test', no_ack=True)
+        self.channel.start_consuming(to_tuple=False)
+
+        self.assertEqual(len(received[0]), len(body))
+
+    def test_get_large_message(self):
+        body = b'a' * 1000000
+        self.channel.queue.declare('test')
+        self.channel.basic.publish(body, 'test')
+
+        message = self.channel.basic.get('test', to_dict=False)
+        self.assertEqual(len(message.body), len(body))
+
+    def test_consume_with_prefetch(self):
+        self.channel.queue.declare('test')
+        for index in range(10):
+            self.channel.basic.publish(str(index), 'test')
+        received = []
+
+        def on_message(message):
+            received.append(message.body)
+            self.assertLessEqual(len(self.broker.queues['test'].messages),
+                                 10 - len(received))
+            message.ack()
+            if len(received) == 10:
+                message.channel.stop_consuming()
+
+        self.channel.basic.qos(prefetch_count=2)
+        self.channel.basic.consume(on_message, 'test')
+        self.channel.start_consuming(to_tuple=False)
+
+        self.assertEqual(received, [str(index) for index in range(10)])
+        self.assertEqual(self.broker.delivered, 10)
+
+    def test_unacked_messages_are_redelivered(self):
+        self.channel.queue.declare('test')
+        self.channel.basic.publish('hello', 'test')
+        self.channel.basic.get('test')
+        self.channel.close()
+
+        channel = self.connection.channel()
+        message = channel.basic.get('test', to_dict=False)
+        self.assertTrue(message.method['redelivered'])
+
+    def test_nack_requeue(self):
+        self.channel.queue.declare('test')
+        self.channel.basic.publish('hello', 'test')
+        self.channel.basic.get('test', to_dict=False).nack(requeue=True)
+
+        self.assertTrue(wait_for(lambda: self.broker.message_count('test')))
+
+    def test_publisher_confirms(self):
+        self.channel.confirm_deliveries()
+        self.channel.queue.declare('test')
+
+        self.assertTrue(self.channel.basic.publish('hello', 'test'))
+        self.assertTrue(self.channel.basic.publish('hello', 'test'))
+        self.assertEqual(self.broker.message_count('test'), 2)
+
+    def test_mandatory_message_is_returned(self):
+        self.channel.confirm_deliveries()
+
+        self.assertRaises(AMQPMessageError, self.channel.basic.publish,
+                          'hello', 'missing', mandatory=True)
+
+    def test_topic_routing(self):
+        self.channel.exchange.declare('logs', 'topic')
+        self.channel.queue.declare('errors')
+        self.channel.queue.declare('all')
+        self.channel.queue.bind('errors', 'logs', '*.error')
+        self.channel.queue.bind('all', 'logs', '#')
+        self.channel.confirm_deliveries()
+        self.channel.basic.publish('a', 'app.error', exchange='logs')
+        self.channel.basic.publish('b', 'app.info', exchange='logs')
+
+        self.assertEqual(self.broker.message_count('errors'), 1)
+        self.assertEqual(self.broker.message_count('all'), 2)
+
+    def test_missing_queue_closes_channel(self):
+        self.assertRaises(AMQPChannelError, self.channel.queue.declare,
+                          'missing', passive=True)
+        self.assertTrue(self.channel.is_closed)
+
+    def test_exclusive_queue_is_deleted_with_connection(self):
+        connection = self.connect()
+        queue = connection.channel().queue.declare(exclusive=True)['queue']
+        self.assertIn(queue.decode('utf-8'), self.broker.queues)
+        connection.close()
+
+        self.assertTrue(wait_for(lambda: self.broker.connections == 1))
+        self.assertNotIn(queue.decode('utf-8'), self.broker.queues)
+
+    def test_tcp(self):
+        host, port = self.broker.listen()
+        connection = Connection(host, 'guest', 'guest', port=port)
+        connection.channel().queue.declare('test')
+        connection.close()
+
+        self.assertIn('test', self.broker.queues)
+
+
+class RoutingTests(unittest.TestCase):
+    def test_topic_match(self):
+        self.assertTrue(topic_match(['a', '*'], ['a', 'b']))
+        self.assertFalse(topic_match(['a', '*'], ['a', 'b', 'c']))
+        self.assertTrue(topic_match(['a', '#'], ['a']))
+        self.assertTrue(topic_match(['#', 'c'], ['a', 'b', 'c']))
+        self.assertFalse(topic_match(['a', 'b'], ['a', 'c']))
+
+    def test_headers_match(self):
+        headers = {'format': 'pdf', 'type': 'report'}
+
+        self.assertTrue(headers_match({'format': 'pdf', 'type': 'report'},
+                                      headers))
+        self.assertFalse(headers_match({'format': 'pdf', 'type': 'log'},
+                                       headers))
+        self.assertTrue(headers_match({'x-match': 'any', 'format': 'pdf',
+                                       'type': 'log'}, headers))
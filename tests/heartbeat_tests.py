@@ -0,0 +1,87 @@
+__author__ = 'eandersson'
+
+import time
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm.heartbeat import Heartbeat
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeIO(object):
+    receive_bytes = 0
+    write_bytes = 0
+
+
+class HeartbeatTests(unittest.TestCase):
+    def setUp(self):
+        self.io = FakeIO()
+        self.heartbeats_sent = []
+        self.timeouts = []
+        self.heartbeat = Heartbeat(
+            self.io,
+            send_heartbeat_impl=lambda: self.heartbeats_sent.append(1),
+            on_timeout=self.timeouts.append)
+
+    def _elapse(self, seconds):
+        self.heartbeat._next_check = 0
+        self.heartbeat._last_inbound -= seconds
+        self.heartbeat._last_outbound -= seconds
+
+    def test_disabled(self):
+        self.heartbeat.start(0)
+        self.assertFalse(self.heartbeat.is_running)
+        self._elapse(3600)
+        self.heartbeat.check()
+        self.assertFalse(self.heartbeats_sent)
+        self.assertFalse(self.timeouts)
+
+    def test_send_heartbeat_when_write_idle(self):
+        self.heartbeat.start(60)
+        self._elapse(31)
+        self.heartbeat.check()
+        self.assertEqual(len(self.heartbeats_sent), 1)
+        self.assertFalse(self.timeouts)
+
+    def test_no_heartbeat_when_writing(self):
+        self.heartbeat.start(60)
+        self._elapse(31)
+        self.io.write_bytes += 100
+        self.heartbeat.check()
+        self.assertFalse(self.heartbeats_sent)
+
+    def test_check_is_rate_limited(self):
+        self.heartbeat.start(60)
+        self.heartbeat._last_outbound -= 31
+        self.heartbeat.check()
+        self.assertFalse(self.heartbeats_sent)
+
+    def test_connection_dead_after_twice_the_interval(self):
+        self.heartbeat.start(60)
+        self._elapse(120)
+        self.heartbeat.check()
+        self.assertEqual(len(self.timeouts), 1)
+        self.assertIn('>= 120s', self.timeouts[0])
+        self.assertFalse(self.heartbeat.is_running)
+
+    def test_inbound_traffic_keeps_connection_alive(self):
+        self.heartbeat.start(60)
+        self._elapse(120)
+        self.io.receive_bytes += 8
+        self.heartbeat.check()
+        self.assertFalse(self.timeouts)
+        self.assertTrue(self.heartbeat.is_running)
+        self.assertLess(time.time() - self.heartbeat._last_inbound, 1)
+
+    def test_stop(self):
+        self.heartbeat.start(60)
+        self.heartbeat.stop()
+        self._elapse(120)
+        self.heartbeat.check()
+        self.assertFalse(self.timeouts)
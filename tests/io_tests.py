@@ -0,0 +1,283 @@
+__author__ = 'eandersson'
+
+import time
+import socket
+import logging
+import threading
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm.io import IO
+from amqpstorm.io import Poller
+from amqpstorm.io import Reactor
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+def wait_for(condition, timeout=1):
+    start_time = time.time()
+    while not condition():
+        if time.time() - start_time > timeout:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def reactor_threads():
+    return [thread for thread in threading.enumerate()
+            if thread.name == 'amqpstorm.io']
+
+
+class ReactorTests(unittest.TestCase):
+    def setUp(self):
+        self.sockets = []
+        wait_for(lambda: not reactor_threads())
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def _create_io(self, reactor, frames_in):
+        client, server = socket.socketpair()
+        self.sockets.extend([client, server])
+        io = IO({}, on_read=lambda buffer: frames_in.append(buffer) or b'',
+                on_error=lambda why: None, reactor=reactor)
+        io.socket = client
+        io.set_state(IO.OPEN)
+        return io, server
+
+    def test_multiple_connections_share_one_thread(self):
+        reactor = Reactor(timeout=0.01)
+        frames_in = []
+        pairs = [self._create_io(reactor, frames_in) for _ in range(10)]
+        for io, _ in pairs:
+            reactor.register(io)
+
+        self.assertEqual(reactor.connections, 10)
+        self.assertEqual(len(reactor_threads()), 1)
+
+        for _, server in pairs:
+            server.sendall(b'hello')
+        self.assertTrue(wait_for(lambda: len(frames_in) == 10))
+        self.assertEqual(frames_in, [b'hello'] * 10)
+
+        for io, _ in pairs:
+            reactor.unregister(io)
+
+    def test_thread_stops_without_connections(self):
+        reactor = Reactor(timeout=0.01)
+        io, _ = self._create_io(reactor, [])
+        reactor.register(io)
+        self.assertTrue(reactor.is_running)
+
+        reactor.unregister(io)
+        self.assertEqual(reactor.connections, 0)
+        self.assertTrue(wait_for(lambda: not reactor.is_running))
+
+    def test_closed_socket_raises_error(self):
+        reactor = Reactor(timeout=0.01)
+        errors = []
+        io, server = self._create_io(reactor, [])
+        io.on_error = errors.append
+        reactor.register(io)
+        server.close()
+
+        self.assertTrue(wait_for(lambda: errors))
+        reactor.unregister(io)
+        wait_for(lambda: not reactor.is_running)
+
+
+class ReceiveTests(unittest.TestCase):
+    def setUp(self):
+        self.client, self.server = socket.socketpair()
+        self.frames_in = []
+        self.io = IO({}, on_read=self._on_read, on_error=lambda why: None)
+        self.io.socket = self.client
+        self.io.set_state(IO.OPEN)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def _on_read(self, buffer):
+        self.frames_in.append(buffer)
+        return b''
+
+    def test_drain_burst_in_one_wakeup(self):
+        payload = b'a' * 1024 * 1024
+        sender = threading.Thread(target=self.server.sendall,
+                                  args=(payload,))
+        sender.start()
+        received = 0
+        while received < len(payload):
+            self.io.process_readable()
+            received = sum(len(buffer) for buffer in self.frames_in)
+        sender.join()
+
+        self.assertEqual(received, len(payload))
+        self.assertLess(len(self.frames_in), self.io.receive_calls)
+        self.assertGreater(self.io.receives_per_wakeup, 1)
+        self.assertGreater(self.io.receive_size, 131072)
+
+    def test_receive_size_shrinks_for_small_messages(self):
+        for _ in range(5):
+            self.server.sendall(b'small')
+            self.io.process_readable()
+
+        self.assertEqual(self.io.receive_size, 4096)
+        self.assertEqual(self.io.wakeups, 5)
+        self.assertEqual(self.io.bytes_per_receive, 5.0)
+        self.assertEqual(self.io.receives_per_wakeup, 1.0)
+
+
+if ssl:
+    class FakeSSLSocket(ssl.SSLSocket):
+        """SSL socket that returns, or raises, a fixed list of results."""
+
+        def __init__(self, results):
+            self.results = list(results)
+            # Nothing is written to the peer, so the underlying socket
+            # never has any data of its own to read.
+            self.idle, self.peer = socket.socketpair()
+
+        def fileno(self):
+            return self.idle.fileno()
+
+        def close(self):
+            self.idle.close()
+            self.peer.close()
+
+        def recv(self, size):
+            result = self.results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        def pending(self):
+            return len(self.results)
+
+
+@unittest.skipIf(not ssl or not hasattr(ssl, 'SSLWantReadError'),
+                 'requires ssl.SSLWantReadError')
+class SSLReceiveTests(unittest.TestCase):
+    def setUp(self):
+        self.frames_in = []
+        self.errors = []
+        self.io = IO({}, on_read=self._on_read, on_error=self.errors.append)
+        self.io.set_state(IO.OPEN)
+
+    def _on_read(self, buffer):
+        self.frames_in.append(buffer)
+        return b''
+
+    def _fake_socket(self, results):
+        sock = FakeSSLSocket(results)
+        self.addCleanup(sock.close)
+        return sock
+
+    def test_incomplete_record_keeps_data(self):
+        self.io.socket = self._fake_socket([b'first', b'second',
+                                            ssl.SSLWantReadError(),
+                                            b'third'])
+        self.io.process_readable()
+
+        self.assertEqual(self.frames_in, [b'firstsecond'])
+        self.assertEqual(self.errors, [])
+        self.assertEqual(self.io.receive_calls, 2)
+
+        self.io.process_readable()
+        self.assertEqual(self.frames_in, [b'firstsecond', b'third'])
+
+    def test_receive_size_adapts_once_per_receive(self):
+        self.io.receive_size = 65536
+        self.io.socket = self._fake_socket([b'small'])
+        self.io.process_readable()
+        self.assertEqual(self.io.receive_size, 32768)
+
+        self.io.socket = self._fake_socket([b'a' * 32768,
+                                            b'a' * 65536])
+        self.io.process_readable()
+        self.assertEqual(self.io.receive_size, 131072)
+
+
+class WriteTests(unittest.TestCase):
+    def setUp(self):
+        self.client, self.server = socket.socketpair()
+        self.client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.errors = []
+        self.io = IO({}, on_error=self.errors.append)
+        self.io.socket = self.client
+        self.io.poller = Poller(self.client.fileno())
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def _read(self, size):
+        data_in = b''
+        while len(data_in) < size:
+            data_in += self.server.recv(65536)
+        return data_in
+
+    @unittest.skipIf(not hasattr(socket.socket, 'sendmsg'),
+                     'requires socket.sendmsg')
+    def test_write_multiple_buffers(self):
+        buffers = [b'method', b'header', b'', b'body']
+        self.assertTrue(self.io._supports_vectored_write())
+        self.assertEqual(self.io.write_to_socket(buffers), 16)
+        self.assertEqual(self._read(16), b'methodheaderbody')
+
+    def test_write_multiple_buffers_without_sendmsg(self):
+        self.io._supports_vectored_write = lambda: False
+        buffers = [b'method', b'header', b'', b'body']
+
+        self.assertEqual(self.io.write_to_socket(buffers), 16)
+        self.assertEqual(self._read(16), b'methodheaderbody')
+
+    def test_is_readable_does_not_wait_for_a_full_send_buffer(self):
+        self.client.setblocking(False)
+        try:
+            while True:
+                self.client.send(b'x' * 65536)
+        except socket.error:
+            pass
+        poller = Poller(self.client.fileno(), timeout=5)
+        start_time = time.time()
+
+        self.assertFalse(poller.is_readable)
+        self.assertLess(time.time() - start_time, 1)
+        self.server.send(b'data')
+        self.assertTrue(wait_for(lambda: poller.is_readable))
+
+    def test_non_blocking_write_skips_a_busy_writer(self):
+        with self.io._write_lock:
+            self.assertIsNone(self.io.write_to_socket(b'heartbeat',
+                                                      blocking=False))
+        self.assertEqual(self.io.write_bytes, 0)
+
+        self.assertEqual(self.io.write_to_socket(b'heartbeat',
+                                                 blocking=False), 9)
+        self.assertEqual(self._read(9), b'heartbeat')
+
+    def test_write_handles_partial_writes(self):
+        buffers = [str(index).encode('ascii') * 100000 for index in range(8)]
+        expected = b''.join(buffers)
+        result = []
+        reader = threading.Thread(
+            target=lambda: result.append(self._read(len(expected))))
+        reader.start()
+        written = self.io.write_to_socket(buffers)
+        reader.join()
+
+        self.assertEqual(written, len(expected))
+        self.assertEqual(result[0], expected)
+        self.assertFalse(self.errors)
@@ -0,0 +1,279 @@
+__author__ = 'eandersson'
+
+import logging
+import threading
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import Connection
+from amqpstorm import AMQPInvalidArgument
+from amqpstorm.channel import Channel
+from amqpstorm.metrics import Metrics
+from amqpstorm.metrics import Histogram
+from amqpstorm.metrics import merge
+from amqpstorm.metrics import add_derived_counters
+from amqpstorm.fake_broker import FakeBroker
+
+from tests.utility import FakeConnection
+from tests.io_tests import wait_for
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class MetricsTests(unittest.TestCase):
+    def test_increment(self):
+        metrics = Metrics()
+        metrics.increment('rpc_requests')
+        metrics.increment('rpc_requests', 2)
+        metrics.increment(('frames_in', 'Basic.Deliver'))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['rpc_requests'], 3)
+        self.assertEqual(snapshot['frames_in'], {'Basic.Deliver': 1})
+        self.assertEqual(snapshot['frames_out'], {})
+
+    def test_increment_from_many_threads(self):
+        metrics = Metrics()
+
+        def increment():
+            for _ in range(10000):
+                metrics.increment('publishes')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(metrics.snapshot()['publishes'], 40000)
+        self.assertEqual(metrics.snapshot()['publishes'], 40000)
+
+    def test_finished_threads_are_retired(self):
+        metrics = Metrics()
+        metrics.increment('publishes')
+        thread = threading.Thread(target=metrics.increment,
+                                  args=('publishes',))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(metrics.snapshot()['publishes'], 2)
+        self.assertEqual(len(metrics._threads), 1)
+        metrics.increment('publishes')
+        self.assertEqual(metrics.snapshot()['publishes'], 3)
+
+    def test_merge(self):
+        stats = {'frames_in': {'Basic.Deliver': 1}, 'rpc_requests': 1}
+        merge(stats, {'frames_in': {'Basic.Deliver': 2, 'ContentBody': 2},
+                      'rpc_requests': 1, 'reconnects': 0})
+
+        self.assertEqual(stats, {'frames_in': {'Basic.Deliver': 3,
+                                               'ContentBody': 2},
+                                 'rpc_requests': 2, 'reconnects': 0})
+
+    def test_derived_counters(self):
+        stats = {'frames_in': {'Basic.Deliver': 2, 'Basic.GetOk': 1,
+                               'Basic.Ack': 4},
+                 'frames_out': {'Basic.Publish': 5, 'Basic.Nack': 1}}
+        add_derived_counters(stats)
+
+        self.assertEqual(stats['deliveries'], 3)
+        self.assertEqual(stats['confirms_acked'], 4)
+        self.assertEqual(stats['confirms_nacked'], 0)
+        self.assertEqual(stats['publishes'], 5)
+        self.assertEqual(stats['acks'], 0)
+        self.assertEqual(stats['nacks'], 1)
+
+
+class HistogramTests(unittest.TestCase):
+    def test_percentile(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value / 1000.0)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.mean, 0.5005)
+        for percentile, expected in ((50, 0.5), (99, 0.99), (99.9, 0.999)):
+            value = histogram.percentile(percentile)
+            self.assertGreaterEqual(value, expected)
+            self.assertLess(value, expected * (1 + 1 / 32.0))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        histogram.record(0.000005)
+        histogram.record(0)
+        histogram.record(-1)
+
+        self.assertEqual(histogram.count, 3)
+        self.assertAlmostEqual(histogram.max, 0.000005)
+        self.assertEqual(histogram.percentile(50), 0.0)
+
+    def test_memory_is_fixed(self):
+        histogram = Histogram()
+        buckets = len(histogram.counts)
+        histogram.record(10 ** 9)
+
+        self.assertEqual(len(histogram.counts), buckets)
+        self.assertEqual(histogram.count, 1)
+        self.assertGreater(histogram.max, 60 * 60)
+
+    def test_empty(self):
+        summary = Histogram().summary()
+
+        self.assertEqual(summary['count'], 0)
+        self.assertEqual(summary['p999'], 0.0)
+        self.assertEqual(summary['max'], 0.0)
+
+    def test_reset(self):
+        metrics = Metrics()
+        metrics.record_latency('rpc', 0.1)
+        self.assertEqual(metrics.histograms(reset=True)['rpc'].count, 1)
+        self.assertEqual(metrics.histograms()['rpc'].count, 0)
+
+        metrics.record_latency('rpc', 0.2)
+        histogram = metrics.histograms()['rpc']
+        self.assertEqual(histogram.count, 1)
+        self.assertAlmostEqual(histogram.total, 0.2)
+        self.assertGreaterEqual(histogram.percentile(50), 0.2)
+
+    def test_reset_per_consumer(self):
+        metrics = Metrics()
+        metrics.record_latency('rpc', 0.1)
+        metrics.histograms(reset=True, consumer='dashboard')
+        metrics.record_latency('rpc', 0.2)
+
+        self.assertEqual(
+            metrics.histograms(consumer='dashboard')['rpc'].count, 1)
+        self.assertEqual(metrics.histograms()['rpc'].count, 2)
+        self.assertEqual(metrics.histograms(consumer=None)['rpc'].count, 2)
+        self.assertRaises(AMQPInvalidArgument, metrics.histograms,
+                          reset=True, consumer=None)
+
+    def test_histograms_from_many_threads(self):
+        metrics = Metrics()
+
+        def record():
+            for _ in range(1000):
+                metrics.record_latency('rpc', 0.001)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.record_latency('rpc', 0.001)
+
+        self.assertEqual(metrics.histograms()['rpc'].count, 4001)
+
+
+class ChannelStatsTests(unittest.TestCase):
+    def setUp(self):
+        self.channel = Channel(1, FakeConnection(), 360)
+        self.channel.set_state(Channel.OPEN)
+
+    def test_publish(self):
+        self.channel.basic.publish(b'x' * 300000, 'routing_key')
+
+        stats = self.channel.stats()
+        self.assertEqual(stats['publishes'], 1)
+        self.assertEqual(stats['frames_out'], {'Basic.Publish': 1,
+                                               'ContentHeader': 1,
+                                               'ContentBody': 3})
+
+    def test_publisher(self):
+        publisher = self.channel.basic.publisher('', 'routing_key')
+        publisher.publish(b'x' * 300000)
+        publisher.publish(b'')
+
+        stats = self.channel.stats()
+        self.assertEqual(stats['publishes'], 2)
+        self.assertEqual(stats['frames_out'], {'Basic.Publish': 2,
+                                               'ContentHeader': 2,
+                                               'ContentBody': 3})
+
+    def test_ack(self):
+        self.channel.basic.ack(1)
+        self.channel.basic.nack(2)
+        self.channel.basic.reject(3)
+
+        stats = self.channel.stats()
+        self.assertEqual(stats['acks'], 1)
+        self.assertEqual(stats['nacks'], 1)
+        self.assertEqual(stats['rejects'], 1)
+
+    def test_inbound_frames(self):
+        self.channel._inbound.append(None)
+
+        self.assertEqual(self.channel.stats()['inbound_frames'], 1)
+
+
+class ConnectionStatsTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.connection = Connection('localhost', 'guest', 'guest',
+                                     transport=self.broker.transport())
+
+    def tearDown(self):
+        self.connection.close()
+        self.broker.stop()
+
+    def test_stats(self):
+        channel = self.connection.channel()
+        channel.confirm_deliveries()
+        channel.queue.declare('test')
+        channel.basic.publish(b'hello', 'test')
+        channel.basic.publish(b'hello', 'test')
+        channel.basic.get('test', to_dict=False).ack()
+
+        stats = self.connection.stats()
+        self.assertEqual(stats['publishes'], 2)
+        self.assertEqual(stats['confirms_acked'], 2)
+        self.assertEqual(stats['deliveries'], 1)
+        self.assertEqual(stats['acks'], 1)
+        self.assertEqual(stats['rpc_requests'], 3)
+        self.assertEqual(stats['channels'], 1)
+        self.assertEqual(stats['reconnects'], 0)
+        self.assertEqual(stats['frames_in']['Connection.Start'], 1)
+        self.assertEqual(stats['frames_out']['Connection.StartOk'], 1)
+        self.assertEqual(stats['frames_out']['Basic.Publish'], 2)
+        self.assertGreater(stats['bytes_in'], 0)
+        self.assertGreater(stats['bytes_out'], 0)
+
+    def test_consume(self):
+        channel = self.connection.channel()
+        channel.queue.declare('test')
+        for _ in range(3):
+            channel.basic.publish(b'hello', 'test')
+        channel.basic.consume(queue='test', no_ack=True)
+
+        self.assertTrue(wait_for(
+            lambda: self.connection.stats()['deliveries'] == 3))
+        self.assertEqual(self.connection.stats()['inbound_frames'], 9)
+        self.assertEqual(channel.stats()['consumers'], 1)
+
+    def test_latency(self):
+        channel = self.connection.channel()
+        channel.queue.declare('test')
+        channel.confirm_deliveries()
+        channel.basic.publish(b'hello', 'test')
+        received = []
+
+        def on_message(message):
+            received.append(message)
+            channel.stop_consuming()
+
+        channel.basic.consume(on_message, 'test', no_ack=True)
+        channel.start_consuming(to_tuple=False)
+
+        latency = self.connection.latency(reset=True)
+        self.assertEqual(latency['confirm'].count, 1)
+        self.assertEqual(latency['delivery'].count, 1)
+        self.assertEqual(latency['callback'].count, 1)
+        self.assertGreaterEqual(latency['rpc'].count, 3)
+        self.assertGreater(latency['rpc'].percentile(99.9), 0)
+        self.assertEqual(self.connection.latency()['confirm'].count, 0)
+        self.assertEqual(self.connection.stats()['latency']['delivery'],
+                         Histogram().summary())
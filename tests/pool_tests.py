@@ -0,0 +1,392 @@
+__author__ = 'eandersson'
+
+import logging
+import threading
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import AMQPChannelError
+from amqpstorm import AMQPConnectionError
+from amqpstorm import AMQPInvalidArgument
+from amqpstorm import Connection
+from amqpstorm.base import Stateful
+from amqpstorm.fake_broker import FakeBroker
+from amqpstorm.pool import ConnectionPool
+from amqpstorm.pool import ChannelPool
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeChannel(Stateful):
+    def __init__(self):
+        super(FakeChannel, self).__init__()
+        self.consumer_tags = []
+        self.set_state(self.OPEN)
+
+    def close(self):
+        self.set_state(self.CLOSED)
+
+
+class FakePoolConnection(Stateful):
+    opened = 0
+
+    def __init__(self, hostname, username, password, port, **kwargs):
+        super(FakePoolConnection, self).__init__()
+        self.kwargs = kwargs
+        self.channels = []
+        self.set_state(self.OPEN)
+        FakePoolConnection.opened += 1
+
+    def channel(self):
+        channel = FakeChannel()
+        self.channels.append(channel)
+        return channel
+
+    def close(self):
+        self.set_state(self.CLOSED)
+
+
+class FailingPoolConnection(FakePoolConnection):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        if len(FailingPoolConnection.instances) == 2:
+            raise AMQPConnectionError('connection refused')
+        super(FailingPoolConnection, self).__init__(*args, **kwargs)
+        FailingPoolConnection.instances.append(self)
+
+
+def create_pool(**kwargs):
+    return ConnectionPool('localhost', 'guest', 'guest',
+                          connection_class=FakePoolConnection, **kwargs)
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def test_channel_is_reused(self):
+        pool = create_pool()
+        with pool.channel() as channel:
+            first = channel
+        with pool.channel() as channel:
+            self.assertIs(channel, first)
+
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(pool.stats()['leases'], 2)
+
+    def test_connection_kwargs_are_passed_on(self):
+        pool = create_pool(heartbeat=30)
+        self.assertEqual(pool._connections[0].connection.kwargs,
+                         {'heartbeat': 30})
+
+    def test_pool_grows_to_max_size(self):
+        pool = create_pool(max_size=2, max_channels=2)
+        with pool.channel():
+            with pool.channel():
+                self.assertEqual(pool.size, 2)
+                with pool.channel():
+                    self.assertEqual(pool.size, 2)
+                    self.assertEqual(pool.stats()['leased_channels'], 3)
+                    self.assertEqual(pool.utilisation, 0.75)
+        self.assertEqual(pool.stats()['leased_channels'], 0)
+
+    def test_lease_timeout(self):
+        pool = create_pool(max_size=1, max_channels=1)
+        with pool.channel():
+            self.assertRaises(AMQPConnectionError,
+                              pool.channel(timeout=0.01).__enter__)
+        self.assertEqual(pool.stats()['lease_timeouts'], 1)
+
+    def test_lease_waits_for_release(self):
+        pool = create_pool(max_size=1, max_channels=1)
+        leased = []
+
+        def lease():
+            with pool.channel(timeout=5) as channel:
+                leased.append(channel)
+
+        with pool.channel():
+            thread = threading.Thread(target=lease)
+            thread.start()
+            thread.join(0.05)
+            self.assertFalse(leased)
+        thread.join(5)
+
+        self.assertEqual(len(leased), 1)
+        self.assertGreater(pool.stats()['max_lease_wait_time'], 0.0)
+
+    def test_closed_channel_is_not_reused(self):
+        pool = create_pool()
+        with pool.channel() as channel:
+            first = channel
+            channel.close()
+        with pool.channel() as channel:
+            self.assertIsNot(channel, first)
+
+    def test_consuming_channel_is_closed(self):
+        pool = create_pool()
+        with pool.channel() as channel:
+            channel.consumer_tags.append('tag')
+
+        self.assertTrue(channel.is_closed)
+        self.assertEqual(pool.stats()['idle_channels'], 0)
+
+    def test_confirming_channel_is_reused(self):
+        pool = create_pool()
+        with pool.channel() as channel:
+            channel.confirming_deliveries = True
+        with pool.channel() as second:
+            self.assertIs(second, channel)
+
+        self.assertTrue(channel.is_open)
+
+    def test_broken_connection_is_replaced(self):
+        pool = create_pool()
+        broken = pool._connections[0].connection
+        broken.set_state(broken.CLOSED)
+        with pool.channel():
+            pass
+
+        self.assertEqual(pool.size, 1)
+        self.assertIsNot(pool._connections[0].connection, broken)
+
+    def test_idle_connections_are_evicted(self):
+        pool = create_pool(min_size=0, max_idle_time=0)
+        with pool.channel():
+            self.assertEqual(pool.size, 1)
+
+        self.assertEqual(pool.size, 0)
+
+    def test_check_health_restores_min_size(self):
+        pool = create_pool(min_size=2)
+        pool._connections[0].connection.set_state(Stateful.CLOSED)
+        pool.check_health()
+
+        self.assertEqual(pool.size, 2)
+        for pooled in pool._connections:
+            self.assertTrue(pooled.connection.is_open)
+
+    def test_lease_runs_health_check(self):
+        pool = create_pool(min_size=2, health_check_interval=0)
+        pool._connections[0].connection.set_state(Stateful.CLOSED)
+        pool._connections[1].connection.set_state(Stateful.CLOSED)
+        with pool.channel():
+            pass
+
+        self.assertEqual(pool.size, 2)
+        for pooled in pool._connections:
+            self.assertTrue(pooled.connection.is_open)
+
+    def test_health_check_interval(self):
+        pool = create_pool(min_size=2, health_check_interval=60)
+        pool._connections[0].connection.set_state(Stateful.CLOSED)
+        with pool.channel():
+            pass
+
+        self.assertEqual(pool.size, 1)
+
+    def test_failed_init_closes_connections(self):
+        FailingPoolConnection.instances = []
+        self.assertRaises(AMQPConnectionError, ConnectionPool, 'localhost',
+                          'guest', 'guest', min_size=3,
+                          connection_class=FailingPoolConnection)
+
+        self.assertEqual(len(FailingPoolConnection.instances), 2)
+        for connection in FailingPoolConnection.instances:
+            self.assertTrue(connection.is_closed)
+
+    def test_close(self):
+        pool = create_pool(min_size=2)
+        connections = [pooled.connection for pooled in pool._connections]
+        pool.close()
+
+        for connection in connections:
+            self.assertTrue(connection.is_closed)
+        self.assertRaises(AMQPConnectionError, pool.channel().__enter__)
+
+    def test_concurrent_leases(self):
+        pool = create_pool(max_size=2, max_channels=2)
+        errors = []
+
+        def lease():
+            try:
+                for _ in range(50):
+                    with pool.channel(timeout=5):
+                        self.assertLessEqual(pool.stats()['leased_channels'],
+                                             4)
+            except Exception as why:
+                errors.append(why)
+
+        threads = [threading.Thread(target=lease) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(errors)
+        self.assertEqual(pool.stats()['leases'], 400)
+        self.assertLessEqual(pool.size, 2)
+
+    def test_invalid_parameters(self):
+        self.assertRaises(AMQPInvalidArgument, create_pool, max_size=0)
+        self.assertRaises(AMQPInvalidArgument, create_pool, min_size=2,
+                          max_size=1)
+        self.assertRaises(AMQPInvalidArgument, create_pool, max_channels=0)
+        self.assertRaises(AMQPInvalidArgument, create_pool,
+                          lease_timeout='1')
+        self.assertRaises(AMQPInvalidArgument, create_pool,
+                          health_check_interval='1')
+
+
+class FakeConfirmChannel(FakeChannel):
+    def __init__(self, rpc_timeout):
+        super(FakeConfirmChannel, self).__init__()
+        self.rpc_timeout = rpc_timeout
+        self.confirming_deliveries = False
+
+    def confirm_deliveries(self):
+        self.confirming_deliveries = True
+
+
+class FakeChannelConnection(FakePoolConnection):
+    def __init__(self):
+        super(FakeChannelConnection, self).__init__('localhost', 'guest',
+                                                    'guest', 5672)
+
+    def channel(self, rpc_timeout=360):
+        channel = FakeConfirmChannel(rpc_timeout)
+        self.channels.append(channel)
+        return channel
+
+
+class ChannelPoolTests(unittest.TestCase):
+    def test_channels_are_opened_up_front(self):
+        connection = FakeChannelConnection()
+        pool = ChannelPool(connection, size=4, confirm_deliveries=True,
+                           rpc_timeout=10)
+
+        self.assertEqual(len(connection.channels), 4)
+        self.assertEqual(len(pool), 4)
+        for channel in connection.channels:
+            self.assertTrue(channel.confirming_deliveries)
+            self.assertEqual(channel.rpc_timeout, 10)
+
+    def test_same_thread_gets_same_channel(self):
+        pool = ChannelPool(FakeChannelConnection())
+
+        self.assertIs(pool.channel, pool.channel)
+        self.assertEqual(pool.channels_opened, 1)
+
+    def test_each_thread_gets_its_own_channel(self):
+        pool = ChannelPool(FakeChannelConnection(), size=2)
+        channels = []
+        condition = threading.Condition()
+
+        def publisher():
+            channel = pool.channel
+            with condition:
+                channels.append(channel)
+                condition.notify_all()
+                while len(channels) < 4:
+                    condition.wait(5)
+
+        threads = [threading.Thread(target=publisher) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(map(id, channels))), 4)
+        self.assertEqual(pool.channels_opened, 4)
+
+    def test_channel_of_exited_thread_is_reused(self):
+        pool = ChannelPool(FakeChannelConnection())
+        channels = []
+        thread = threading.Thread(target=lambda: channels.append(pool.channel))
+        thread.start()
+        thread.join()
+
+        self.assertIs(pool.channel, channels[0])
+        self.assertEqual(pool.channels_opened, 1)
+
+    def test_closed_channel_is_replaced(self):
+        pool = ChannelPool(FakeChannelConnection(), confirm_deliveries=True)
+        first = pool.channel
+        first.close()
+        channel = pool.channel
+
+        self.assertIsNot(channel, first)
+        self.assertTrue(channel.is_open)
+        self.assertTrue(channel.confirming_deliveries)
+
+    def test_release_and_close(self):
+        pool = ChannelPool(FakeChannelConnection())
+        channel = pool.channel
+        pool.release()
+        self.assertIs(pool.channel, channel)
+
+        pool.close()
+        self.assertTrue(channel.is_closed)
+        self.assertEqual(len(pool), 0)
+
+    def test_invalid_parameters(self):
+        connection = FakeChannelConnection()
+        self.assertRaises(AMQPInvalidArgument, ChannelPool, connection,
+                          size=-1)
+        self.assertRaises(AMQPInvalidArgument, ChannelPool, connection,
+                          confirm_deliveries='yes')
+
+
+class ConnectionPoolBrokerTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.pool = ConnectionPool('localhost', 'guest', 'guest',
+                                   max_size=1,
+                                   transport=self.broker.transport())
+
+    def tearDown(self):
+        self.pool.close()
+        self.broker.stop()
+
+    def test_closed_channel_ids_are_reused(self):
+        for _ in range(50):
+            with self.pool.channel() as channel:
+                channel.queue.declare('test')
+                channel.basic.consume(queue='test', no_ack=True)
+
+        connection = self.pool._connections[0].connection
+        self.assertEqual(list(connection.channels), [1])
+        self.assertEqual(
+            connection.stats()['frames_out']['Basic.Consume'], 50)
+
+    def test_confirming_channel_keeps_its_id(self):
+        for _ in range(50):
+            with self.pool.channel() as channel:
+                channel.confirm_deliveries()
+                channel.basic.publish(b'hello', 'test')
+
+        connection = self.pool._connections[0].connection
+        self.assertEqual(list(connection.channels), [1])
+
+
+class ChannelPoolBrokerTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.connection = Connection('localhost', 'guest', 'guest',
+                                     transport=self.broker.transport())
+
+    def tearDown(self):
+        self.connection.close()
+        self.broker.stop()
+
+    def test_replaced_channel_reuses_the_channel_id(self):
+        pool = ChannelPool(self.connection, confirm_deliveries=True)
+        for _ in range(20):
+            self.assertRaises(AMQPChannelError, pool.channel.queue.declare,
+                              'missing', passive=True)
+
+        self.assertEqual(pool.channel.channel_id, 1)
+        self.assertEqual(list(self.connection.channels), [1])
+        self.assertEqual(pool.channels_opened, 21)
@@ -0,0 +1,156 @@
+__author__ = 'eandersson'
+
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen
+    from urllib2 import HTTPError
+
+from amqpstorm import Connection
+from amqpstorm.metrics import Histogram
+from amqpstorm.prometheus import Exporter
+from amqpstorm.prometheus import CONTENT_TYPE
+from amqpstorm.prometheus import render
+from amqpstorm.prometheus import _escape
+from amqpstorm.prometheus import _render_histogram
+from amqpstorm.fake_broker import FakeBroker
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class RenderTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.connection = self.connect()
+
+    def tearDown(self):
+        self.connection.close()
+        self.broker.stop()
+
+    def connect(self):
+        return Connection('localhost', 'guest', 'guest',
+                          virtual_host='test',
+                          transport=self.broker.transport())
+
+    def test_render(self):
+        channel = self.connection.channel()
+        channel.confirm_deliveries()
+        channel.queue.declare('test')
+        channel.basic.publish(b'hello', 'test')
+
+        text = render([self.connection])
+        labels = 'host="socketpair",vhost="test",channel="1"'
+        self.assertIn('# TYPE amqpstorm_publishes_total counter\n', text)
+        self.assertIn('amqpstorm_publishes_total{%s} 1\n' % labels, text)
+        self.assertIn('amqpstorm_confirms_acked_total{%s} 1\n' % labels,
+                      text)
+        self.assertIn('amqpstorm_frames_received_total{host="socketpair",'
+                      'vhost="test",channel="0",frame="Connection.Start"} 1',
+                      text)
+        self.assertIn('amqpstorm_open_channels{host="socketpair",'
+                      'vhost="test"} 1\n', text)
+        self.assertIn('amqpstorm_latency_seconds_count{%s,'
+                      'operation="confirm"} 1\n' % labels, text)
+        self.assertIn('amqpstorm_latency_seconds_bucket{%s,'
+                      'operation="confirm",le="+Inf"} 1\n' % labels, text)
+
+    def test_reset_does_not_affect_render(self):
+        channel = self.connection.channel()
+        channel.queue.declare('test')
+        labels = 'host="socketpair",vhost="test",channel="1"'
+        count = 'amqpstorm_latency_seconds_count{%s,operation="rpc"} 2\n' \
+            % labels
+
+        self.assertIn(count, render([self.connection]))
+        self.connection.latency(reset=True)
+        self.assertIn(count, render([self.connection]))
+
+    def test_connections_with_the_same_labels_are_added_up(self):
+        connection = self.connect()
+        try:
+            for _ in range(2):
+                connection.channel().queue.declare('test')
+            self.connection.channel().queue.declare('test')
+
+            text = render([self.connection, connection], max_channels=1)
+        finally:
+            connection.close()
+
+        labels = 'host="socketpair",vhost="test"'
+        self.assertIn('amqpstorm_open_channels{%s} 3\n' % labels, text)
+        self.assertIn('amqpstorm_rpc_requests_total{%s,channel="1"} 4\n'
+                      % labels, text)
+        self.assertIn('amqpstorm_rpc_requests_total{%s,channel="other"} 2\n'
+                      % labels, text)
+        self.assertNotIn('channel="2"', text)
+
+
+class HistogramRenderTests(unittest.TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram()
+        for seconds in (0.0002, 0.003, 0.003, 20):
+            histogram.record(seconds)
+
+        lines = _render_histogram((('operation', 'rpc'),), histogram)
+        self.assertIn('amqpstorm_latency_seconds_bucket{operation="rpc",'
+                      'le="0.00025"} 1', lines)
+        self.assertIn('amqpstorm_latency_seconds_bucket{operation="rpc",'
+                      'le="0.005"} 3', lines)
+        self.assertIn('amqpstorm_latency_seconds_bucket{operation="rpc",'
+                      'le="10.0"} 3', lines)
+        self.assertIn('amqpstorm_latency_seconds_bucket{operation="rpc",'
+                      'le="+Inf"} 4', lines)
+        self.assertIn('amqpstorm_latency_seconds_count{operation="rpc"} 4',
+                      lines)
+
+    def test_escape(self):
+        self.assertEqual(_escape('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+
+class ExporterTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.connection = Connection('localhost', 'guest', 'guest',
+                                     transport=self.broker.transport())
+        self.exporter = Exporter([self.connection])
+
+    def tearDown(self):
+        self.exporter.stop()
+        self.connection.close()
+        self.broker.stop()
+
+    def test_http(self):
+        host, port = self.exporter.start(port=0)
+        response = urlopen('http://%s:%d/metrics' % (host, port), timeout=5)
+        try:
+            body = response.read().decode('utf-8')
+            self.assertEqual(response.headers['Content-Type'], CONTENT_TYPE)
+        finally:
+            response.close()
+
+        self.assertEqual(body, self.exporter.render())
+        self.assertIn('amqpstorm_received_bytes_total', body)
+
+    def test_not_found(self):
+        host, port = self.exporter.start(port=0)
+
+        self.assertRaises(HTTPError, urlopen,
+                          'http://%s:%d/missing' % (host, port), timeout=5)
+
+    def test_add_and_remove(self):
+        self.exporter.remove(self.connection)
+        self.assertEqual(self.exporter.render(), '\n')
+
+        self.exporter.add(self.connection)
+        self.exporter.add(self.connection)
+        self.assertEqual(self.exporter.render().count(
+            'amqpstorm_open_channels{'), 1)
@@ -0,0 +1,95 @@
+__author__ = 'eandersson'
+
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pamqp import frame as pamqp_frame
+
+from amqpstorm import exception
+from amqpstorm.channel import Channel
+from amqpstorm.publisher import Publisher
+
+from tests.utility import FakeConnection
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+def marshal(frames_out, channel_id):
+    result = b''
+    for frame in frames_out:
+        if isinstance(frame, memoryview):
+            result += frame.tobytes()
+            continue
+        elif isinstance(frame, bytes):
+            result += frame
+            continue
+        result += pamqp_frame.marshal(frame, channel_id)
+    return result
+
+
+class PublisherTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.channel = Channel(9, self.connection, 360)
+        self.channel.set_state(Channel.OPEN)
+
+    def _compare_with_basic_publish(self, body, properties=None):
+        publisher = self.channel.basic.publisher('exchange', 'routing_key',
+                                                 properties=properties,
+                                                 mandatory=True)
+        self.assertIsInstance(publisher, Publisher)
+        publisher.publish(body)
+        _, frames_out = self.connection.frames_out.pop()
+        self.channel.basic.publish(body, 'routing_key', 'exchange',
+                                   properties=properties, mandatory=True)
+        _, expected = self.connection.frames_out.pop()
+        self.assertEqual(marshal(frames_out, 9), marshal(expected, 9))
+
+    def test_publish_matches_basic_publish(self):
+        self._compare_with_basic_publish(b'Hello World!',
+                                         {'content_type': 'text/plain',
+                                          'headers': {'key': 'value'}})
+
+    def test_publish_text_body(self):
+        self._compare_with_basic_publish('Hello World!')
+
+    def test_publish_empty_body(self):
+        self._compare_with_basic_publish(b'')
+
+    def test_publish_large_body(self):
+        self._compare_with_basic_publish(b'Hello World!' * 80960)
+
+    def test_large_body_frames_can_be_joined(self):
+        body = b'Hello World!' * 80960
+        publisher = self.channel.basic.publisher('exchange', 'routing_key')
+        publisher.publish(body)
+        _, frames_out = self.connection.frames_out.pop()
+
+        self.assertEqual(b''.join(frames_out[2:]), marshal(frames_out[2:], 9))
+
+    def test_publish_reuses_template(self):
+        publisher = self.channel.basic.publisher('exchange', 'routing_key')
+        publisher.publish(b'first')
+        _, first = self.connection.frames_out.pop()
+        publisher.publish(b'second message')
+        _, second = self.connection.frames_out.pop()
+
+        self.assertIs(first[0], second[0])
+        self.assertEqual(second[3], b'second message')
+
+    def test_publish_invalid_body(self):
+        publisher = self.channel.basic.publisher('exchange', 'routing_key')
+        self.assertRaises(exception.AMQPInvalidArgument, publisher.publish,
+                          None)
+
+    def test_publisher_invalid_parameters(self):
+        self.assertRaises(exception.AMQPInvalidArgument,
+                          self.channel.basic.publisher, 'exchange', None)
+        self.assertRaises(exception.AMQPInvalidArgument,
+                          self.channel.basic.publisher, 'exchange',
+                          'routing_key', properties='invalid')
@@ -0,0 +1,220 @@
+__author__ = 'eandersson'
+
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pamqp import specification
+
+from amqpstorm.recovery import Topology
+from amqpstorm.recovery import RecoveringChannel
+from amqpstorm.recovery import RecoveringConnection
+
+from tests.utility import FakeConnection
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class RespondingConnection(FakeConnection):
+    """Fake Connection that answers every RPC request immediately."""
+
+    def __init__(self):
+        super(RespondingConnection, self).__init__()
+        self.channel = None
+        self.queue_names = iter(['amq.gen-1', 'amq.gen-2'])
+        self.requests = []
+
+    def write_frame(self, channel_id, frame_out):
+        self.requests.append(frame_out)
+        if frame_out.name == 'Queue.Declare':
+            queue = frame_out.queue or next(self.queue_names)
+            response = specification.Queue.DeclareOk(queue=queue)
+        elif frame_out.name == 'Basic.Consume':
+            response = specification.Basic.ConsumeOk(
+                consumer_tag=frame_out.consumer_tag or 'ctag')
+        else:
+            response = getattr(specification,
+                               frame_out.valid_responses[0].split('.')[0])
+            response = getattr(response,
+                               frame_out.valid_responses[0].split('.')[1])()
+        self.channel.on_frame(response)
+
+
+class TopologyTests(unittest.TestCase):
+    def test_record_declarations(self):
+        topology = Topology()
+        topology.record(specification.Exchange.Declare(exchange='ex'), {})
+        topology.record(specification.Queue.Declare(queue='q'),
+                        {'queue': b'q'})
+        topology.record(specification.Queue.Bind(queue='q', exchange='ex',
+                                                 routing_key='rk'), {})
+        topology.record(specification.Basic.Qos(prefetch_count=10), {})
+        topology.record(specification.Basic.Consume(queue='q'),
+                        {'consumer_tag': b'ctag'})
+
+        keys = [key for key, _ in topology]
+        self.assertEqual(keys, [('exchange', 'ex'), ('queue', 'q'),
+                                ('queue.bind', 'q', 'ex', 'rk'), ('qos',),
+                                ('consume', 'ctag')])
+
+    def test_passive_declare_is_not_recorded(self):
+        topology = Topology()
+        topology.record(specification.Queue.Declare(queue='q', passive=True),
+                        {'queue': b'q'})
+        topology.record(specification.Exchange.Declare(exchange='ex',
+                                                       passive=True), {})
+
+        self.assertEqual(len(topology), 0)
+
+    def test_queue_delete_removes_dependants(self):
+        topology = Topology()
+        topology.record(specification.Queue.Declare(queue='q'),
+                        {'queue': b'q'})
+        topology.record(specification.Queue.Bind(queue='q', exchange='ex'),
+                        {})
+        topology.record(specification.Basic.Consume(queue='q'),
+                        {'consumer_tag': b'ctag'})
+        topology.record(specification.Queue.Declare(queue='other'),
+                        {'queue': b'other'})
+        topology.record(specification.Queue.Delete(queue='q'), {})
+
+        self.assertEqual([key for key, _ in topology], [('queue', 'other')])
+
+    def test_exchange_delete_removes_bindings(self):
+        topology = Topology()
+        topology.record(specification.Exchange.Declare(exchange='ex'), {})
+        topology.record(specification.Queue.Bind(queue='q', exchange='ex'),
+                        {})
+        topology.record(specification.Exchange.Bind(destination='other',
+                                                    source='ex'), {})
+        topology.record(specification.Exchange.Delete(exchange='ex'), {})
+
+        self.assertEqual(len(topology), 0)
+
+    def test_unbind_and_cancel(self):
+        topology = Topology()
+        topology.record(specification.Queue.Bind(queue='q', exchange='ex',
+                                                 routing_key='rk'), {})
+        topology.record(specification.Basic.Consume(queue='q'),
+                        {'consumer_tag': b'ctag'})
+        topology.record(specification.Queue.Unbind(queue='q', exchange='ex',
+                                                   routing_key='rk'), {})
+        topology.record(specification.Basic.Cancel(consumer_tag='ctag'), {})
+
+        self.assertEqual(len(topology), 0)
+
+    def test_rename_queue(self):
+        topology = Topology()
+        topology.record(specification.Queue.Declare(), {'queue': b'old'})
+        topology.record(specification.Queue.Bind(queue='old', exchange='ex'),
+                        {})
+        topology.record(specification.Basic.Consume(queue='old'),
+                        {'consumer_tag': b'ctag'})
+        topology.rename_queue('old', 'new')
+
+        frames = list(topology)
+        self.assertEqual(frames[0][0], ('queue', 'new'))
+        self.assertEqual(frames[1][0], ('queue.bind', 'new', 'ex', ''))
+        self.assertEqual(frames[1][1].queue, 'new')
+        self.assertEqual(frames[2][1].queue, 'new')
+
+
+class RecoveringChannelTests(unittest.TestCase):
+    def test_recover_replays_topology(self):
+        connection = RespondingConnection()
+        channel = RecoveringChannel(1, connection, 1)
+        connection.channel = channel
+        channel.open()
+        channel.exchange.declare('ex')
+        channel.queue.declare('q')
+        channel.queue.bind('q', 'ex', 'rk')
+        channel.basic.qos(10)
+        channel.basic.consume(queue='q')
+
+        connection.requests = []
+        channel.set_state(channel.CLOSED)
+        channel.remove_consumer_tag()
+        channel.recover()
+
+        self.assertTrue(channel.is_open)
+        self.assertEqual([frame.name for frame in connection.requests],
+                         ['Channel.Open', 'Exchange.Declare',
+                          'Queue.Declare', 'Queue.Bind', 'Basic.Qos',
+                          'Basic.Consume'])
+        self.assertEqual(connection.requests[-1].consumer_tag, 'ctag')
+        self.assertEqual(channel.consumer_tags, ['ctag'])
+
+    def test_recover_renames_server_named_queue(self):
+        connection = RespondingConnection()
+        channel = RecoveringChannel(1, connection, 1)
+        connection.channel = channel
+        channel.open()
+        channel.queue.declare()
+        channel.queue.bind('amq.gen-1', 'ex')
+        channel.basic.consume(queue='amq.gen-1')
+
+        connection.requests = []
+        channel.recover()
+
+        self.assertEqual(connection.requests[3].queue, 'amq.gen-2')
+        self.assertEqual([key for key, _ in channel.topology],
+                         [('queue', 'amq.gen-2'),
+                          ('queue.bind', 'amq.gen-2', 'ex', ''),
+                          ('consume', 'ctag')])
+
+
+class RecordingRecoveryConnection(RecoveringConnection):
+    """Records the connection when a recovery would have started."""
+
+    def _start_recovery(self):
+        self.recovery_started_with = (list(self._exceptions),
+                                      self.io.socket)
+
+
+class RecoveringConnectionTests(unittest.TestCase):
+    def test_recovery_delay(self):
+        connection = RecoveringConnection('localhost', 'guest', 'guest',
+                                          lazy=True, min_recovery_delay=1,
+                                          max_recovery_delay=10)
+
+        for attempt, maximum in [(0, 1), (1, 2), (2, 4), (3, 8), (10, 10)]:
+            delay = connection._recovery_delay(attempt)
+            self.assertGreaterEqual(delay, maximum / 2.0)
+            self.assertLessEqual(delay, maximum)
+
+    def test_user_close_does_not_recover(self):
+        connection = RecoveringConnection('localhost', 'guest', 'guest',
+                                          lazy=True)
+        connection.set_state(connection.OPEN)
+        connection.close()
+
+        self.assertFalse(connection.is_recovering)
+        self.assertTrue(connection.is_closed)
+
+    def test_connection_lost_starts_recovery(self):
+        connection = RecoveringConnection('localhost', 'guest', 'guest',
+                                          lazy=True, min_recovery_delay=0.01,
+                                          max_recovery_attempts=1)
+        connection.set_state(connection.OPEN)
+        connection.set_state(connection.CLOSED)
+
+        self.assertFalse(connection.wait_for_recovery(timeout=5))
+        self.assertFalse(connection.is_recovering)
+        self.assertEqual(connection.recovery_attempts, 1)
+        self.assertEqual(connection.reconnects, 0)
+
+    def test_socket_error_is_recorded_before_recovery(self):
+        connection = RecordingRecoveryConnection('localhost', 'guest',
+                                                 'guest', lazy=True)
+        connection.set_state(connection.OPEN)
+        connection._handle_socket_error('connection reset')
+
+        exceptions, socket = connection.recovery_started_with
+        self.assertEqual(len(exceptions), 1)
+        self.assertEqual(str(exceptions[0]), 'connection reset')
+        self.assertIsNone(socket)
+        self.assertTrue(connection.is_closed)
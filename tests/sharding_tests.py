@@ -0,0 +1,159 @@
+__author__ = 'eandersson'
+
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import AMQPChannelError
+from amqpstorm import AMQPConnectionError
+from amqpstorm import AMQPInvalidArgument
+from amqpstorm.base import Stateful
+from amqpstorm.sharding import ShardedPublisher
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FakeBasic(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def publish(self, body, routing_key, exchange='', properties=None,
+                mandatory=False, immediate=False):
+        if self.connection.error:
+            raise self.connection.error
+        self.connection.published.append((body, routing_key))
+        return self.connection.confirm
+
+
+class FakeChannel(Stateful):
+    def __init__(self, connection):
+        super(FakeChannel, self).__init__()
+        self.basic = FakeBasic(connection)
+        self.set_state(self.OPEN)
+
+    def confirm_deliveries(self):
+        pass
+
+    def close(self):
+        self.set_state(self.CLOSED)
+
+
+class FakeShardConnection(Stateful):
+    def __init__(self, hostname, username, password, port, **kwargs):
+        super(FakeShardConnection, self).__init__()
+        self.hostname = hostname
+        self.published = []
+        self.error = None
+        self.confirm = None
+        self.set_state(self.OPEN)
+
+    def channel(self, rpc_timeout=360):
+        return FakeChannel(self)
+
+    def close(self):
+        self.set_state(self.CLOSED)
+
+
+def create_publisher(hostname='localhost', **kwargs):
+    return ShardedPublisher(hostname, 'guest', 'guest',
+                            connection_class=FakeShardConnection, **kwargs)
+
+
+class ShardedPublisherTests(unittest.TestCase):
+    def test_shards_are_spread_over_hosts(self):
+        publisher = create_publisher(['node1', 'node2'], shards=4)
+
+        self.assertEqual([shard.connection.hostname
+                          for shard in publisher.shards],
+                         ['node1', 'node2', 'node1', 'node2'])
+
+    def test_round_robin(self):
+        publisher = create_publisher(shards=3)
+        for index in range(6):
+            publisher.publish('body', 'key%d' % index)
+
+        for shard in publisher.shards:
+            self.assertEqual(len(shard.connection.published), 2)
+        self.assertEqual(publisher.stats()['published'], 6)
+
+    def test_routing_key_preserves_order(self):
+        publisher = create_publisher(shards=4, strategy='routing_key')
+        for index in range(10):
+            publisher.publish(str(index), 'orders')
+        publisher.publish('other', 'invoices')
+
+        shard = publisher.shards[publisher.shard_index('orders')]
+        self.assertEqual([body for body, _ in shard.connection.published
+                          if _ == 'orders'],
+                         [str(index) for index in range(10)])
+
+    def test_shard_index_is_stable(self):
+        publisher = create_publisher(shards=8, strategy='routing_key')
+
+        self.assertEqual(publisher.shard_index('orders'),
+                         publisher.shard_index(b'orders'))
+        self.assertEqual(publisher.shard_index('orders'), 6)
+
+    def test_round_robin_fails_over(self):
+        publisher = create_publisher(shards=2)
+        publisher.shards[0].connection.set_state(Stateful.CLOSED)
+        publisher.publish('body', 'key')
+        publisher.publish('body', 'key')
+
+        stats = publisher.stats()
+        self.assertEqual(stats['published'], 2)
+        self.assertEqual(stats['errors'], 1)
+        self.assertIsInstance(stats['shards'][0]['last_error'],
+                              AMQPConnectionError)
+
+    def test_round_robin_does_not_retry_written_messages(self):
+        publisher = create_publisher(shards=2)
+        publisher.shards[0].connection.error = AMQPChannelError('timeout')
+
+        self.assertRaises(AMQPChannelError, publisher.publish, 'body', 'key')
+        self.assertEqual(publisher.shards[1].connection.published, [])
+        self.assertEqual(publisher.stats()['errors'], 1)
+
+    def test_round_robin_raises_when_no_shard_is_open(self):
+        publisher = create_publisher(shards=2)
+        for shard in publisher.shards:
+            shard.connection.set_state(Stateful.CLOSED)
+
+        self.assertRaises(AMQPConnectionError, publisher.publish,
+                          'body', 'key')
+
+    def test_routing_key_raises_error(self):
+        publisher = create_publisher(shards=2, strategy='routing_key')
+        for shard in publisher.shards:
+            shard.connection.error = AMQPChannelError('closed')
+
+        self.assertRaises(AMQPChannelError, publisher.publish, 'body', 'key')
+
+    def test_aggregate_confirms(self):
+        publisher = create_publisher(shards=2, confirm_deliveries=True)
+        publisher.shards[0].connection.confirm = True
+        publisher.shards[1].connection.confirm = False
+        for _ in range(4):
+            publisher.publish('body', 'key')
+
+        stats = publisher.stats()
+        self.assertEqual(stats['confirmed'], 2)
+        self.assertEqual(stats['nacked'], 2)
+
+    def test_close(self):
+        with create_publisher(shards=2) as publisher:
+            pass
+
+        for shard in publisher.shards:
+            self.assertTrue(shard.connection.is_closed)
+        self.assertEqual(publisher.stats()['open_shards'], 0)
+
+    def test_invalid_parameters(self):
+        self.assertRaises(AMQPInvalidArgument, create_publisher, [])
+        self.assertRaises(AMQPInvalidArgument, create_publisher, shards=0)
+        self.assertRaises(AMQPInvalidArgument, create_publisher,
+                          strategy='random')
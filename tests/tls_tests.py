@@ -0,0 +1,275 @@
+__author__ = 'eandersson'
+
+import os
+import ssl
+import time
+import select
+import socket
+import logging
+import tempfile
+import threading
+import subprocess
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import io as amqpstorm_io
+from amqpstorm.io import IO
+from amqpstorm.tls import ContextCache
+from amqpstorm.tls import SessionCache
+from amqpstorm.tls import SESSION_CACHE
+from amqpstorm.tls import create_context
+from amqpstorm.exception import AMQPInvalidArgument
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class ContextCacheTests(unittest.TestCase):
+    def test_same_options_share_context(self):
+        cache = ContextCache()
+        first = cache.get({'cert_reqs': ssl.CERT_NONE})
+        second = cache.get({'cert_reqs': ssl.CERT_NONE})
+
+        self.assertIs(first, second)
+        self.assertEqual(len(cache), 1)
+
+    def test_different_options_get_new_context(self):
+        cache = ContextCache()
+        first = cache.get({})
+        second = cache.get({'cert_reqs': ssl.CERT_OPTIONAL})
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.verify_mode, ssl.CERT_OPTIONAL)
+        self.assertFalse(first.check_hostname)
+
+    def test_context_option_is_used_as_is(self):
+        context = ssl.create_default_context()
+
+        self.assertIs(ContextCache().get({'context': context}), context)
+
+
+class CreateContextTests(unittest.TestCase):
+    @unittest.skipIf(not hasattr(ssl.SSLContext, 'get_ciphers'),
+                     'SSLContext.get_ciphers requires Python 3.6+')
+    def test_ciphers(self):
+        context = create_context({'ciphers': 'AES256-SHA'})
+        ciphers = [cipher['name'] for cipher in context.get_ciphers()
+                   if cipher['protocol'] != 'TLSv1.3']
+
+        self.assertEqual(ciphers, ['AES256-SHA'])
+
+    def test_unsupported_option(self):
+        self.assertRaises(AMQPInvalidArgument, create_context,
+                          {'server_side': True})
+
+
+class SessionCacheTests(unittest.TestCase):
+    def test_store_and_get(self):
+        cache = SessionCache()
+        context = object()
+
+        class FakeSocket(object):
+            session = 'session'
+
+        cache.store(context, 'localhost', 5671, FakeSocket())
+        self.assertEqual(cache.get(context, 'localhost', 5671), 'session')
+        self.assertIsNone(cache.get(object(), 'localhost', 5671))
+
+    def test_max_size(self):
+        cache = SessionCache(max_size=2)
+
+        class FakeSocket(object):
+            session = 'session'
+
+        for port in range(3):
+            cache.store(None, 'localhost', port, FakeSocket())
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(None, 'localhost', 0))
+
+    def test_handshake_statistics(self):
+        cache = SessionCache()
+        cache.record_handshake(0.4, False)
+        cache.record_handshake(0.2, True)
+
+        self.assertEqual(cache.handshakes, 2)
+        self.assertEqual(cache.resumed, 1)
+        self.assertAlmostEqual(cache.average_handshake_time, 0.3)
+
+
+def server_context():
+    """Create a server SSLContext using a throwaway certificate."""
+    directory = tempfile.mkdtemp()
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(['openssl', 'req', '-x509', '-newkey',
+                                   'rsa:2048', '-nodes', '-days', '1',
+                                   '-subj', '/CN=localhost',
+                                   '-keyout', keyfile, '-out', certfile],
+                                  stdout=devnull, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        raise unittest.SkipTest('openssl is required')
+    context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_SERVER',
+                                     ssl.PROTOCOL_SSLv23))
+    context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def tcp_socketpair():
+    """Connected pair of TCP sockets, as socket.socketpair on Python 2
+    returns sockets that the ssl module cannot wrap."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+    finally:
+        listener.close()
+    return client, server
+
+
+@unittest.skipIf(not amqpstorm_io.SSL_SESSIONS,
+                 'TLS session resumption requires Python 3.6+')
+class SessionResumptionTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.context = server_context()
+
+    def setUp(self):
+        context = self.context
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        thread = threading.Thread(target=self._serve, args=(context,))
+        thread.daemon = True
+        thread.start()
+        SESSION_CACHE.clear()
+
+    def tearDown(self):
+        self.server.close()
+        SESSION_CACHE.clear()
+
+    def _serve(self, context):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except (OSError, socket.error):
+                return
+            try:
+                context.wrap_socket(client, server_side=True).recv(1)
+            except (OSError, socket.error):
+                pass
+            finally:
+                client.close()
+
+    def _connect(self):
+        io = IO({'ssl': True, 'timeout': 5, 'ssl_options': {}})
+        io._create_inbound_thread = lambda: None
+        io.open('127.0.0.1', self.port)
+        io.close()
+        return io
+
+    def test_reconnect_resumes_session(self):
+        first = self._connect()
+        second = self._connect()
+
+        self.assertFalse(first.session_reused)
+        self.assertTrue(second.session_reused)
+        self.assertGreater(first.handshake_time, 0.0)
+        self.assertEqual(SESSION_CACHE.handshakes, 2)
+        self.assertEqual(SESSION_CACHE.resumed, 1)
+
+
+class LegacyContext(object):
+    """SSLContext without session support, as on Python 2.7 and 3.3-3.5."""
+
+    def __init__(self):
+        self.wrapped = []
+
+    def wrap_socket(self, sock, do_handshake_on_connect=True,
+                    server_hostname=None):
+        self.wrapped.append(sock)
+        return sock
+
+
+class LegacySessionTests(unittest.TestCase):
+    def setUp(self):
+        self.ssl_sessions = amqpstorm_io.SSL_SESSIONS
+        amqpstorm_io.SSL_SESSIONS = False
+
+    def tearDown(self):
+        amqpstorm_io.SSL_SESSIONS = self.ssl_sessions
+        SESSION_CACHE.clear()
+
+    def test_wrap_without_sessions(self):
+        context = LegacyContext()
+        client, server = socket.socketpair()
+        try:
+            io = IO({'ssl': True, 'ssl_options': {'context': context}})
+            sock = io._ssl_wrap_socket(client, '127.0.0.1', 5671)
+        finally:
+            client.close()
+            server.close()
+
+        self.assertIs(sock, client)
+        self.assertEqual(context.wrapped, [client])
+        self.assertFalse(io.session_reused)
+        self.assertEqual(SESSION_CACHE.handshakes, 1)
+
+
+class TLSReceiveTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.context = server_context()
+
+    def setUp(self):
+        client, server = tcp_socketpair()
+        handshake = threading.Thread(target=self._accept, args=(server,))
+        handshake.start()
+        self.client = ContextCache().get({}).wrap_socket(client)
+        handshake.join()
+        self.client.setblocking(0)
+        self.frames_in = []
+        self.errors = []
+        self.io = IO({}, on_read=self._on_read,
+                     on_error=self.errors.append)
+        self.io.socket = self.client
+        self.io.set_state(IO.OPEN)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def _accept(self, server):
+        self.server = self.context.wrap_socket(server, server_side=True)
+
+    def _on_read(self, buffer):
+        self.frames_in.append(buffer)
+        return b''
+
+    def test_incomplete_record_is_not_an_error(self):
+        self.assertIsNone(self.io._receive())
+        self.io.process_readable()
+
+        self.assertFalse(self.errors)
+        self.assertFalse(self.frames_in)
+
+    def test_buffered_data_is_drained_in_one_wakeup(self):
+        payload = b'a' * 65536
+        self.server.sendall(payload)
+        select.select([self.client], [], [], 1)
+        time.sleep(0.05)
+        self.io.receive_size = 4096
+        self.io.process_readable()
+
+        self.assertEqual(sum(len(buffer) for buffer in self.frames_in),
+                         len(payload))
+        self.assertEqual(self.io.wakeups, 1)
+        self.assertEqual(self.io.pending(), 0)
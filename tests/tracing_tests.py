@@ -0,0 +1,229 @@
+__author__ = 'eandersson'
+
+import logging
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import Connection
+from amqpstorm import AMQPChannelError
+from amqpstorm import AMQPConnectionError
+from amqpstorm.cache import PROPERTIES_CACHE
+from amqpstorm.channel import Channel
+from amqpstorm.tracing import Hook
+from amqpstorm.tracing import Hooks
+from amqpstorm.fake_broker import FakeBroker
+
+from tests.utility import FakeConnection
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class RecordingHook(Hook):
+    def __init__(self):
+        self.calls = []
+
+    def before_publish(self, channel, body, routing_key, exchange,
+                       properties):
+        self.calls.append('before_publish')
+        properties['headers']['trace_id'] = 'abc'
+        return 'publish'
+
+    def after_publish(self, channel, context, result, error):
+        self.calls.append(('after_publish', context, result))
+        if error is not None:
+            self.calls.append(('publish_error', error))
+
+    def on_message(self, channel, message):
+        self.calls.append(('on_message', message.properties['headers']))
+
+    def before_callback(self, channel, message):
+        self.calls.append('before_callback')
+        return 'callback'
+
+    def after_callback(self, channel, context, message, error):
+        self.calls.append(('after_callback', context, error))
+
+    def before_rpc(self, channel, uuid):
+        self.calls.append('before_rpc')
+        return 'rpc'
+
+    def after_rpc(self, channel, context, response, error):
+        if error is not None:
+            self.calls.append(('rpc_error', context, error))
+            return
+        self.calls.append(('after_rpc', context, response.name))
+
+
+class BrokenHook(Hook):
+    def before_publish(self, channel, body, routing_key, exchange,
+                       properties):
+        raise ValueError('broken')
+
+
+class HooksTests(unittest.TestCase):
+    def test_add_and_remove(self):
+        hooks = Hooks()
+        hook = Hook()
+        self.assertFalse(hooks.active)
+
+        hooks.add(hook)
+        hooks.add(hook)
+        self.assertTrue(hooks.active)
+        self.assertEqual(hooks._hooks, (hook,))
+
+        hooks.remove(hook)
+        self.assertFalse(hooks.active)
+        self.assertEqual(hooks._hooks, ())
+
+    def test_failing_hook_is_logged(self):
+        hooks = Hooks()
+        hook = RecordingHook()
+        hooks.add(BrokenHook())
+        hooks.add(hook)
+        properties = {'headers': {}}
+
+        traces = hooks.before_publish(None, b'', '', '', properties)
+
+        self.assertEqual(traces[0][1], None)
+        self.assertEqual(traces[1][1], 'publish')
+        self.assertEqual(properties['headers'], {'trace_id': 'abc'})
+
+
+class ChannelTracingTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.channel = Channel(1, self.connection, 360)
+        self.channel.set_state(Channel.OPEN)
+        self.hook = RecordingHook()
+        self.channel.hooks.add(self.hook)
+
+    def test_properties_are_copied(self):
+        properties = {'headers': {'key': 'value'}}
+        self.channel.basic.publish(b'hello', 'routing_key',
+                                   properties=properties)
+
+        self.assertEqual(properties, {'headers': {'key': 'value'}})
+        self.assertEqual(self.hook.calls,
+                         ['before_publish', ('after_publish', 'publish',
+                                             None)])
+
+    def test_traced_publish_bypasses_the_cache(self):
+        PROPERTIES_CACHE.clear()
+        self.channel.basic.publish(b'hello', 'routing_key',
+                                   properties={'app_id': 'test'})
+
+        self.assertEqual(len(PROPERTIES_CACHE), 0)
+        self.assertEqual(PROPERTIES_CACHE.hits + PROPERTIES_CACHE.misses, 0)
+        header = self.connection.frames_out[-1][1][1]
+        self.assertEqual(dict(header.properties)['headers'],
+                         {'trace_id': 'abc'})
+
+    def test_publisher_uses_hooks(self):
+        publisher = self.channel.basic.publisher('', 'routing_key')
+        publisher.publish(b'hello')
+
+        self.assertEqual(self.hook.calls[0], 'before_publish')
+        self.assertEqual(self.channel.stats()['publishes'], 1)
+
+    def test_failing_hook_does_not_interrupt_publish(self):
+        self.channel.hooks.add(BrokenHook())
+        self.channel.basic.publish(b'hello', 'routing_key')
+
+        self.assertEqual(self.channel.stats()['publishes'], 1)
+
+    def test_failed_publish_calls_after_publish(self):
+        error = AMQPConnectionError('connection/socket error')
+
+        def write_frames(channel_id, frames_out):
+            raise error
+
+        self.connection.write_frames = write_frames
+        self.assertRaises(AMQPConnectionError, self.channel.basic.publish,
+                          b'hello', 'routing_key')
+
+        self.assertEqual(self.hook.calls,
+                         ['before_publish',
+                          ('after_publish', 'publish', None),
+                          ('publish_error', error)])
+
+    def test_rpc_timeout_calls_after_rpc(self):
+        channel = Channel(2, self.connection, 0.01)
+        channel.set_state(Channel.OPEN)
+        channel.hooks.add(self.hook)
+
+        self.assertRaises(AMQPChannelError, channel.queue.declare, 'test')
+
+        self.assertEqual(self.hook.calls[0], 'before_rpc')
+        self.assertEqual(self.hook.calls[1][:2], ('rpc_error', 'rpc'))
+        self.assertIsInstance(self.hook.calls[1][2], AMQPChannelError)
+
+    def test_no_hooks(self):
+        self.channel.hooks.remove(self.hook)
+        self.channel.basic.publish(b'hello', 'routing_key')
+
+        self.assertEqual(self.hook.calls, [])
+
+
+class ConnectionTracingTests(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.connection = Connection('localhost', 'guest', 'guest',
+                                     transport=self.broker.transport())
+        self.hook = RecordingHook()
+
+    def tearDown(self):
+        self.connection.close()
+        self.broker.stop()
+
+    def test_channels_share_hooks(self):
+        channel = self.connection.channel()
+        self.connection.hooks.add(self.hook)
+
+        self.assertIs(channel.hooks, self.connection.hooks)
+        self.assertIs(channel.rpc._hooks, self.connection.hooks)
+
+    def test_trace_context_is_propagated(self):
+        channel = self.connection.channel()
+        channel.queue.declare('test')
+        self.connection.hooks.add(self.hook)
+        channel.basic.publish(b'hello', 'test')
+
+        def on_message(message):
+            channel.stop_consuming()
+
+        channel.basic.consume(on_message, 'test', no_ack=True)
+        channel.start_consuming(to_tuple=False)
+
+        self.assertIn(('on_message', {'trace_id': 'abc'}), self.hook.calls)
+        self.assertIn(('after_callback', 'callback', None), self.hook.calls)
+        self.assertIn(('after_rpc', 'rpc', 'Basic.ConsumeOk'),
+                      self.hook.calls)
+
+    def test_callback_error(self):
+        channel = self.connection.channel()
+        channel.queue.declare('test')
+        channel.basic.publish(b'hello', 'test')
+        self.connection.hooks.add(self.hook)
+        error = ValueError('callback failed')
+
+        def on_message(message):
+            raise error
+
+        channel.basic.consume(on_message, 'test', no_ack=True)
+        self.assertRaises(ValueError, channel.start_consuming,
+                          to_tuple=False)
+        self.assertIn(('after_callback', 'callback', error), self.hook.calls)
+
+    def test_confirm(self):
+        channel = self.connection.channel()
+        channel.confirm_deliveries()
+        channel.queue.declare('test')
+        self.connection.hooks.add(self.hook)
+
+        self.assertTrue(channel.basic.publish(b'hello', 'test'))
+        self.assertIn(('after_publish', 'publish', True), self.hook.calls)
+        self.assertIn(('after_rpc', 'rpc', 'Basic.Ack'), self.hook.calls)
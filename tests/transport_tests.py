@@ -0,0 +1,114 @@
+__author__ = 'eandersson'
+
+import os
+import socket
+import logging
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from amqpstorm import UriConnection
+from amqpstorm import AMQPConnectionError
+from amqpstorm import AMQPInvalidArgument
+from amqpstorm.io import IO
+from amqpstorm.io import UnixTransport
+from amqpstorm.io import SocketPairTransport
+from amqpstorm.connection import Connection
+
+from tests.io_tests import wait_for
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+def create_io(transport, on_read=None, ssl=False):
+    return IO({'ssl': ssl, 'ssl_options': {}, 'timeout': 1,
+               'transport': transport}, on_read=on_read)
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'requires AF_UNIX')
+class UnixTransportTests(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'amqp.sock')
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(1)
+
+    def tearDown(self):
+        self.server.close()
+        os.unlink(self.path)
+
+    def test_open(self):
+        received = []
+
+        def on_read(buffer):
+            received.append(buffer)
+            return b''
+
+        io = create_io(UnixTransport(self.path), on_read=on_read)
+        io.open('localhost', 5672)
+        try:
+            client, _ = self.server.accept()
+            io.write_to_socket(b'ping')
+            self.assertEqual(client.recv(4), b'ping')
+            client.sendall(b'pong')
+            self.assertTrue(wait_for(lambda: received))
+            self.assertEqual(received, [b'pong'])
+            self.assertEqual(io.address, (self.path, 0))
+            client.close()
+        finally:
+            io.close()
+
+    def test_missing_socket(self):
+        io = create_io(UnixTransport(self.path + '.missing'))
+
+        self.assertRaises(AMQPConnectionError, io.open, 'localhost', 5672)
+
+    def test_ssl_is_not_supported(self):
+        io = create_io(UnixTransport(self.path), ssl=True)
+
+        self.assertRaises(AMQPConnectionError, io.open, 'localhost', 5672)
+        self.assertIsNone(io.socket)
+
+    def test_uri(self):
+        connection = UriConnection('amqp+unix://user:pass@/tmp/amqp%20.sock'
+                                   '?virtual_host=test&heartbeat=30',
+                                   lazy=True)
+        transport = connection.parameters['transport']
+
+        self.assertIsInstance(transport, UnixTransport)
+        self.assertEqual(transport.path, '/tmp/amqp .sock')
+        self.assertEqual(connection.parameters['virtual_host'], 'test')
+        self.assertEqual(connection.parameters['username'], 'user')
+        self.assertEqual(connection.parameters['heartbeat'], 30)
+
+
+class SocketPairTransportTests(unittest.TestCase):
+    def test_peer_is_passed_to_on_connect(self):
+        peers = []
+        received = []
+
+        def on_read(buffer):
+            received.append(buffer)
+            return b''
+
+        transport = SocketPairTransport(on_connect=peers.append)
+        io = create_io(transport, on_read=on_read)
+        io.open('localhost', 5672)
+        try:
+            self.assertEqual(peers, [transport.peer])
+            io.write_to_socket(b'ping')
+            self.assertEqual(transport.peer.recv(4), b'ping')
+            transport.peer.sendall(b'pong')
+            self.assertTrue(wait_for(lambda: received))
+            self.assertEqual(received, [b'pong'])
+        finally:
+            io.close()
+            transport.peer.close()
+
+    def test_invalid_transport(self):
+        self.assertRaises(AMQPInvalidArgument, Connection, 'localhost',
+                          'guest', 'guest', transport='unix', lazy=True)